@@ -0,0 +1,113 @@
+"""Локальна заміна api.telegram.org для навантажувальних і chaos-тестів.
+
+Бот спрямовується сюди змінною BOT_API_BASE_URL і проходить увесь справжній шлях: HTTP, шар запитів PTB,
+повтори й обмежувач частоти (BOT_RATE_LIMITER=1). Сервер імітує затримку, ліміти Telegram
+(≈1 повідомлення/с на чат, 30/с загалом) з відповідями 429 retry_after, а також 403 для «заблокованих» чатів.
+
+    python bench/fake_bot_api.py --port 8081 --latency-ms 50 --p429 0.01 --p403 0.02
+    BOT_API_BASE_URL=http://127.0.0.1:8081 python bot.py
+
+GET /stats повертає лічильники за методами й кодами відповіді.
+"""
+import time, random, asyncio, argparse
+from collections import defaultdict, deque
+
+from aiohttp import web
+
+from telegram_stub import FakeTelegram
+
+SEND_METHODS = ("send", "edit", "copy", "forward")
+
+
+class ChaosPolicy:
+    """Вирішує, чи відповісти на виклик помилкою, як це зробив би Telegram."""
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.blocked: set[int] = set()
+        self.per_chat: dict[int, deque] = defaultdict(deque)
+        self.global_sends: deque = deque()
+
+    def latency(self) -> float:
+        return self.rng.expovariate(1000 / self.args.latency_ms) if self.args.latency_ms else 0.0
+
+    def error(self, name: str, params: dict) -> tuple[int, str, dict | None] | None:
+        if not name.startswith(SEND_METHODS):
+            return None
+        chat_id = int(params.get("chat_id", 0))
+        if chat_id in self.blocked or self.rng.random() < self.args.p403:
+            self.blocked.add(chat_id)   # заблокований користувач лишається заблокованим
+            return 403, "Forbidden: bot was blocked by the user", None
+        if self.rng.random() < self.args.p429 or self.over_limit(chat_id):
+            retry_after = self.args.retry_after
+            return 429, f"Too Many Requests: retry after {retry_after}", {"retry_after": retry_after}
+        return None
+
+    def over_limit(self, chat_id: int) -> bool:
+        if not self.args.enforce_limits:
+            return False
+        now = time.monotonic()
+        window = self.per_chat[chat_id]
+        for sends, period, limit in ((window, 1.0, self.args.chat_rate), (self.global_sends, 1.0, self.args.global_rate)):
+            while sends and now - sends[0] > period:
+                sends.popleft()
+            if len(sends) >= limit:
+                return True
+        window.append(now)
+        self.global_sends.append(now)
+        return False
+
+
+async def read_params(request: web.Request) -> dict:
+    # PTB надсилає form-urlencoded або multipart; складні поля (reply_markup, media) — JSON-рядками
+    if request.content_type == "application/json":
+        return await request.json()
+    form = await request.post()
+    return {k: v for k, v in form.items() if isinstance(v, str)}
+
+
+def build_app(args) -> web.Application:
+    telegram = FakeTelegram()
+    chaos = ChaosPolicy(args)
+    stats: dict[str, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    async def method(request: web.Request) -> web.Response:
+        name = request.match_info["method"]
+        params = await read_params(request) if request.body_exists else {}
+        await asyncio.sleep(chaos.latency())
+        error = chaos.error(name, params)
+        if error:
+            code, description, parameters = error
+            stats[name][code] += 1
+            body = {"ok": False, "error_code": code, "description": description}
+            if parameters:
+                body["parameters"] = parameters
+            return web.json_response(body, status=code)
+        stats[name][200] += 1
+        return web.json_response({"ok": True, "result": telegram.result(name, params)})
+
+    async def stats_view(request: web.Request) -> web.Response:
+        return web.json_response({name: dict(codes) for name, codes in stats.items()})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", method)
+    app.router.add_get("/bot{token}/{method}", method)
+    app.router.add_get("/stats", stats_view)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=30, help="середня затримка відповіді")
+    parser.add_argument("--p429", type=float, default=0.0, help="ймовірність випадкового 429")
+    parser.add_argument("--p403", type=float, default=0.0, help="ймовірність, що чат «заблокував» бота")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after у відповіді 429, с")
+    parser.add_argument("--enforce-limits", action="store_true", help="відповідати 429 понад ліміти Telegram")
+    parser.add_argument("--chat-rate", type=int, default=1, help="повідомлень/с на чат")
+    parser.add_argument("--global-rate", type=int, default=30, help="повідомлень/с загалом")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    web.run_app(build_app(args), host=args.host, port=args.port)
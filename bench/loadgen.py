@@ -0,0 +1,303 @@
+"""Синтетичне навантаження на бота: ті самі обробники, що й у __main__, заглушка Bot API, локальний Postgres.
+
+Кожен віртуальний користувач проходить шлях
+  /start → категорія → всі оголошення → картка → відгук на оголошення → автор приймає → оцінка → пропустити коментар,
+натискаючи кнопки, які бот справді надіслав у його чат. У кінці — updates/s і p50/p95/p99 для кожного маршруту.
+
+    python bench/loadgen.py --users 2000 --concurrency 100 --api-latency-ms 40
+
+Увага: пише в базу з DB_* (.env). Користувачі створюються в окремому діапазоні id і видаляються після прогону,
+якщо не вказано --keep.
+"""
+import os, sys, json, time, random, asyncio, argparse, itertools, logging
+from collections import defaultdict
+from contextvars import ContextVar
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+
+import bot
+from telegram_stub import FakeTelegram
+from telegram import Update, User
+from telegram.ext import ConversationHandler
+from telegram.request import BaseRequest
+
+OWNER_BASE = 9_000_000_000      # id синтетичних авторів оголошень
+BUYER_BASE = 9_100_000_000      # id синтетичних клієнтів
+STEP_TIMEOUT = 10
+
+# клавіатури, надіслані під час поточного кроку: (chat_id, [callback_data])
+_outbox: ContextVar[list | None] = ContextVar("outbox", default=None)
+
+
+class StubBotRequest(BaseRequest):
+    """Bot API без мережі: відповідає правдоподібними об'єктами, імітує затримку й пам'ятає кнопки кожного чату."""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.calls: dict[str, int] = defaultdict(int)
+        self.telegram = FakeTelegram()
+        self.buttons = self.telegram.buttons
+        self.last_message = self.telegram.last_message
+
+    @property
+    def read_timeout(self):
+        return 5
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        name = url.rsplit("/", 1)[-1]
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(random.expovariate(1 / self.latency))
+        params = request_data.parameters if request_data else {}
+        return 200, json.dumps({"ok": True, "result": self.result(name, params)}).encode()
+
+    def result(self, name: str, params: dict):
+        result = self.telegram.result(name, params)
+        outbox = _outbox.get()
+        if outbox is not None and "reply_markup" in params and isinstance(result, dict):
+            outbox.append((int(params["chat_id"]), self.buttons.get(int(params["chat_id"]), [])))
+        return result
+
+
+class Driver:
+    """Подає update в Application і чекає, поки обробник (зокрема з block=False) завершиться."""
+
+    def __init__(self, app, api: StubBotRequest):
+        self.app = app
+        self.api = api
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.failures: dict[str, int] = defaultdict(int)
+        self.errors: dict[str, int] = defaultdict(int)
+        self._waiters: dict[int, asyncio.Future] = {}
+        self._update_ids = itertools.count(1)
+        self.record_routes(app.handlers[0])
+
+    def record_routes(self, handlers):
+        for handler in handlers:
+            if isinstance(handler, ConversationHandler):
+                self.record_routes(handler.entry_points)
+                for state_handlers in handler.states.values():
+                    self.record_routes(state_handlers)
+                self.record_routes(handler.fallbacks)
+            else:
+                handler.callback = self.recorded(handler.callback)
+
+    def recorded(self, callback):
+        route = callback.__name__.removesuffix("_handler")
+
+        async def wrapper(update, ctx):
+            waiter = self._waiters.pop(update.update_id, None)
+            start = time.perf_counter()
+            try:
+                return await callback(update, ctx)
+            except Exception:
+                self.errors[route] += 1
+                raise
+            finally:
+                self.latencies[route].append(time.perf_counter() - start)
+                if waiter and not waiter.done():
+                    waiter.set_result(route)
+        return wrapper
+
+    async def send(self, raw: dict, step: str, timeout: float = STEP_TIMEOUT) -> list | None:
+        """Повертає клавіатури, які бот надіслав у відповідь, або None, якщо обробник не завершився."""
+        raw["update_id"] = next(self._update_ids)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[raw["update_id"]] = waiter
+        outbox = []
+        token = _outbox.set(outbox)
+        try:
+            await self.app.process_update(Update.de_json(raw, self.app.bot))
+        finally:
+            _outbox.reset(token)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            return outbox
+        except asyncio.TimeoutError:
+            self._waiters.pop(raw["update_id"], None)
+            self.failures[step] += 1
+            return None
+
+    async def command(self, user_id: int, text: str) -> list | None:
+        return await self.send({"message": {
+            "message_id": next(self._update_ids), "date": int(time.time()), "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+        }}, text)
+
+    async def tap(self, user_id: int, prefix: str, buttons: list | None = None) -> list | None:
+        """Натискає випадкову кнопку з префіксом prefix (типово — з останньої клавіатури чату)."""
+        if buttons is None:
+            buttons = self.api.buttons.get(user_id, ())
+        choices = [d for d in buttons if d.startswith(prefix)]
+        if not choices:
+            self.failures[f"no button {prefix}"] += 1
+            return None
+        data = random.choice(choices)
+        return await self.send({"callback_query": {
+            "id": str(next(self._update_ids)), "chat_instance": "bench", "data": data,
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+            "message": {
+                "message_id": self.api.last_message.get(user_id, 1), "date": int(time.time()), "text": "…",
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "Bench"},
+            },
+        }}, prefix)
+
+
+def seed_owners(owners: int, ads_per_owner: int):
+    categories = list(bot.CATEGORY_LABELS)
+    cities = list(bot.CITY_ALIASES)
+    for i in range(owners):
+        user_id = OWNER_BASE + i
+        bot.save_user(User(id=user_id, first_name=f"Owner {i}", is_bot=False))
+        for _ in range(ads_per_owner):
+            bot.save_ad({
+                "category": random.choice(categories),
+                "city": random.choice(cities),
+                "price": f"{random.randint(5, 200) * 100} грн",
+                "desc": "Синтетичне оголошення для навантажувального тесту",
+            }, user_id)
+
+
+def cleanup(owners: int, users: int):
+    # відгуки й оголошення — через репозиторій, щоб агрегати (рейтинги, city_stats, пари) лишились узгодженими
+    ranges = (OWNER_BASE, OWNER_BASE + owners - 1, BUYER_BASE, BUYER_BASE + users - 1)
+    in_range = "(({0} BETWEEN %s AND %s) OR ({0} BETWEEN %s AND %s))"
+    conn = bot.db_connect(**bot.DB_PARAMS)
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(f"SELECT id FROM reviews WHERE {in_range.format('author_id')}", ranges)
+            review_ids = [r[0] for r in cur.fetchall()]
+            cur.execute(f"SELECT id FROM ads WHERE {in_range.format('user_id')}", ranges)
+            ad_ids = [r[0] for r in cur.fetchall()]
+        for review_id in review_ids:
+            bot.delete_review(review_id)
+        for ad_id in ad_ids:
+            bot.delete_ad(ad_id)
+        with conn, conn.cursor() as cur:
+            cur.execute(f"DELETE FROM applications WHERE {in_range.format('requester_id')}", ranges)
+            cur.execute(
+                f"DELETE FROM pair_interactions WHERE {in_range.format('user_a')} OR {in_range.format('user_b')}",
+                ranges * 2
+            )
+            for table, column in (("user_ratings", "user_id"), ("user_subscriptions", "subscriber_id"),
+                                  ("category_subscriptions", "subscriber_id"), ("users", "id")):
+                cur.execute(f"DELETE FROM {table} WHERE {in_range.format(column)}", ranges)
+    finally:
+        conn.close()
+    bot.invalidate_read_caches()
+
+
+async def journey(driver: Driver, user_id: int, category: str):
+    # кожен крок чекає на відповідь бота, як живий користувач
+    if await driver.command(user_id, "/start") is None:
+        return
+    driver.api.buttons[user_id] = [f"view_ads_{category}"]
+    if await driver.tap(user_id, "view_ads_") is None:
+        return
+    if await driver.tap(user_id, "menu_all_ads_") is None:
+        return
+    if await driver.tap(user_id, "show_ad_") is None:
+        return
+    card = list(driver.api.buttons.get(user_id, ()))
+    sent = await driver.tap(user_id, "apply_")
+    if sent is None:
+        return
+    review = next((d for d in card if d.startswith("review_ad_")), None)
+    if review is None:
+        return
+    # автор натискає «Прийняти» саме в сповіщенні про цю заявку
+    owner_id = int(review.rsplit("_", 1)[1])
+    notice = next((buttons for chat_id, buttons in sent if chat_id == owner_id), [])
+    if await driver.tap(owner_id, "accept_", notice) is None:
+        return
+    if await driver.tap(user_id, "review_ad_", [review]) is None:
+        return
+    if await driver.tap(user_id, str(random.randint(1, 5))) is not None:
+        await driver.tap(user_id, "skip")
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def report(driver: Driver, elapsed: float, as_json: bool):
+    total = sum(len(v) for v in driver.latencies.values())
+    routes = {
+        route: {
+            "count": len(v),
+            "p50_ms": percentile(v, 0.50) * 1000,
+            "p95_ms": percentile(v, 0.95) * 1000,
+            "p99_ms": percentile(v, 0.99) * 1000,
+        }
+        for route, v in sorted(driver.latencies.items())
+    }
+    result = {
+        "updates": total, "seconds": elapsed, "updates_per_s": total / elapsed,
+        "routes": routes, "failures": dict(driver.failures), "errors": dict(driver.errors),
+        "api_calls": dict(driver.api.calls),
+    }
+    if as_json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    print(f"\n{total} updates за {elapsed:.1f} с → {total / elapsed:.0f} updates/s\n")
+    print(f"{'маршрут':<28}{'к-сть':>8}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}")
+    for route, r in routes.items():
+        print(f"{route:<28}{r['count']:>8}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}")
+    if driver.failures:
+        print(f"\nНевдалі кроки: {dict(driver.failures)}")
+    if driver.errors:
+        print(f"Винятки в обробниках: {dict(driver.errors)}")
+
+
+async def main(args):
+    random.seed(args.seed)
+    bot.init_db()
+    api = StubBotRequest(args.api_latency_ms)
+    app = bot.build_application(request=api)
+    driver = Driver(app, api)
+
+    await app.initialize()
+    try:
+        seed_owners(args.owners, args.ads_per_owner)
+        categories = list(bot.CATEGORY_LABELS)
+        limit = asyncio.Semaphore(args.concurrency)
+
+        async def run(i):
+            async with limit:
+                await journey(driver, BUYER_BASE + i, random.choice(categories))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run(i) for i in range(args.users)))
+        elapsed = time.perf_counter() - start
+        report(driver, elapsed, args.json)
+    finally:
+        await app.shutdown()
+        if not args.keep:
+            cleanup(args.owners, args.users)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=1000, help="кількість віртуальних клієнтів")
+    parser.add_argument("--concurrency", type=int, default=50, help="одночасно активних клієнтів")
+    parser.add_argument("--owners", type=int, default=50, help="авторів оголошень")
+    parser.add_argument("--ads-per-owner", type=int, default=3)
+    parser.add_argument("--api-latency-ms", type=float, default=30, help="середня затримка Bot API")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="звіт у JSON")
+    parser.add_argument("--keep", action="store_true", help="не видаляти синтетичні дані")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(main(args))
@@ -0,0 +1,304 @@
+"""Мікробенчмарки репозиторних функцій і чистих помічників бота з порогом регресії.
+
+Кожна функція з @repository і кожен помічник (paginate_keyboard, parse_list_callback, ad_caption,
+encode/decode_deep_link…) викликається --repeat разів на засіяних даних (bench/seed.py). Результат —
+p50/p95/p99 у JSON (--out). З --baseline p95 порівнюється зі збереженим прогоном, і скрипт
+завершується з кодом 1, якщо хоч одна функція повільніша за поріг.
+
+    python bench/seed.py --ads 100000
+    python bench/micro.py --out baseline.json
+    python bench/micro.py --baseline baseline.json --threshold 0.25
+
+Запис-функції проходять повний цикл (користувач → оголошення → заявка → відгук → видалення) на окремому
+діапазоні id, який прибирається після прогону. Нова @repository-функція без кейсу тут — помилка (код 2).
+"""
+import os, sys, json, time, argparse, logging, platform
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+
+import bot
+from seed import SEED_USER_BASE, SEED_USER_SPAN
+from telegram import User
+from psycopg2.extras import RealDictCursor
+
+MICRO_USER_BASE = 9_200_000_000   # вище за діапазони seed.py і loadgen.py
+PURE_FACTOR = 50                  # чисті помічники дешеві: більше викликів на стабільний p95
+SEED_RANGE = (SEED_USER_BASE, SEED_USER_BASE + SEED_USER_SPAN - 1)
+MICRO_RANGE = (MICRO_USER_BASE, MICRO_USER_BASE + SEED_USER_SPAN - 1)
+
+
+class Fixture:
+    """Зразкові id із засіяних даних і стан запис-циклу."""
+
+    def __init__(self):
+        conn = bot.db_connect(**bot.DB_PARAMS, cursor_factory=RealDictCursor)
+        try:
+            with conn, conn.cursor() as cur:
+                # найактивніший засіяний автор — «гарячий» край Zipf-розподілу
+                cur.execute("""
+                    SELECT user_id, COUNT(*) AS n FROM ads
+                     WHERE user_id BETWEEN %s AND %s
+                     GROUP BY user_id ORDER BY n DESC LIMIT 1
+                """, SEED_RANGE)
+                row = cur.fetchone()
+                if not row:
+                    sys.exit("Немає засіяних даних: спершу python bench/seed.py")
+                self.hot_author = row['user_id']
+                cur.execute("""
+                    SELECT a.id, a.user_id, a.category, a.city_id, a.city, p.id AS app_id, p.requester_id
+                      FROM ads a JOIN applications p ON p.ad_id = a.id AND p.status = 'accepted'
+                     WHERE a.user_id BETWEEN %s AND %s
+                     ORDER BY a.id LIMIT 1
+                """, SEED_RANGE)
+                ad = cur.fetchone()
+                cur.execute("SELECT id FROM reviews WHERE author_id BETWEEN %s AND %s ORDER BY id LIMIT 1", SEED_RANGE)
+                review = cur.fetchone()
+        finally:
+            conn.close()
+        if not ad or not review:
+            sys.exit("Засіяних заявок чи відгуків замало: збільшіть --ads у bench/seed.py")
+
+        self.ad_id, self.author, self.category = ad['id'], ad['user_id'], ad['category']
+        self.city_id, self.city = ad['city_id'], ad['city']
+        self.app_id, self.requester = ad['app_id'], ad['requester_id']
+        self.review_id = review['id']
+        self.tsquery = bot.build_search_query("поліграф терміново")
+        self.listing = bot.fetch_ads(self.category, limit=100)
+        # найгірший випадок для екранування: опис повний службових символів MarkdownV2
+        card = bot.fetch_ad_for_viewer(self.ad_id, self.requester)
+        self.card = dict(card, desc=(card['desc'] + " — 1.500-2.000 грн (торг!) *терміново* [офіс]\n") * 8)
+        self.deep_link = bot.encode_deep_link(self.ad_id, "all_ads", 3, self.category)
+        self.markup = bot.paginate_keyboard(self.listing, 3, bot.PAGE_SIZE, bot.NAV_SIZE,
+                                            lambda a: a['city'], lambda a: f"show_ad_{a['id']}", "all_ads_general")
+
+        self.micro_ads: list[int] = []
+        self.micro_apps: list[int] = []
+        self.micro_reviews: list[int] = []
+
+    def new_ad(self, i: int, note: str = "") -> dict:
+        return {"city": self.city, "price": "1500 грн", "category": self.category,
+                "desc": f"Мікробенчмарк {i} {note}".strip()}
+
+    def collect(self, table: str, column: str) -> list[int]:
+        conn = bot.db_connect(**bot.DB_PARAMS)
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute(f"SELECT id FROM {table} WHERE {column} BETWEEN %s AND %s ORDER BY {column}", MICRO_RANGE)
+                return [r[0] for r in cur.fetchall()]
+        finally:
+            conn.close()
+
+
+def micro_user(i: int) -> int:
+    return MICRO_USER_BASE + i
+
+
+# кожен кейс — (fixture, номер виклику) -> будь-що; запис-кейси виконуються саме в цьому порядку
+READ_CASES = {
+    "bot_username_exists":              lambda fx, i: bot.bot_username_exists(f"Користувач_seed{i}"),
+    "resolve_city":                     lambda fx, i: bot.resolve_city(fx.city, create=False),
+    "fetch_city":                       lambda fx, i: bot.fetch_city(fx.city_id),
+    "fetch_ads":                        lambda fx, i: bot.fetch_ads(fx.category, offset=i % 50 * bot.PAGE_SIZE),
+    "count_ads":                        lambda fx, i: bot.count_ads(fx.category),
+    "fetch_ad_by_id":                   lambda fx, i: bot.fetch_ad_by_id(fx.ad_id),
+    "fetch_ad_for_viewer":              lambda fx, i: bot.fetch_ad_for_viewer(fx.ad_id, fx.requester),
+    "fetch_user_by_id":                 lambda fx, i: bot.fetch_user_by_id(fx.hot_author),
+    "fetch_distinct_cities":            lambda fx, i: bot.fetch_distinct_cities(fx.city[:3], category=fx.category),
+    "fetch_ads_by_city":                lambda fx, i: bot.fetch_ads_by_city(fx.city_id, fx.category),
+    "count_ads_by_city":                lambda fx, i: bot.count_ads_by_city(fx.city_id, fx.category),
+    "fetch_top_cities_list":            lambda fx, i: bot.fetch_top_cities_list(fx.category, top_n=bot.PAGE_SIZE),
+    "count_top_cities":                 lambda fx, i: bot.count_top_cities(fx.category),
+    "fetch_top_ads_list":               lambda fx, i: bot.fetch_top_ads_list(fx.category),
+    "fetch_ads_by_user":                lambda fx, i: bot.fetch_ads_by_user(fx.hot_author),
+    "fetch_reviews_by_author":          lambda fx, i: bot.fetch_reviews_by_author(fx.requester),
+    "fetch_review_by_id":               lambda fx, i: bot.fetch_review_by_id(fx.review_id),
+    "fetch_user_rating":                lambda fx, i: bot.fetch_user_rating(fx.hot_author),
+    "fetch_reviews_for_user":           lambda fx, i: bot.fetch_reviews_for_user(fx.hot_author),
+    "has_applied":                      lambda fx, i: bot.has_applied(fx.ad_id, fx.requester),
+    "fetch_application":                lambda fx, i: bot.fetch_application(fx.app_id),
+    "has_completed_application":        lambda fx, i: bot.has_completed_application(fx.requester, fx.author),
+    "fetch_review_eligibility":         lambda fx, i: bot.fetch_review_eligibility(fx.ad_id, fx.requester, fx.author),
+    "fetch_applications_for_requester": lambda fx, i: bot.fetch_applications_for_requester(fx.requester),
+    "fetch_user_subscriptions":         lambda fx, i: bot.fetch_user_subscriptions(fx.requester),
+    "fetch_category_subscriptions":     lambda fx, i: bot.fetch_category_subscriptions(fx.requester),
+    "ad_exists":                        lambda fx, i: bot.ad_exists(fx.ad_id, fx.category),
+    "fetch_ads_by_price":               lambda fx, i: bot.fetch_ads_by_price(fx.category, Decimal(2000), "UAH"),
+    "count_ads_by_price":               lambda fx, i: bot.count_ads_by_price(fx.category, Decimal(2000), "UAH"),
+    "search_ads":                       lambda fx, i: bot.search_ads(fx.tsquery, limit=bot.PAGE_SIZE),
+    "count_search_ads":                 lambda fx, i: bot.count_search_ads(fx.tsquery),
+}
+
+WRITE_CASES = {
+    "save_user":              lambda fx, i: bot.save_user(User(micro_user(i), "Bench", False)),
+    "save_ad":                lambda fx, i: bot.save_ad(fx.new_ad(i), micro_user(i)),
+    "update_ad":              lambda fx, i: bot.update_ad(fx.new_ad(i, "оновлено"), fx.micro_ads[i]),
+    "save_application":       lambda fx, i: fx.micro_apps.append(
+                                  bot.save_application(fx.micro_ads[i], fx.requester, micro_user(i))),
+    "transition_application": lambda fx, i: bot.transition_application(fx.micro_apps[i], "accepted"),
+    "save_review":            lambda fx, i: bot.save_review({"author_id": fx.requester, "target_id": micro_user(i),
+                                                             "ad_id": fx.micro_ads[i], "rating": 5}),
+    "delete_review":          lambda fx, i: bot.delete_review(fx.micro_reviews[i]),
+    "delete_ad":              lambda fx, i: bot.delete_ad(fx.micro_ads[i]),
+}
+
+# перед кожним викликом, поза вимірюванням: функції з власним кешем мають щоразу йти в БД
+BEFORE_CALL = {
+    "resolve_city": lambda fx: bot.CITY_CACHE.clear(),
+    "fetch_city":   lambda fx: bot.CITY_CACHE.clear(),
+}
+
+# після запис-кейсу: зібрати id створених рядків для наступних кейсів
+AFTER_WRITE = {
+    "save_ad":     lambda fx: setattr(fx, "micro_ads", fx.collect("ads", "user_id")),
+    "save_review": lambda fx: setattr(fx, "micro_reviews", fx.collect("reviews", "target_id")),
+}
+
+PURE_CASES = {
+    "paginate_keyboard":   lambda fx, i: bot.paginate_keyboard(
+                               fx.listing, i % 12 + 1, bot.PAGE_SIZE, bot.NAV_SIZE,
+                               lambda a: f"{a['bot_username']} — {a['city']} — {a['price']} — {a['avg_rating']} ⭐",
+                               lambda a: f"show_ad_{a['id']}|all_ads|3|general", "all_ads_general"),
+    "parse_list_callback": lambda fx, i: bot.parse_list_callback("all_ads_general_12", "all_ads"),
+    "ad_caption":          lambda fx, i: bot.ad_caption(fx.ad_id, fx.card),
+    "encode_deep_link":    lambda fx, i: bot.encode_deep_link(fx.ad_id, "all_ads", 3, fx.category),
+    "decode_deep_link":    lambda fx, i: bot.decode_deep_link(fx.deep_link),
+    "parse_price":         lambda fx, i: bot.parse_price("від 1 500 до 2 000 грн"),
+    "city_key":            lambda fx, i: bot.city_key("Кривий Ріг"),
+    "build_search_query":  lambda fx, i: bot.build_search_query("поліграф Київ терміново"),
+    "message_hash":        lambda fx, i: bot.message_hash(fx.card['desc'], fx.markup, "MarkdownV2", None),
+}
+
+
+def repository_functions() -> list[str]:
+    return sorted(name for name, obj in vars(bot).items()
+                  if getattr(obj, "__code__", None) is bot._repository_code)
+
+
+def cleanup():
+    conn = bot.db_connect(**bot.DB_PARAMS)
+    try:
+        with conn, conn.cursor() as cur:
+            # оголошення й заявки видаляються каскадом разом з користувачами
+            for table, column in (("reviews", "target_id"), ("pair_interactions", "user_a"),
+                                  ("pair_interactions", "user_b"), ("user_ratings", "user_id"), ("users", "id")):
+                cur.execute(f"DELETE FROM {table} WHERE {column} BETWEEN %s AND %s", MICRO_RANGE)
+    finally:
+        conn.close()
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def measure(fx: Fixture, fn, calls: int, warmup: int, before=None) -> dict:
+    timings = []
+    for i in range(warmup + calls):
+        if before:
+            before(fx)
+        start = time.perf_counter()
+        fn(fx, i)
+        if i >= warmup:
+            timings.append(time.perf_counter() - start)
+    ms = [t * 1000 for t in timings]
+    return {
+        "calls": len(ms),
+        "mean_ms": sum(ms) / len(ms),
+        "p50_ms": percentile(ms, 0.50),
+        "p95_ms": percentile(ms, 0.95),
+        "p99_ms": percentile(ms, 0.99),
+    }
+
+
+def run(args) -> dict:
+    fx = Fixture()
+    results = {}
+    selected = lambda name: not args.only or any(part in name for part in args.only)
+    # запис-цикл не можна розірвати фільтром: наступні кейси залежать від попередніх
+    writes = any(selected(name) for name in WRITE_CASES)
+    for kind, cases, factor in (("pure", PURE_CASES, PURE_FACTOR), ("db", READ_CASES, 1), ("write", WRITE_CASES, 1)):
+        for name, fn in cases.items():
+            if not (selected(name) or kind == "write" and writes):
+                continue
+            warmup = 0 if kind == "write" else args.warmup * factor
+            measured = measure(fx, fn, args.repeat * factor, warmup, BEFORE_CALL.get(name))
+            if selected(name):
+                results[name] = {"kind": kind, **measured}
+            if name in AFTER_WRITE:
+                AFTER_WRITE[name](fx)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta_ms: float) -> list[str]:
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        current["baseline_p95_ms"] = before["p95_ms"]
+        delta = current["p95_ms"] - before["p95_ms"]
+        # мінімальна абсолютна різниця відсікає шум на мікросекундних помічниках
+        if current["p95_ms"] > before["p95_ms"] * (1 + threshold) and delta > min_delta_ms:
+            current["regression"] = True
+            regressions.append(name)
+    return regressions
+
+
+def print_table(results: dict):
+    print(f"\n{'функція':<34}{'тип':<7}{'виклики':>8}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'база p95':>10}")
+    for name, r in results.items():
+        base = f"{r['baseline_p95_ms']:10.3f}" if "baseline_p95_ms" in r else f"{'—':>10}"
+        flag = "  ← регресія" if r.get("regression") else ""
+        print(f"{name:<34}{r['kind']:<7}{r['calls']:>8}{r['p50_ms']:10.3f}{r['p95_ms']:10.3f}{r['p99_ms']:10.3f}{base}{flag}")
+
+
+def main(args) -> int:
+    missing = sorted(set(repository_functions()) - READ_CASES.keys() - WRITE_CASES.keys())
+    if missing:
+        print(f"Немає мікробенчмарку для: {', '.join(missing)}", file=sys.stderr)
+        return 2
+
+    bot.init_db()
+    cleanup()
+    try:
+        results = run(args)
+    finally:
+        cleanup()
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+
+    print_table(results)
+    if args.out:
+        document = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "repeat": args.repeat,
+            "results": results,
+        }
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(document, f, ensure_ascii=False, indent=2)
+    if regressions:
+        print(f"\nРегресія p95 понад {args.threshold:.0%}: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=200, help="викликів на функцію (помічники — ×50)")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--only", nargs="*", help="лише функції, що містять ці підрядки")
+    parser.add_argument("--out", help="записати результати в JSON")
+    parser.add_argument("--baseline", help="JSON попереднього прогону для порівняння")
+    parser.add_argument("--threshold", type=float, default=0.25, help="допустиме зростання p95, частка")
+    parser.add_argument("--min-delta-ms", type=float, default=0.01, help="менша різниця p95 не вважається регресією")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    bot.SLOW_QUERY_MS = float("inf")   # інакше лог повільних запитів і EXPLAIN спотворюють вимірювання
+    sys.exit(main(args))
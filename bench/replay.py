@@ -0,0 +1,86 @@
+"""Відтворення записаного вебхук-трафіку (UPDATE_RECORD_FILE) на локальному екземплярі бота.
+
+Update подаються в той самий Application, що й у __main__, із заглушкою Bot API. Порядок у межах чату
+зберігається, чати йдуть паралельно. Швидкість: 1 — як у записі, 10 — вдесятеро швидше, 0 — максимальна.
+Звіт такий самий, як у loadgen (--json для порівняння збірок).
+
+    python bench/replay.py updates.jsonl updates.jsonl.1 --speed 10
+    python bench/replay.py updates.jsonl --speed 0 --json > build-a.json
+"""
+import os, sys, json, time, asyncio, argparse, logging
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from loadgen import bot, Driver, StubBotRequest, report
+
+REPLAY_TIMEOUT = 5   # update без відповідного обробника вважається невдалим після цієї паузи
+
+
+def load_records(paths: list[str]) -> list[dict]:
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+
+def chat_of(update: dict) -> int:
+    for kind in ("message", "edited_message", "callback_query", "inline_query", "chosen_inline_result"):
+        if kind in update:
+            body = update[kind]
+            return body["from"]["id"] if "from" in body else body["chat"]["id"]
+    return 0
+
+
+def kind_of(update: dict) -> str:
+    return next((k for k in update if k != "update_id"), "unknown")
+
+
+async def replay(driver: Driver, records: list[dict], speed: float):
+    by_chat: dict[int, list[dict]] = defaultdict(list)
+    for record in records:
+        by_chat[chat_of(record["update"])].append(record)
+    t0 = records[0]["ts"]
+    started = time.monotonic()
+
+    async def run_chat(chat_records: list[dict]):
+        for record in chat_records:
+            if speed:
+                delay = (record["ts"] - t0) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            update = record["update"]
+            await driver.send(dict(update), kind_of(update), timeout=REPLAY_TIMEOUT)
+
+    await asyncio.gather(*(run_chat(r) for r in by_chat.values()))
+
+
+async def main(args):
+    records = load_records(args.files)
+    if not records:
+        sys.exit("Порожній запис")
+    bot.init_db()
+    api = StubBotRequest(args.api_latency_ms)
+    app = bot.build_application(request=api)
+    driver = Driver(app, api)
+
+    await app.initialize()
+    try:
+        start = time.perf_counter()
+        await replay(driver, records, args.speed)
+        report(driver, time.perf_counter() - start, args.json)
+    finally:
+        await app.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("files", nargs="+", help="файли запису (включно з ротованими .1, .2…)")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 — реальний час, 10 — у 10 разів швидше, 0 — максимум")
+    parser.add_argument("--api-latency-ms", type=float, default=30, help="середня затримка заглушки Bot API")
+    parser.add_argument("--json", action="store_true", help="звіт у JSON")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger(bot.__name__).setLevel(logging.CRITICAL)   # винятки рахуються у звіті
+    asyncio.run(main(args))
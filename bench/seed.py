@@ -0,0 +1,221 @@
+"""Детермінований сидер для перевірки схеми на реалістичних обсягах.
+
+Через COPY завантажує користувачів, оголошення, заявки, відгуки й підписки. Автори, міста й клієнти
+мають Zipf-розподіл (кілька «гарячих» міст і продавців, довгий хвіст). Далі ті самі задачі, що й у боті,
+перераховують похідні таблиці: city_stats, user_ratings, pair_interactions, ads_listing.
+Однаковий --seed дає ті самі дані, тож EXPLAIN і бенчмарки відтворювані.
+
+    python bench/seed.py --ads 1000000 --seed 42
+    python bench/seed.py --reset          # прибрати попередній посів
+
+Синтетичні користувачі займають окремий діапазон id (SEED_USER_BASE).
+"""
+import os, io, sys, time, random, asyncio, argparse, itertools, logging
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+
+import bot
+
+SEED_USER_BASE = 8_000_000_000
+SEED_USER_SPAN = 1_000_000_000     # bench/loadgen.py користується діапазоном вище
+BATCH = 100_000
+EPOCH = datetime(2025, 1, 1)
+PERIOD = timedelta(days=365)
+
+CATEGORY_WEIGHTS = {"general": 0.6, "search": 0.25, "other": 0.15}
+STATUS_WEIGHTS = {"accepted": 0.5, "pending": 0.3, "rejected": 0.2}
+RATING_WEIGHTS = (0.05, 0.05, 0.10, 0.30, 0.50)
+PRICES = ["500 грн", "1000 грн", "1500 грн", "2000 грн", "2000-3000 грн", "3500 грн", "5000 грн",
+          "100$", "150 $", "договірна", "від 800 грн", "1200₴"]
+WORDS = ("перевірка", "поліграф", "досвід", "конфіденційно", "виїзд", "офіс", "терміново",
+         "співбесіда", "висновок", "звіт", "консультація", "сертифікат")
+
+
+def zipf_weights(n: int, s: float) -> list[float]:
+    # накопичені ваги для random.choices: ранг 1 — найчастіший
+    total, cum = 0.0, []
+    for rank in range(1, n + 1):
+        total += 1 / rank ** s
+        cum.append(total)
+    return cum
+
+
+def copy_rows(cur, table: str, columns: tuple, rows):
+    """COPY пачками по BATCH рядків; значення вже без табуляцій і переносів."""
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    rows = iter(rows)
+    count = 0
+    while True:
+        chunk = list(itertools.islice(rows, BATCH))
+        if not chunk:
+            return count
+        buf = io.StringIO()
+        for row in chunk:
+            buf.write("\t".join(r"\N" if v is None else str(v) for v in row))
+            buf.write("\n")
+        buf.seek(0)
+        cur.copy_expert(sql, buf)
+        count += len(chunk)
+
+
+class Seeder:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.users = args.users or max(args.ads // 2, 10)
+
+    def moment(self) -> str:
+        return (EPOCH + PERIOD * self.rng.random()).isoformat(sep=" ", timespec="seconds")
+
+    def user_rows(self):
+        for i in range(self.users):
+            yield (SEED_USER_BASE + i, None, f"Seed {i}", f"Користувач_seed{i}", 3, self.moment())
+
+    def ad_rows(self, first_id: int, cities: list[tuple[int, str]]):
+        user_cum = zipf_weights(self.users, 1.1)
+        city_cum = zipf_weights(len(cities), 1.2)
+        categories, category_weights = zip(*CATEGORY_WEIGHTS.items())
+        parsed = {p: bot.parse_price(p) for p in PRICES}
+        self.ad_owner = []
+        for i in range(self.args.ads):
+            owner = SEED_USER_BASE + self.rng.choices(range(self.users), cum_weights=user_cum)[0]
+            city_id, city = cities[self.rng.choices(range(len(cities)), cum_weights=city_cum)[0]]
+            price = self.rng.choice(PRICES)
+            price_min, price_max, currency = parsed[price]
+            self.ad_owner.append(owner)
+            yield (
+                first_id + i, owner, city, city_id, price,
+                " ".join(self.rng.choices(WORDS, k=self.rng.randint(5, 40))),
+                self.rng.choices(categories, category_weights)[0],
+                price_min, price_max, currency, bot.PRICE_PARSER_VERSION, self.moment(),
+            )
+
+    def application_rows(self, first_ad: int):
+        # популярні оголошення (малий ранг у Zipf) збирають більшість заявок
+        ad_cum = zipf_weights(self.args.ads, 0.8)
+        user_cum = zipf_weights(self.users, 0.9)
+        statuses, status_weights = zip(*STATUS_WEIGHTS.items())
+        self.accepted = []
+        for _ in range(int(self.args.ads * self.args.apps_per_ad)):
+            ad = self.rng.choices(range(self.args.ads), cum_weights=ad_cum)[0]
+            executor = self.ad_owner[ad]
+            requester = SEED_USER_BASE + self.rng.choices(range(self.users), cum_weights=user_cum)[0]
+            if requester == executor:
+                continue
+            status = self.rng.choices(statuses, status_weights)[0]
+            created = self.moment()
+            if status == "accepted":
+                self.accepted.append((first_ad + ad, requester, executor))
+            yield (first_ad + ad, requester, executor, status, created, None if status == "pending" else created)
+
+    def review_rows(self):
+        for ad_id, requester, executor in self.accepted:
+            if self.rng.random() >= self.args.review_rate:
+                continue
+            comment = " ".join(self.rng.choices(WORDS, k=8)) if self.rng.random() < 0.4 else None
+            rating = self.rng.choices(range(1, 6), RATING_WEIGHTS)[0]
+            yield (requester, executor, ad_id, rating, comment, self.moment())
+
+    def subscription_rows(self):
+        author_cum = zipf_weights(self.users, 1.1)
+        seen = set()
+        for _ in range(self.users):
+            subscriber = SEED_USER_BASE + self.rng.randrange(self.users)
+            author = SEED_USER_BASE + self.rng.choices(range(self.users), cum_weights=author_cum)[0]
+            if subscriber != author and (subscriber, author) not in seen:
+                seen.add((subscriber, author))
+                yield (subscriber, author, self.moment())
+
+    def category_subscription_rows(self):
+        categories, weights = zip(*CATEGORY_WEIGHTS.items())
+        for i in range(0, self.users, 4):
+            yield (SEED_USER_BASE + i, self.rng.choices(categories, weights)[0], self.moment())
+
+    def run(self):
+        conn = bot.db_connect(**bot.DB_PARAMS)
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute("SELECT id, name FROM cities ORDER BY id")
+                cities = cur.fetchall()
+                cur.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM ads")
+                first_ad = cur.fetchone()[0]
+
+                steps = (
+                    ("users", ("id", "username", "full_name", "bot_username", "ad_quota", "created_at"),
+                     self.user_rows()),
+                    ("ads", ("id", "user_id", "city", "city_id", "price", "description", "category",
+                             "price_min", "price_max", "price_currency", "price_parser", "created_at"),
+                     self.ad_rows(first_ad, cities)),
+                    ("applications", ("ad_id", "requester_id", "executor_id", "status", "created_at", "updated_at"),
+                     self.application_rows(first_ad)),
+                    ("reviews", ("author_id", "target_id", "ad_id", "rating", "comment", "created_at"),
+                     self.review_rows()),
+                    ("user_subscriptions", ("subscriber_id", "author_id", "created_at"),
+                     self.subscription_rows()),
+                    ("category_subscriptions", ("subscriber_id", "category", "created_at"),
+                     self.category_subscription_rows()),
+                )
+                for table, columns, rows in steps:
+                    start = time.perf_counter()
+                    count = copy_rows(cur, table, columns, rows)
+                    print(f"{table:<24}{count:>10} рядків  {time.perf_counter() - start:6.1f} с")
+                cur.execute("SELECT setval(pg_get_serial_sequence('ads', 'id'), (SELECT MAX(id) FROM ads))")
+        finally:
+            conn.close()
+
+
+def reset():
+    conn = bot.db_connect(**bot.DB_PARAMS)
+    try:
+        with conn, conn.cursor() as cur:
+            # оголошення, заявки й ads_listing видаляються каскадом разом з користувачами
+            for table, column in (("reviews", "author_id"), ("applications", "requester_id"),
+                                  ("user_subscriptions", "subscriber_id"), ("category_subscriptions", "subscriber_id"),
+                                  ("pair_interactions", "user_a"), ("pair_interactions", "user_b"),
+                                  ("user_ratings", "user_id"), ("users", "id")):
+                cur.execute(f"DELETE FROM {table} WHERE {column} BETWEEN %s AND %s",
+                            (SEED_USER_BASE, SEED_USER_BASE + SEED_USER_SPAN - 1))
+                print(f"{table:<24}{cur.rowcount:>10} видалено")
+    finally:
+        conn.close()
+
+
+async def rebuild_derived():
+    # COPY оминає репозиторні функції, тож похідні таблиці перераховують ті самі задачі, що й у боті
+    for job in (bot.reconcile_city_stats, bot.reconcile_user_ratings,
+                bot.rebuild_pair_interactions, bot.reconcile_ads_listing):
+        start = time.perf_counter()
+        await job(None)
+        print(f"{job.__name__:<34}{time.perf_counter() - start:6.1f} с")
+
+
+def analyze():
+    conn = bot.db_connect(**bot.DB_PARAMS)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--ads", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=0, help="типово — половина від --ads")
+    parser.add_argument("--apps-per-ad", type=float, default=2.0, help="середня кількість заявок на оголошення")
+    parser.add_argument("--review-rate", type=float, default=0.6, help="частка прийнятих заявок з відгуком")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="видалити попередній посів і вийти")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    bot.SLOW_QUERY_MS = float("inf")   # масові COPY й перерахунки повільні за визначенням
+
+    bot.init_db()
+    reset()
+    if not args.reset:
+        Seeder(args).run()
+    asyncio.run(rebuild_derived())
+    analyze()
@@ -0,0 +1,38 @@
+"""Спільна імітація відповідей Bot API для бенчмарків (loadgen, fake_bot_api)."""
+import json, time, itertools
+
+
+class FakeTelegram:
+    """Будує правдоподібні result для методів Bot API і пам'ятає останню клавіатуру кожного чату."""
+
+    def __init__(self):
+        self.buttons: dict[int, list[str]] = {}       # chat_id -> callback_data останньої клавіатури
+        self.last_message: dict[int, int] = {}        # chat_id -> message_id останнього повідомлення бота
+        self._message_ids = itertools.count(1)
+
+    def result(self, name: str, params: dict):
+        if name == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if name == "getWebhookInfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        if not name.startswith(("send", "edit")):
+            return True
+        chat_id = int(params.get("chat_id", 0))
+        message_id = int(params.get("message_id") or next(self._message_ids))
+        self.remember_keyboard(chat_id, params.get("reply_markup"))
+        self.last_message[chat_id] = message_id
+        message = {"message_id": message_id, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}}
+        if name in ("sendPhoto", "editMessageMedia"):
+            message["photo"] = [{"file_id": "p", "file_unique_id": "p", "width": 1, "height": 1}]
+        elif "text" in params:
+            message["text"] = params["text"]
+        return message
+
+    def remember_keyboard(self, chat_id: int, markup) -> list[str] | None:
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        if not markup or "inline_keyboard" not in markup:
+            return None
+        buttons = [b["callback_data"] for row in markup["inline_keyboard"] for b in row if "callback_data" in b]
+        self.buttons[chat_id] = buttons
+        return buttons
@@ -1,19 +1,28 @@
-import os
-import re, uuid, html, psycopg2, string, random, base64, logging
+import os, sys, json, queue, secrets, urllib.request
+import re, html, hmac, time, hashlib, psycopg2, string, random, base64, logging, asyncio, functools, signal, threading
+from collections import OrderedDict
+from logging.handlers import RotatingFileHandler
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
 from datetime import datetime, timezone,  timedelta
+from decimal import Decimal, InvalidOperation
+from psycopg2.extensions import connection as PgConnection, cursor as PgCursor
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
+from aiohttp import web
+from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
 from telegram import (
     Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto,
-    User, InlineQueryResultArticle, InputTextMessageContent
+    User, InlineQueryResultArticle, InputTextMessageContent, Message
 )
 from telegram.ext import (
     ApplicationBuilder, ConversationHandler,
     CommandHandler, MessageHandler, CallbackQueryHandler,
-    filters, ContextTypes, InlineQueryHandler
+    filters, ContextTypes, InlineQueryHandler, AIORateLimiter
 )
 from telegram.helpers import escape_markdown
 from telegram.error import BadRequest
+from telegram.request import BaseRequest, HTTPXRequest
 from colorama import Fore
 from typing import Callable, Any
 from urllib.parse import quote
@@ -41,18 +50,65 @@ DB_PARAMS = {
     "password": DB_PASS,
 }
 
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "0") == "1"
+SLOW_QUERY_EXPLAIN_INTERVAL = 10 * 60   # не частіше одного EXPLAIN на функцію за цей час
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = int(os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", "5000"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SECONDS = 30          # тривалість вікна для SIGUSR2 і /profile без аргументу
+PROFILE_MAX_SECONDS = 300
+PROFILE_INTERVAL = 0.005      # період семплювання, с
+LOOP_LAG_INTERVAL = 0.25      # період вимірювання затримки планування, с
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_MS", "100")) / 1000
+TRACE_FILE = os.getenv("TRACE_FILE")            # JSON lines, один спан на рядок
+TRACE_OTLP_URL = os.getenv("TRACE_OTLP_URL")    # напр. http://127.0.0.1:4318/v1/traces
+TRACING = bool(TRACE_FILE or TRACE_OTLP_URL)
+TRACE_QUEUE_SIZE = 2000   # трас в очікуванні експорту; понад це нові траси відкидаються
+TRACE_BATCH = 100         # трас в одному POST до колектора
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x}
+
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 WEBHOOK_PATH = os.getenv("WEBHOOK_PATH")
 DOMAIN = os.getenv("DOMAIN")
 WEBHOOK_URL = f"https://{DOMAIN}/{WEBHOOK_PATH}"
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8001"))
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL")           # напр. локальний bench/fake_bot_api.py
+BOT_RATE_LIMITER = os.getenv("BOT_RATE_LIMITER", "0") == "1"  # потребує python-telegram-bot[rate-limiter]
+UPDATE_RECORD_FILE = os.getenv("UPDATE_RECORD_FILE")   # запис вхідних update для bench/replay.py
+UPDATE_RECORD_MAX_MB = int(os.getenv("UPDATE_RECORD_MAX_MB", "100"))
+UPDATE_RECORD_KEY = (os.getenv("UPDATE_RECORD_KEY") or BOT_TOKEN or "").encode()
+UPDATE_RECORD_REMAP_ADS = os.getenv("UPDATE_RECORD_REMAP_ADS", "0") == "1"   # id оголошень теж під псевдонімами
+METRICS_PATH = "/metrics"   # віддається тим самим aiohttp-сервером, що й вебхук
 
 MIN_QUERY_LEN = 2
+INLINE_PAGE_SIZE = 10      # скільки результатів віддавати в одній сторінці inline-відповіді
+INLINE_MAX_RESULTS = 50    # скільки міст тримати в кеші для одного запиту
+INLINE_CACHE_TIME = 30     # скільки секунд Telegram кешує відповідь у клієнта
+INLINE_CACHE_TTL = 120     # скільки секунд живе відповідь у нашому кеші
+LISTING_CACHE_TTL = 30     # скільки живуть прогріті сторінки списків і картки оголошень, с
+PREFETCH_BUDGET = 2        # скільки фонових запитів може виконуватися одночасно
+NAV_DEPTH = 6                    # скільки останніх екранів пам'ятати на користувача
+NAV_MAX_BYTES = 4 * 1024 * 1024  # загальний розмір усіх збережених екранів
+NAV_TTL = 10 * 60                # скільки живе збережений екран, с
 PAGE_SIZE = 8   # скільки оголошень показувати за раз
+TOP_ADS_LIMIT = 100  # скільки оголошень потрапляє до «Популярних»
 NAV_SIZE  = 5
 
 MAX_CITY_LEN = 70
 MAX_PRICE_LEN = 50
 MAX_DESC_LEN = 500
+MAX_PRICE_VALUE = Decimal("1000000000")
+
+DEFAULT_CURRENCY = "UAH"
+PRICE_CURRENCIES = [
+    ("USD", ("$", "usd", "дол")),
+    ("EUR", ("€", "eur", "євро", "евро")),
+    ("UAH", ("₴", "грн", "uah", "гривн")),
+]
+# множник — лише окремим словом: «2к» = 2000, а «2000грн» — це 2000 без множника
+RE_PRICE_NUMBER = re.compile(r'(\d+(?:[ \u00a0]\d{3})*(?:[.,]\d+)?)\s*(?:(тис\w*|k|к)(?![^\W\d_]))?', re.IGNORECASE)
+# підвищується зі зміною parse_price: backfill_ad_prices один раз перерахує всі ціни
+PRICE_PARSER_VERSION = 2
 
 CHANGE_NICK = 25 
 NICK_CHANGE_COOLDOWN = timedelta(days=30)
@@ -65,16 +121,908 @@ CATEGORY_LABELS = {
     "other":   "Купівля, продаж, вакансії",
 }
 
+# Канонічна назва -> поширені варіанти написання (російською, латиницею)
+CITY_ALIASES = {
+    "Київ":             ("Киев", "Kiev", "Kyiv"),
+    "Харків":           ("Харьков", "Kharkov", "Kharkiv"),
+    "Одеса":            ("Одесса", "Odessa", "Odesa"),
+    "Дніпро":           ("Днепр", "Днепропетровск", "Дніпропетровськ", "Dnepr", "Dnipro"),
+    "Львів":            ("Львов", "Lvov", "Lviv"),
+    "Запоріжжя":        ("Запорожье", "Zaporozhye", "Zaporizhzhia"),
+    "Кривий Ріг":       ("Кривой Рог", "Kryvyi Rih"),
+    "Миколаїв":         ("Николаев", "Nikolaev", "Mykolaiv"),
+    "Вінниця":          ("Винница", "Vinnytsia"),
+    "Полтава":          ("Poltava",),
+    "Чернігів":         ("Чернигов", "Chernihiv"),
+    "Черкаси":          ("Черкассы", "Cherkasy"),
+    "Житомир":          ("Zhytomyr",),
+    "Суми":             ("Сумы", "Sumy"),
+    "Хмельницький":     ("Хмельницкий", "Khmelnytskyi"),
+    "Рівне":            ("Ровно", "Rivne"),
+    "Івано-Франківськ": ("Ивано-Франковск", "Ivano-Frankivsk"),
+    "Тернопіль":        ("Тернополь", "Ternopil"),
+    "Луцьк":            ("Луцк", "Lutsk"),
+    "Ужгород":          ("Uzhhorod",),
+    "Чернівці":         ("Черновцы", "Chernivtsi"),
+    "Кропивницький":    ("Кропивницкий", "Кировоград", "Kropyvnytskyi"),
+    "Херсон":           ("Kherson",),
+    "Біла Церква":      ("Белая Церковь", "Bila Tserkva"),
+    "Онлайн":           ("Online", "Дистанційно", "Дистанционно"),
+}
+
+# Спрощена транслітерація: українські та російські літери -> латиниця
+CITY_TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "h", "ґ": "g", "д": "d", "е": "e", "є": "ie",
+    "ж": "zh", "з": "z", "и": "y", "і": "i", "ї": "i", "й": "i", "к": "k", "л": "l",
+    "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch", "ь": "", "ю": "iu",
+    "я": "ia", "ы": "y", "э": "e", "ё": "e", "ъ": "",
+})
+RE_CITY_PREFIX = re.compile(r'^(?:м\.|г\.|місто|город)\s*', re.IGNORECASE)
+
 APPS_LABELS = {
     "accepted": "Прийнята",
     "pending": "В обробці",
     "rejected": "Відхилена" 
 }
 
+# ====== Трасування ======
+_current_span: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+_trace_queue: queue.Queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+_trace_exporter: threading.Thread | None = None
+
+class Span:
+    """Інтервал у трасі: корінь — один update або запуск задачі, діти — виклики БД і Bot API."""
+    __slots__ = ("name", "attrs", "trace_id", "span_id", "parent_id", "start", "end", "error", "trace", "_token")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.error = None
+
+    def set(self, key: str, value):
+        self.attrs[key] = value
+
+    def __enter__(self):
+        parent = _current_span.get()
+        if parent is None:
+            self.trace_id, self.parent_id, self.trace = secrets.token_hex(16), None, []
+        else:
+            self.trace_id, self.parent_id, self.trace = parent.trace_id, parent.span_id, parent.trace
+        self.span_id = secrets.token_hex(8)
+        self.start = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.time_ns()
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        self.trace.append(self)
+        if self.parent_id is None:
+            export_trace(self.trace)
+
+class _NoSpan:
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+_NO_SPAN = _NoSpan()
+
+def span(name: str, root: bool = False, **attrs):
+    # без експортера, а для дочірніх спанів ще й без відкритої траси, — порожній контекст
+    if not TRACING or (not root and _current_span.get() is None):
+        return _NO_SPAN
+    return Span(name, attrs)
+
+def export_trace(spans: list):
+    global _trace_exporter
+    if _trace_exporter is None:
+        _trace_exporter = threading.Thread(target=run_trace_exporter, name="trace-exporter", daemon=True)
+        _trace_exporter.start()
+    # повільний чи недоступний колектор не повинен накопичувати траси в пам'яті без меж
+    try:
+        _trace_queue.put_nowait(spans)
+    except queue.Full:
+        TRACES_DROPPED_TOTAL.labels("queue_full").inc()
+
+def span_to_json(s: Span) -> dict:
+    return {
+        "trace_id": s.trace_id, "span_id": s.span_id, "parent_id": s.parent_id, "name": s.name,
+        "start": s.start / 1e9, "duration_ms": round((s.end - s.start) / 1e6, 3),
+        "error": s.error, "attrs": s.attrs,
+    }
+
+def otlp_attr(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+def spans_to_otlp(spans: list) -> dict:
+    return {"resourceSpans": [{
+        "resource": {"attributes": [otlp_attr("service.name", "detecto-bot")]},
+        "scopeSpans": [{"scope": {"name": "bot"}, "spans": [{
+            "traceId": s.trace_id, "spanId": s.span_id, "parentSpanId": s.parent_id or "",
+            "name": s.name, "kind": 1 if s.parent_id is None else 3,
+            "startTimeUnixNano": str(s.start), "endTimeUnixNano": str(s.end),
+            "attributes": [otlp_attr(k, v) for k, v in s.attrs.items()],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+        } for s in spans]}],
+    }]}
+
+def run_trace_exporter():
+    # запис у файл і POST до колектора — поза event loop
+    while True:
+        batch = [_trace_queue.get()]
+        while len(batch) < TRACE_BATCH:
+            try:
+                batch.append(_trace_queue.get_nowait())
+            except queue.Empty:
+                break
+        spans = [s for trace in batch for s in trace]
+        try:
+            if TRACE_FILE:
+                with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(span_to_json(s), ensure_ascii=False) + "\n" for s in spans)
+            if TRACE_OTLP_URL:
+                req = urllib.request.Request(
+                    TRACE_OTLP_URL, data=json.dumps(spans_to_otlp(spans)).encode(),
+                    headers={"Content-Type": "application/json"}
+                )
+                urllib.request.urlopen(req, timeout=2).close()
+        except Exception as e:
+            TRACES_DROPPED_TOTAL.labels("export_error").inc(len(batch))
+            logger.debug(f"[trace] експорт не вдався: {e}")
+
+# ====== Метрики ======
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HANDLER_SECONDS = Histogram(
+    "detecto_handler_seconds", "Час обробки update, за маршрутом (ім'я обробника)",
+    ["route"], buckets=LATENCY_BUCKETS
+)
+DB_SECONDS = Histogram(
+    "detecto_db_seconds", "Час виконання репозиторної функції",
+    ["function"], buckets=LATENCY_BUCKETS
+)
+TELEGRAM_SECONDS = Histogram(
+    "detecto_telegram_api_seconds", "Час виклику методу Bot API",
+    ["method"], buckets=LATENCY_BUCKETS
+)
+JOB_SECONDS = Histogram(
+    "detecto_job_seconds", "Тривалість одного запуску фонової задачі",
+    ["job"], buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600)
+)
+TRACES_DROPPED_TOTAL = Counter(
+    "detecto_traces_dropped_total", "Траси, не експортовані через переповнену чергу чи помилку колектора",
+    ["reason"]
+)
+ERRORS_TOTAL = Counter(
+    "detecto_errors_total", "Необроблені винятки в обробниках і задачах",
+    ["where", "type"]
+)
+TELEGRAM_429_TOTAL = Counter(
+    "detecto_telegram_rate_limited_total", "Відповіді 429 Too Many Requests від Bot API",
+    ["method"]
+)
+CACHE_LOOKUPS_TOTAL = Counter(
+    "detecto_cache_lookups_total", "Звернення до in-process кешів",
+    ["cache", "result"]
+)
+
+# ім'я репозиторної функції, що зараз виконується (для атрибуції запитів до БД)
+_current_repository: ContextVar[str | None] = ContextVar("current_repository", default=None)
+
+def repository(fn):
+    """Позначає функцію доступу до БД: час виконання потрапляє в DB_SECONDS."""
+    seconds = DB_SECONDS.labels(fn.__name__)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _current_repository.set(fn.__name__)
+        start = time.perf_counter()
+        try:
+            with span(f"db {fn.__name__}", function=fn.__name__):
+                return fn(*args, **kwargs)
+        finally:
+            seconds.observe(time.perf_counter() - start)
+            _current_repository.reset(token)
+    return wrapper
+
+def timed_handler(callback):
+    route = callback.__name__.removesuffix("_handler")
+    seconds = HANDLER_SECONDS.labels(route)
+
+    @functools.wraps(callback)
+    async def wrapper(update, ctx):
+        start = time.perf_counter()
+        try:
+            with span(f"handler {route}", root=True, route=route, update_id=update.update_id):
+                return await callback(update, ctx)
+        finally:
+            seconds.observe(time.perf_counter() - start)
+    return wrapper
+
+_repository_code = next(c for c in repository.__code__.co_consts if getattr(c, "co_name", None) == "wrapper")
+_timed_handler_code = next(c for c in timed_handler.__code__.co_consts if getattr(c, "co_name", None) == "wrapper")
+
+def timed_job(callback):
+    seconds = JOB_SECONDS.labels(callback.__name__)
+
+    @functools.wraps(callback)
+    async def wrapper(context):
+        # запити задачі поза @repository-функціями атрибутуються самій задачі
+        token = _current_repository.set(f"job:{callback.__name__}")
+        start = time.perf_counter()
+        try:
+            with span(f"job {callback.__name__}", root=True, job=callback.__name__):
+                return await callback(context)
+        finally:
+            seconds.observe(time.perf_counter() - start)
+            _current_repository.reset(token)
+    return wrapper
+
+def instrument_handlers(handlers):
+    # обгортає callback кожного обробника, зокрема вкладених у ConversationHandler
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            instrument_handlers(handler.entry_points)
+            for state_handlers in handler.states.values():
+                instrument_handlers(state_handlers)
+            instrument_handlers(handler.fallbacks)
+        else:
+            handler.callback = timed_handler(handler.callback)
+
+class MetricsRequest(HTTPXRequest):
+    """HTTPXRequest, що міряє час кожного методу Bot API і рахує відповіді 429."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        try:
+            with span(f"telegram {api_method}", method=api_method) as s:
+                code, payload = await super().do_request(url, method, *args, **kwargs)
+                s.set("http.status_code", code)
+        finally:
+            TELEGRAM_SECONDS.labels(api_method).observe(time.perf_counter() - start)
+        if code == 429:
+            TELEGRAM_429_TOTAL.labels(api_method).inc()
+        return code, payload
+
+async def error_handler(update: object, ctx: ContextTypes.DEFAULT_TYPE):
+    where = "job" if ctx.job else "handler"
+    ERRORS_TOTAL.labels(where, type(ctx.error).__name__).inc()
+    logger.error(f"[{where}] Необроблений виняток", exc_info=ctx.error)
+
+# ====== БД: інструментування ======
+DB_QUERY_SECONDS = Histogram(
+    "detecto_db_query_seconds", "Час виконання окремого SQL-запиту",
+    ["function"], buckets=LATENCY_BUCKETS
+)
+DB_ROWS_TOTAL = Counter("detecto_db_rows_total", "Рядки, повернені або змінені запитами", ["function"])
+DB_FETCHED_BYTES_TOTAL = Counter("detecto_db_fetched_bytes_total", "Оцінка обсягу прочитаних даних", ["function"])
+DB_SLOW_QUERIES_TOTAL = Counter("detecto_db_slow_queries_total", "Запити, довші за SLOW_QUERY_MS", ["function"])
+
+# function -> [calls, seconds, max_seconds, rows, bytes, найповільніший запит]
+QUERY_STATS: dict[str, list] = {}
+_query_stats_lock = threading.Lock()
+_last_explain: dict[str, float] = {}
+# EXPLAIN ANALYZE повторно виконує запит — лише в окремому потоці, щоб не тримати цикл подій
+_explain_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+# такий запит чекав би на блокування, яке тримає незавершена транзакція самого виклику
+RE_LOCKING_CLAUSE = re.compile(rb"\bFOR\s+(?:NO\s+KEY\s+)?(?:UPDATE|SHARE|KEY\s+SHARE)\b", re.IGNORECASE)
+# рядки плану з виразами запиту: в них EXPLAIN ANALYZE підставляє значення параметрів
+RE_PLAN_EXPRESSION = re.compile(
+    r"^(\s*(?:Index Cond|Recheck Cond|Hash Cond|Merge Cond|TID Cond|Join Filter|One-Time Filter|Filter"
+    r"|Run Condition|Order By|Sort Key|Presorted Key|Group Key|Cache Key|Output): )(.*)$",
+    re.MULTILINE
+)
+RE_PLAN_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+def query_owner() -> str:
+    return _current_repository.get() or "inline"
+
+def redact_params(params):
+    # у лог потрапляють лише типи й довжини значень, не самі дані користувачів
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: redact_params(v) for k, v in params.items()}
+    if isinstance(params, (list, tuple)):
+        if len(params) > 10:
+            return f"<{type(params).__name__}:{len(params)}>"
+        return [redact_params(v) for v in params]
+    if isinstance(params, (str, bytes)):
+        return f"<{type(params).__name__}:{len(params)}>"
+    return f"<{type(params).__name__}>"
+
+def row_bytes(row) -> int:
+    values = row.values() if isinstance(row, dict) else row
+    return sum(len(v) if isinstance(v, (str, bytes, memoryview)) else 8 for v in values)
+
+def scrub_plan(plan: str) -> str:
+    # як і redact_params: значення з запиту не потрапляють у лог, статистика вузлів лишається
+    return RE_PLAN_EXPRESSION.sub(lambda m: m.group(1) + RE_PLAN_LITERAL.sub("?", m.group(2)), plan)
+
+def explain_slow_query(sql: bytes):
+    # окреме з'єднання: EXPLAIN ANALYZE не повинен зачепити транзакцію виклику
+    try:
+        conn = psycopg2.connect(**DB_PARAMS)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL statement_timeout = %s", (SLOW_QUERY_EXPLAIN_TIMEOUT_MS,))
+                cur.execute("SET LOCAL lock_timeout = %s", (min(SLOW_QUERY_EXPLAIN_TIMEOUT_MS, 1000),))
+                cur.execute(b"EXPLAIN (ANALYZE, BUFFERS) " + sql)
+                plan = "\n".join(r[0] for r in cur.fetchall())
+        finally:
+            conn.rollback()
+            conn.close()
+        logger.warning(f"[slow-sql] план:\n{scrub_plan(plan)}")
+    except psycopg2.Error as e:
+        # текст помилки може цитувати значення з запиту
+        logger.warning(f"[slow-sql] EXPLAIN не вдався: {type(e).__name__}")
+
+class InstrumentedCursorMixin:
+    """Міряє кожен execute і рахує рядки та байти, атрибутуючи їх поточній репозиторній функції."""
+
+    def execute(self, query, vars=None):
+        owner = query_owner()
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._record(owner, time.perf_counter() - start, query, vars)
+
+    def executemany(self, query, vars_list):
+        owner = query_owner()
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._record(owner, time.perf_counter() - start, query, None)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            self._count_bytes([row])
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        self._count_bytes(rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._count_bytes(rows)
+        return rows
+
+    def _count_bytes(self, rows):
+        if rows:
+            size = sum(row_bytes(r) for r in rows)
+            owner = query_owner()
+            DB_FETCHED_BYTES_TOTAL.labels(owner).inc(size)
+            with _query_stats_lock:
+                stats = QUERY_STATS.get(owner)
+                if stats:
+                    stats[4] += size
+
+    def _record(self, owner, seconds, query, vars):
+        rows = max(self.rowcount, 0)
+        DB_QUERY_SECONDS.labels(owner).observe(seconds)
+        DB_ROWS_TOTAL.labels(owner).inc(rows)
+        with _query_stats_lock:
+            stats = QUERY_STATS.setdefault(owner, [0, 0.0, 0.0, 0, 0, None])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[3] += rows
+            if seconds > stats[2]:
+                stats[2] = seconds
+                stats[5] = query if isinstance(query, str) else str(query)
+        if seconds * 1000 < SLOW_QUERY_MS:
+            return
+        DB_SLOW_QUERIES_TOTAL.labels(owner).inc()
+        logger.warning(
+            f"[slow-sql] {owner}: {seconds * 1000:.0f} мс, rows={rows}, "
+            f"params={redact_params(vars)}\n{' '.join(str(query).split())}"
+        )
+        if not (SLOW_QUERY_EXPLAIN and str(query).lstrip().upper().startswith("SELECT")):
+            return
+        sql = self.mogrify(query, vars)
+        if RE_LOCKING_CLAUSE.search(sql):
+            return
+        now = time.monotonic()
+        if now - _last_explain.get(owner, 0) < SLOW_QUERY_EXPLAIN_INTERVAL:
+            return
+        _last_explain[owner] = now
+        _explain_pool.submit(explain_slow_query, sql)
+
+class InstrumentedCursor(InstrumentedCursorMixin, PgCursor):
+    pass
+
+class InstrumentedDictCursor(InstrumentedCursorMixin, RealDictCursor):
+    pass
+
+INSTRUMENTED_CURSORS = {None: InstrumentedCursor, PgCursor: InstrumentedCursor, RealDictCursor: InstrumentedDictCursor}
+
+class InstrumentedConnection(PgConnection):
+    def cursor(self, *args, cursor_factory=None, **kwargs):
+        factory = cursor_factory or self.cursor_factory
+        return super().cursor(*args, cursor_factory=INSTRUMENTED_CURSORS.get(factory, factory), **kwargs)
+
+def db_connect(**kwargs):
+    """psycopg2.connect з інструментованими курсорами (час, рядки, байти, slow-query лог)."""
+    return psycopg2.connect(connection_factory=InstrumentedConnection, **kwargs)
+
+# ====== Профілювання ======
+_profiler_thread: threading.Thread | None = None
+
+def frame_route(frame) -> str | None:
+    # маршрут — ім'я обробника із замикання обгортки timed_handler
+    if frame.f_code is _timed_handler_code:
+        return frame.f_locals["callback"].__name__.removesuffix("_handler")
+    return None
+
+def collapse_stack(frame) -> str:
+    route = None
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        route = route or frame_route(frame)
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_qualname}")
+        frame = frame.f_back
+    names.append(route or "-")
+    return ";".join(reversed(names))
+
+def sample_process(seconds: float, path: str):
+    # поки вікно не запущене, потоку немає зовсім: нуль накладних витрат
+    me = threading.get_ident()
+    samples: dict[str, int] = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = f"{thread_names.get(ident, ident)};{collapse_stack(frame)}"
+            samples[stack] = samples.get(stack, 0) + 1
+        time.sleep(PROFILE_INTERVAL)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in sorted(samples.items()):
+            f.write(f"{stack} {count}\n")
+    logger.info(f"[profile] {sum(samples.values())} семплів записано в {path}")
+
+def start_profiler(seconds: float) -> tuple[threading.Thread, str] | None:
+    """Запускає вікно семплювання; результат — collapsed stacks (flamegraph.pl, speedscope)."""
+    global _profiler_thread
+    if _profiler_thread is not None and _profiler_thread.is_alive():
+        return None
+    path = os.path.join(PROFILE_DIR, f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded")
+    _profiler_thread = threading.Thread(
+        target=sample_process, args=(seconds, path), name="profiler", daemon=True
+    )
+    _profiler_thread.start()
+    return _profiler_thread, path
+
+# ====== Затримка event loop ======
+LOOP_LAG_SECONDS = Histogram(
+    "detecto_event_loop_lag_seconds", "Запізнення планування event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+LOOP_BLOCKS_TOTAL = Counter(
+    "detecto_event_loop_blocks_total", "Блокування циклу довші за LOOP_BLOCK_MS", ["route", "function"]
+)
+
+_loop_heartbeat = time.monotonic()
+
+async def monitor_loop_lag():
+    global _loop_heartbeat
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        _loop_heartbeat = time.monotonic()
+        LOOP_LAG_SECONDS.observe(max(_loop_heartbeat - start - LOOP_LAG_INTERVAL, 0))
+
+def describe_blocking(frame) -> tuple[str, str, str]:
+    """Маршрут, найглибша функція bot.py і рядок, на якому зараз стоїть цикл."""
+    leaf = f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno}"
+    route = function = None
+    while frame is not None:
+        code = frame.f_code
+        if code is _repository_code:
+            function = frame.f_locals["fn"].__name__   # репозиторна функція важливіша за внутрішні
+        elif function is None and code.co_filename == __file__ and not code.co_qualname.startswith("Instrumented"):
+            function = code.co_qualname
+        route = route or frame_route(frame)
+        frame = frame.f_back
+    return route or "-", function or "-", leaf
+
+def watch_event_loop(loop_thread: int, stop: threading.Event):
+    # окремий потік: бачить стек циклу саме тоді, коли той заблокований
+    reported = None
+    while not stop.wait(LOOP_LAG_INTERVAL / 2):
+        heartbeat = _loop_heartbeat
+        stalled = time.monotonic() - heartbeat - LOOP_LAG_INTERVAL
+        if stalled < LOOP_BLOCK_THRESHOLD or reported == heartbeat:
+            continue
+        frame = sys._current_frames().get(loop_thread)
+        if frame is None:
+            continue
+        reported = heartbeat
+        route, function, leaf = describe_blocking(frame)
+        LOOP_BLOCKS_TOTAL.labels(route, function).inc()
+        logger.warning(
+            f"[loop-lag] цикл заблоковано вже {stalled * 1000:.0f} мс: "
+            f"маршрут={route}, функція={function}, {leaf}"
+        )
+
+def start_loop_watchdog() -> tuple[asyncio.Task, threading.Event]:
+    global _loop_heartbeat
+    _loop_heartbeat = time.monotonic()
+    stop = threading.Event()
+    threading.Thread(
+        target=watch_event_loop, args=(threading.get_ident(), stop), name="loop-watchdog", daemon=True
+    ).start()
+    return asyncio.create_task(monitor_loop_lag()), stop
+
+# ====== Кеш ======
+class TTLCache:
+    """Невеликий LRU-кеш з обмеженням часу життя записів."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._hits = CACHE_LOOKUPS_TOTAL.labels(name, "hit")
+        self._misses = CACHE_LOOKUPS_TOTAL.labels(name, "miss")
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            self._misses.inc()
+            return default
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self._misses.inc()
+            return default
+        self._data.move_to_end(key)
+        self._hits.inc()
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def discard(self, match):
+        for key in [k for k, (_, value) in self._data.items() if match(k, value)]:
+            del self._data[key]
+
+# (category, нормалізований запит) -> [(city, title, aliases), ...]
+INLINE_CACHE = TTLCache("inline_cache", maxsize=2000, ttl=INLINE_CACHE_TTL)
+# ключ міста або city_id -> {'id', 'name'}; довідник лише доповнюється, тож TTL довгий
+CITY_CACHE = TTLCache("city_cache", maxsize=5000, ttl=24 * 60 * 60)
+# chat_id -> стан останнього повідомлення, яке бот надіслав чи відредагував у чаті
+MESSAGE_STATE = TTLCache("message_state", maxsize=10000, ttl=24 * 60 * 60)
+# (ім'я функції, *аргументи) -> сторінка списку або кількість рядків
+LISTING_CACHE = TTLCache("listing_cache", maxsize=2000, ttl=LISTING_CACHE_TTL)
+# (ad_id, viewer_id) -> результат fetch_ad_for_viewer
+AD_CACHE = TTLCache("ad_cache", maxsize=2000, ttl=LISTING_CACHE_TTL)
+_cache_generation = 0
+
+class NavStack:
+    """Останні відмальовані екрани кожного користувача для миттєвого повернення «Назад».
+
+    Екран зберігається під callback_data, яка його відкриває, разом зі значеннями
+    NAV_STATE_KEYS після його відмальовування. Обмеження: NAV_DEPTH екранів на користувача, max_bytes на всіх
+    (витісняються найдавніші екрани найдавніше активних користувачів) і TTL.
+    """
+
+    def __init__(self, depth: int, max_bytes: int, ttl: float):
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._users: OrderedDict = OrderedDict()  # user_id -> OrderedDict(route -> (expires_at, size, screen, state))
+
+    def get(self, user_id: int, route: str):
+        screens = self._users.get(user_id)
+        item = screens.get(route) if screens else None
+        if item is None:
+            CACHE_LOOKUPS_TOTAL.labels("nav_stack", "miss").inc()
+            return None
+        expires_at, size, screen, state = item
+        if expires_at < time.monotonic():
+            self._drop(user_id, route)
+            CACHE_LOOKUPS_TOTAL.labels("nav_stack", "miss").inc()
+            return None
+        self._users.move_to_end(user_id)
+        CACHE_LOOKUPS_TOTAL.labels("nav_stack", "hit").inc()
+        return screen, state
+
+    def push(self, user_id: int, route: str, screen: dict, state: dict):
+        size = len(screen['text'].encode()) + len(repr(screen['markup'].to_dict()) if screen['markup'] else "")
+        if size > self.max_bytes:
+            return
+        self._drop(user_id, route)
+        screens = self._users.setdefault(user_id, OrderedDict())
+        screens[route] = (time.monotonic() + self.ttl, size, screen, state)
+        self._users.move_to_end(user_id)
+        self.size += size
+        while len(screens) > self.depth:
+            self._drop(user_id, next(iter(screens)))
+        while self.size > self.max_bytes:
+            oldest_user, oldest_screens = next(iter(self._users.items()))
+            self._drop(oldest_user, next(iter(oldest_screens)))
+
+    def clear(self, user_id: int | None = None):
+        if user_id is None:
+            self._users.clear()
+            self.size = 0
+        else:
+            for route in list(self._users.get(user_id, ())):
+                self._drop(user_id, route)
+
+    def discard(self, match):
+        for user_id, screens in list(self._users.items()):
+            for route in [r for r in screens if match(user_id, r)]:
+                self._drop(user_id, route)
+
+    def _drop(self, user_id: int, route: str):
+        screens = self._users.get(user_id)
+        if not screens or route not in screens:
+            return
+        self.size -= screens.pop(route)[1]
+        if not screens:
+            del self._users[user_id]
+
+NAV_STACK = NavStack(depth=NAV_DEPTH, max_bytes=NAV_MAX_BYTES, ttl=NAV_TTL)
+
+# маршрути екранів NAV_STACK, що залежать від категорії чи оголошення; решта («Мої …») — лише від користувача
+RE_NAV_LIST_ROUTE = re.compile(r"^(?:all_ads|top_ads|top_cities|price_ads|search|city_.+)_([^_]+)_\d+$")
+RE_NAV_AD_ROUTE = re.compile(r"^show_ad_(\d+)\|[^|]*\|[^|]*\|([^|]*)$")
+
+def nav_route_scope(route: str) -> tuple[str | None, int | None]:
+    if m := RE_NAV_AD_ROUTE.match(route):
+        return m.group(2), int(m.group(1))
+    if m := RE_NAV_LIST_ROUTE.match(route):
+        return m.group(1), None
+    return None, None
+
+def invalidate_read_caches(categories=(), ad_ids=(), user_ids=()):
+    """Скидає списки, картки й екрани «Назад», які міг змінити запис.
+
+    categories — списки цих категорій і картки в них (там же нік і рейтинг авторів);
+    ad_ids — картки цих оголошень; user_ids — картки, які бачили ці користувачі, і всі їхні екрани.
+    Без аргументів скидає все — для фонових звірок, що зачіпають невідомо які записи.
+    """
+    global _cache_generation
+    _cache_generation += 1
+    if not (categories or ad_ids or user_ids):
+        LISTING_CACHE.clear()
+        AD_CACHE.clear()
+        NAV_STACK.clear()
+        return
+    categories, ad_ids, user_ids = set(categories), set(ad_ids), set(user_ids)
+
+    def nav_match(user_id: int, route: str) -> bool:
+        category, ad_id = nav_route_scope(route)
+        return user_id in user_ids or category in categories or ad_id in ad_ids
+
+    # ключ списку — (ім'я функції, *аргументи), і категорія завжди серед аргументів
+    LISTING_CACHE.discard(lambda key, rows: not categories.isdisjoint(key[1:]))
+    AD_CACHE.discard(lambda key, ad: key[0] in ad_ids or key[1] in user_ids or ad['category'] in categories)
+    NAV_STACK.discard(nav_match)
+
+def cached_listing(fn, *args):
+    key = (fn.__name__,) + args
+    rows = LISTING_CACHE.get(key)
+    if rows is None:
+        rows = fn(*args)
+        LISTING_CACHE.set(key, rows)
+    return rows
+
+# ====== Попереднє завантаження ======
+# фонові запити йдуть в окремому пулі й ніколи не чекають: якщо бюджет вичерпано, прогрів пропускається
+_prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_BUDGET, thread_name_prefix="prefetch")
+_prefetch_inflight = 0
+
+def prefetch(load: Callable[[], Any], store: Callable[[Any], None]):
+    """Виконує load() у фоновому потоці й передає результат у store() в потоці event loop."""
+    global _prefetch_inflight
+    if _prefetch_inflight >= PREFETCH_BUDGET:
+        return
+    _prefetch_inflight += 1
+    generation = _cache_generation
+
+    def done(fut):
+        global _prefetch_inflight
+        _prefetch_inflight -= 1
+        if fut.cancelled():
+            return
+        if fut.exception():
+            logger.debug(f"[prefetch] {fut.exception()!r}")
+            return
+        # запис між стартом і завершенням робить результат застарілим
+        if generation == _cache_generation:
+            store(fut.result())
+
+    asyncio.get_running_loop().run_in_executor(_prefetch_pool, load).add_done_callback(done)
+
+def prefetch_listing(fn, *args):
+    key = (fn.__name__,) + args
+    if LISTING_CACHE.get(key) is None:
+        prefetch(lambda: fn(*args), lambda rows: LISTING_CACHE.set(key, rows))
+
+def prefetch_ad_cards(ads: list[dict], viewer_id: int):
+    ids = [ad['id'] for ad in ads if AD_CACHE.get((ad['id'], viewer_id)) is None]
+    if not ids:
+        return
+
+    def store(cards):
+        for card in cards:
+            if card:
+                AD_CACHE.set((card['id'], viewer_id), card)
+
+    prefetch(lambda: [fetch_ad_for_viewer(ad_id, viewer_id) for ad_id in ids], store)
+
 # --- DATABASE ---
 
+SCHEMA_SQL = """
+    ALTER TABLE ads
+      ADD COLUMN IF NOT EXISTS search_tsv tsvector
+      GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(city, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+      ) STORED;
+    CREATE INDEX IF NOT EXISTS ads_search_tsv_idx ON ads USING GIN (search_tsv);
+
+    ALTER TABLE ads ADD COLUMN IF NOT EXISTS price_min      NUMERIC(12, 2);
+    ALTER TABLE ads ADD COLUMN IF NOT EXISTS price_max      NUMERIC(12, 2);
+    ALTER TABLE ads ADD COLUMN IF NOT EXISTS price_currency VARCHAR(3);
+    ALTER TABLE ads ADD COLUMN IF NOT EXISTS price_parser   SMALLINT;
+    CREATE INDEX IF NOT EXISTS ads_category_price_idx ON ads (category, price_min, id);
+
+    CREATE TABLE IF NOT EXISTS cities (
+      id   SERIAL PRIMARY KEY,
+      name VARCHAR(70) NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS city_aliases (
+      alias   VARCHAR(140) PRIMARY KEY,
+      city_id INTEGER NOT NULL REFERENCES cities(id) ON DELETE CASCADE
+    );
+    ALTER TABLE ads ADD COLUMN IF NOT EXISTS city_id INTEGER REFERENCES cities(id);
+    CREATE INDEX IF NOT EXISTS ads_city_id_idx ON ads (city_id, category, created_at DESC);
+
+    CREATE TABLE IF NOT EXISTS city_stats (
+      category TEXT        NOT NULL,
+      city_id  INTEGER     NOT NULL REFERENCES cities(id) ON DELETE CASCADE,
+      city     VARCHAR(70) NOT NULL,
+      cnt      INTEGER     NOT NULL,
+      PRIMARY KEY (category, city_id)
+    );
+    CREATE INDEX IF NOT EXISTS city_stats_top_idx ON city_stats (category, cnt DESC, city);
+
+    -- порядок «спершу з коментарем, потім новіші» для сторінок відгуків про користувача
+    CREATE INDEX IF NOT EXISTS reviews_target_page_idx
+        ON reviews (target_id, (COALESCE(comment, '') <> '') DESC, created_at DESC, id DESC);
+
+    CREATE TABLE IF NOT EXISTS ads_listing (
+      ad_id          INTEGER PRIMARY KEY REFERENCES ads(id) ON DELETE CASCADE,
+      user_id        BIGINT      NOT NULL,
+      category       TEXT,
+      city_id        INTEGER,
+      city           VARCHAR(70),
+      price          VARCHAR(50),
+      price_min      NUMERIC(12, 2),
+      price_currency VARCHAR(3),
+      created_at     TIMESTAMPTZ NOT NULL,
+      bot_username   TEXT,
+      avg_rating     NUMERIC,
+      rank_key       BIGINT      NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ads_listing_recent_idx ON ads_listing (category, created_at DESC, ad_id DESC);
+    CREATE INDEX IF NOT EXISTS ads_listing_rank_idx   ON ads_listing (category, rank_key DESC, ad_id DESC);
+    CREATE INDEX IF NOT EXISTS ads_listing_city_idx   ON ads_listing (city_id, category, created_at DESC, ad_id DESC);
+    CREATE INDEX IF NOT EXISTS ads_listing_price_idx  ON ads_listing (category, price_min, ad_id);
+    CREATE INDEX IF NOT EXISTS ads_listing_user_idx   ON ads_listing (user_id);
+
+    -- accepted_cnt симетричний (однаковий у рядках (a, b) і (b, a)), reviews_cnt — відгуки a про b
+    CREATE TABLE IF NOT EXISTS pair_interactions (
+      user_a       BIGINT  NOT NULL,
+      user_b       BIGINT  NOT NULL,
+      accepted_cnt INTEGER NOT NULL DEFAULT 0,
+      reviews_cnt  INTEGER NOT NULL DEFAULT 0,
+      PRIMARY KEY (user_a, user_b)
+    );
+
+    CREATE TABLE IF NOT EXISTS user_ratings (
+      user_id BIGINT  PRIMARY KEY,
+      cnt     INTEGER NOT NULL DEFAULT 0,
+      total   INTEGER NOT NULL DEFAULT 0,
+      r1      INTEGER NOT NULL DEFAULT 0,
+      r2      INTEGER NOT NULL DEFAULT 0,
+      r3      INTEGER NOT NULL DEFAULT 0,
+      r4      INTEGER NOT NULL DEFAULT 0,
+      r5      INTEGER NOT NULL DEFAULT 0
+    );
+"""
+
+# агрегати user_ratings, виведені з reviews: спільні для init_db і reconcile_user_ratings
+USER_RATINGS_SQL = """
+    SELECT target_id AS user_id,
+           COUNT(*)                           AS cnt,
+           SUM(rating)                        AS total,
+           COUNT(*) FILTER (WHERE rating = 1) AS r1,
+           COUNT(*) FILTER (WHERE rating = 2) AS r2,
+           COUNT(*) FILTER (WHERE rating = 3) AS r3,
+           COUNT(*) FILTER (WHERE rating = 4) AS r4,
+           COUNT(*) FILTER (WHERE rating = 5) AS r5
+      FROM reviews
+     WHERE target_id IS NOT NULL
+     GROUP BY target_id
+"""
+
+# pair_interactions, виведені з прийнятих заявок (в обидва боки) і відгуків
+PAIR_INTERACTIONS_SQL = """
+    SELECT user_a, user_b,
+           SUM(accepted_cnt)::INTEGER AS accepted_cnt,
+           SUM(reviews_cnt)::INTEGER  AS reviews_cnt
+      FROM (
+            SELECT requester_id AS user_a, executor_id AS user_b, 1 AS accepted_cnt, 0 AS reviews_cnt
+              FROM applications WHERE status = 'accepted'
+            UNION ALL
+            SELECT executor_id, requester_id, 1, 0
+              FROM applications WHERE status = 'accepted'
+            UNION ALL
+            SELECT author_id, target_id, 0, 1 FROM reviews
+           ) t
+     WHERE user_a IS NOT NULL
+       AND user_b IS NOT NULL
+     GROUP BY user_a, user_b
+"""
+
+def init_db():
+    conn = db_connect(**DB_PARAMS)
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(SCHEMA_SQL)
+                seed_cities(cur)
+                refresh_ads_listing(cur, "NOT EXISTS (SELECT 1 FROM ads_listing l WHERE l.ad_id = a.id)")
+                # до першої звірки інкременти й перевірка права на відгук мають спиратися
+                # на повні агрегати, а не на порожні таблиці
+                cur.execute(f"""
+                    INSERT INTO user_ratings (user_id, cnt, total, r1, r2, r3, r4, r5)
+                    {USER_RATINGS_SQL}
+                    ON CONFLICT (user_id) DO NOTHING
+                """)
+                cur.execute(f"""
+                    INSERT INTO pair_interactions (user_a, user_b, accepted_cnt, reviews_cnt)
+                    {PAIR_INTERACTIONS_SQL}
+                    ON CONFLICT (user_a, user_b) DO NOTHING
+                """)
+    finally:
+        conn.close()
+
+@repository
 def bot_username_exists(nick: str) -> bool:
-    conn = psycopg2.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS)
+    conn = db_connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS)
     with conn, conn.cursor() as cur:
         cur.execute("SELECT 1 FROM users WHERE bot_username = %s", (nick,))
         return cur.fetchone() is not None
@@ -87,14 +1035,253 @@ def generate_bot_username(cur) -> str:
         if not cur.fetchone():
             return candidate
 
+def parse_price(text: str) -> tuple[Decimal | None, Decimal | None, str | None]:
+    """«2000 грн.» -> (2000, 2000, 'UAH'), «2000-3000₴» -> (2000, 3000, 'UAH'), «100$» -> (100, 100, 'USD')."""
+    numbers = []
+    for m in RE_PRICE_NUMBER.finditer(text or ""):
+        raw = m.group(1).replace(" ", "").replace("\u00a0", "").replace(",", ".")
+        try:
+            value = Decimal(raw)
+        except InvalidOperation:
+            continue
+        if m.group(2):
+            value *= 1000
+        if value < MAX_PRICE_VALUE:
+            numbers.append(value)
+        if len(numbers) == 2:
+            break
+
+    if not numbers:
+        return None, None, None
+
+    low = text.lower()
+    currency = next(
+        (code for code, marks in PRICE_CURRENCIES if any(mark in low for mark in marks)),
+        DEFAULT_CURRENCY
+    )
+    return min(numbers), max(numbers), currency
+
+def clean_city_name(text: str) -> str:
+    name = RE_CITY_PREFIX.sub("", " ".join(text.split()))
+    words = re.split(r'([ -])', name)
+    return "".join(w[:1].upper() + w[1:] for w in words)[:MAX_CITY_LEN]
+
+def city_key(text: str) -> str:
+    """«м. Київ», «київ », «Kyiv» -> «kyiv»: ключ для пошуку в city_aliases."""
+    name = RE_CITY_PREFIX.sub("", " ".join(text.lower().split()))
+    name = re.sub(r"[^\w -]|_", "", name).replace("-", " ")
+    return " ".join(name.split()).translate(CITY_TRANSLIT)
+
+def seed_cities(cur):
+    for name, aliases in CITY_ALIASES.items():
+        cur.execute("""
+            INSERT INTO cities (name) VALUES (%s)
+            ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+            RETURNING id
+        """, (name,))
+        city_id = cur.fetchone()[0]
+        cur.executemany("""
+            INSERT INTO city_aliases (alias, city_id) VALUES (%s, %s)
+            ON CONFLICT (alias) DO NOTHING
+        """, [(city_key(alias), city_id) for alias in (name, *aliases)])
+
+def lookup_cities(cur, texts, create: bool = True) -> dict[str, dict]:
+    """{city_key: {'id', 'name'}} для кількох назв одним запитом; cur — RealDictCursor."""
+    keys = {}
+    for text in texts:
+        key = city_key(text)
+        if key:
+            keys.setdefault(key, text)
+    if not keys:
+        return {}
+    cur.execute("""
+        SELECT al.alias, c.id, c.name
+          FROM city_aliases al
+          JOIN cities c ON c.id = al.city_id
+         WHERE al.alias = ANY(%s)
+    """, (list(keys),))
+    cities = {row['alias']: {'id': row['id'], 'name': row['name']} for row in cur.fetchall()}
+    if create:
+        for key, text in keys.items():
+            if key in cities:
+                continue
+            cur.execute("""
+                INSERT INTO cities (name) VALUES (%s)
+                ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+                RETURNING id, name
+            """, (clean_city_name(text),))
+            cities[key] = dict(cur.fetchone())
+            cur.execute("""
+                INSERT INTO city_aliases (alias, city_id) VALUES (%s, %s)
+                ON CONFLICT (alias) DO NOTHING
+            """, (key, cities[key]['id']))
+    for key, city in cities.items():
+        CITY_CACHE.set(key, city)
+        CITY_CACHE.set(city['id'], city)
+    return cities
+
+@repository
+def resolve_city(text: str, create: bool = True) -> dict | None:
+    """Повертає {'id', 'name'} канонічного міста; невідоме місто додається до довідника."""
+    key = city_key(text)
+    if not key:
+        return None
+    cached = CITY_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    conn = db_connect(**DB_PARAMS, cursor_factory=RealDictCursor)
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                return lookup_cities(cur, [text], create).get(key)
+    finally:
+        conn.close()
+
+@repository
+def fetch_city(city_id: int) -> dict | None:
+    cached = CITY_CACHE.get(city_id)
+    if cached is not None:
+        return cached
+    conn = db_connect(**DB_PARAMS, cursor_factory=RealDictCursor)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, name FROM cities WHERE id = %s", (city_id,))
+            city = cur.fetchone()
+    finally:
+        conn.close()
+    if city is not None:
+        city = dict(city)
+        CITY_CACHE.set(city_id, city)
+    return city
+
+def ad_participants(cur, ad_id: int) -> set[int]:
+    # оголошення видно в «Моїх оголошеннях» автора і в «Моїх заявках» обох сторін заявки
+    cur.execute("""
+        SELECT user_id FROM ads WHERE id = %(ad_id)s
+        UNION
+        SELECT unnest(ARRAY[requester_id, executor_id]) FROM applications WHERE ad_id = %(ad_id)s
+    """, {'ad_id': ad_id})
+    return {row[0] for row in cur.fetchall()}
+
+def author_categories(cur, user_id: int) -> list[str]:
+    # нік і рейтинг автора показуються в списках усіх категорій, де є його оголошення
+    cur.execute("SELECT DISTINCT category FROM ads WHERE user_id = %s", (user_id,))
+    return [row[0] for row in cur.fetchall()]
+
+def bump_city_stats(cur, category: str | None, city_id: int | None, delta: int):
+    # викликається в транзакції, що змінює ads, тож лічильники не розходяться з таблицею
+    if not category or not city_id:
+        return
+    cur.execute("""
+        INSERT INTO city_stats (category, city_id, city, cnt)
+        SELECT %s, id, name, %s FROM cities WHERE id = %s
+        ON CONFLICT (category, city_id) DO UPDATE
+           SET cnt = city_stats.cnt + EXCLUDED.cnt
+    """, (category, delta, city_id))
+    if delta < 0:
+        cur.execute("""
+            DELETE FROM city_stats
+             WHERE category = %s
+               AND city_id  = %s
+               AND cnt     <= 0
+        """, (category, city_id))
+
+def bump_pair_interactions(cur, user_a: int, user_b: int, accepted: int = 0, reviews: int = 0):
+    # прийнята заявка рахується в обидва боки, відгук — лише від автора до адресата
+    rows = [(user_a, user_b, accepted, reviews)]
+    if accepted:
+        rows.append((user_b, user_a, accepted, 0))
+    # однаковий порядок блокувань для зустрічних оновлень однієї пари
+    for row in sorted(rows):
+        cur.execute("""
+            INSERT INTO pair_interactions (user_a, user_b, accepted_cnt, reviews_cnt)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (user_a, user_b) DO UPDATE
+               SET accepted_cnt = pair_interactions.accepted_cnt + EXCLUDED.accepted_cnt,
+                   reviews_cnt  = pair_interactions.reviews_cnt  + EXCLUDED.reviews_cnt
+        """, row)
+    if accepted < 0 or reviews < 0:
+        cur.execute("""
+            DELETE FROM pair_interactions
+             WHERE (user_a, user_b) IN ((%s, %s), (%s, %s))
+               AND accepted_cnt <= 0
+               AND reviews_cnt  <= 0
+        """, (user_a, user_b, user_b, user_a))
+
+def bump_user_rating(cur, user_id: int, rating: int, delta: int):
+    # викликається в транзакції, що змінює reviews; оновлює агрегат, users.avg_rating і видачу
+    cur.execute("""
+        INSERT INTO user_ratings (user_id, cnt, total, r1, r2, r3, r4, r5)
+        VALUES (
+          %(user_id)s, %(delta)s, %(delta)s * %(rating)s,
+          CASE WHEN %(rating)s = 1 THEN %(delta)s ELSE 0 END,
+          CASE WHEN %(rating)s = 2 THEN %(delta)s ELSE 0 END,
+          CASE WHEN %(rating)s = 3 THEN %(delta)s ELSE 0 END,
+          CASE WHEN %(rating)s = 4 THEN %(delta)s ELSE 0 END,
+          CASE WHEN %(rating)s = 5 THEN %(delta)s ELSE 0 END
+        )
+        ON CONFLICT (user_id) DO UPDATE
+           SET cnt   = user_ratings.cnt   + EXCLUDED.cnt,
+               total = user_ratings.total + EXCLUDED.total,
+               r1    = user_ratings.r1    + EXCLUDED.r1,
+               r2    = user_ratings.r2    + EXCLUDED.r2,
+               r3    = user_ratings.r3    + EXCLUDED.r3,
+               r4    = user_ratings.r4    + EXCLUDED.r4,
+               r5    = user_ratings.r5    + EXCLUDED.r5
+        RETURNING cnt, total
+    """, {'user_id': user_id, 'rating': rating, 'delta': delta})
+    cnt, total = cur.fetchone()
+    cur.execute("""
+        UPDATE users
+           SET avg_rating = %s
+         WHERE id = %s
+    """, (round(total / cnt, 2) if cnt > 0 else 0, user_id))
+    refresh_ads_listing(cur, "a.user_id = %s", (user_id,))
+
+def refresh_ads_listing(cur, where: str, params: tuple = ()) -> int:
+    """Переносить оголошення, що відповідають умові where (аліас ads — «a»), у ads_listing."""
+    # rank_key: рейтинг автора (2 знаки) у старших розрядах, час створення — у молодших,
+    # тож сортування «за рейтингом, потім новіші» обслуговується одним індексом
+    cur.execute(f"""
+        INSERT INTO ads_listing (ad_id, user_id, category, city_id, city, price, price_min,
+                                 price_currency, created_at, bot_username, avg_rating, rank_key)
+        SELECT
+          a.id, a.user_id, a.category, a.city_id, a.city, a.price, a.price_min,
+          a.price_currency, a.created_at, u.bot_username, u.avg_rating,
+          ROUND(COALESCE(u.avg_rating, 0) * 100)::BIGINT * 10000000000
+            + EXTRACT(EPOCH FROM a.created_at)::BIGINT
+        FROM ads a
+        JOIN users u ON u.id = a.user_id
+        WHERE {where}
+        ON CONFLICT (ad_id) DO UPDATE
+           SET user_id        = EXCLUDED.user_id,
+               category       = EXCLUDED.category,
+               city_id        = EXCLUDED.city_id,
+               city           = EXCLUDED.city,
+               price          = EXCLUDED.price,
+               price_min      = EXCLUDED.price_min,
+               price_currency = EXCLUDED.price_currency,
+               created_at     = EXCLUDED.created_at,
+               bot_username   = EXCLUDED.bot_username,
+               avg_rating     = EXCLUDED.avg_rating,
+               rank_key       = EXCLUDED.rank_key
+         WHERE (ads_listing.*) IS DISTINCT FROM (EXCLUDED.*)
+    """, params)
+    return cur.rowcount
+
+@repository
 def save_ad(ad: dict, user_id: int):
     city = ad['city'][:MAX_CITY_LEN]
     price = ad['price'][:MAX_PRICE_LEN]
     desc  = ad['desc'][:MAX_DESC_LEN]
     photo = ad.get('photo_id')
     category = ad.get('category')
+    price_min, price_max, currency = parse_price(price)
+    city_row = resolve_city(city)
+    city_id = city_row['id'] if city_row else None
 
-    conn = psycopg2.connect(
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS
     )
@@ -102,15 +1289,24 @@ def save_ad(ad: dict, user_id: int):
         with conn.cursor() as cur:
             cur.execute(
                 """
-                INSERT INTO ads (user_id, city, price, description, photo_id, category)
-                VALUES (%s, %s, %s, %s, %s, %s)
+                INSERT INTO ads (user_id, city, city_id, price, description, photo_id, category,
+                                 price_min, price_max, price_currency, price_parser)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
                 """,
-                (user_id, city, price, desc, photo, category)
+                (user_id, city, city_id, price, desc, photo, category, price_min, price_max, currency,
+                 PRICE_PARSER_VERSION)
             )
+            ad_id = cur.fetchone()[0]
+            bump_city_stats(cur, category, city_id, 1)
+            refresh_ads_listing(cur, "a.id = %s", (ad_id,))
     conn.close()
+    INLINE_CACHE.clear()
+    invalidate_read_caches(categories=[category], user_ids=[user_id])
 
-def fetch_ads(category: str):
-    conn = psycopg2.connect(
+@repository
+def fetch_ads(category: str, limit: int = PAGE_SIZE, offset: int = 0):
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS,
         cursor_factory=RealDictCursor
@@ -118,26 +1314,35 @@ def fetch_ads(category: str):
     with conn, conn.cursor() as cur:
         cur.execute("""
             SELECT
-              a.id,
-              a.city,
-              a.price,
-              a.created_at,
-              u.id AS user_id,
-              u.username,
-              u.full_name,
-              u.bot_username,
-              u.avg_rating 
-            FROM ads a
-            JOIN users u ON a.user_id = u.id
-            WHERE a.category = %s
-            ORDER BY a.created_at DESC
-        """, (category,))
+              ad_id AS id,
+              city,
+              price,
+              created_at,
+              user_id,
+              bot_username,
+              avg_rating
+            FROM ads_listing
+            WHERE category = %s
+            ORDER BY created_at DESC, ad_id DESC
+            LIMIT %s OFFSET %s
+        """, (category, limit, offset))
         rows = cur.fetchall()
     conn.close()
     return rows
 
+@repository
+def count_ads(category: str) -> int:
+    conn = db_connect(**DB_PARAMS)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM ads_listing WHERE category = %s", (category,))
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+@repository
 def fetch_ad_by_id(ad_id: int):
-    conn = psycopg2.connect(
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS,
         cursor_factory=RealDictCursor
@@ -177,8 +1382,75 @@ def fetch_ad_by_id(ad_id: int):
     }
     return ad
 
+@repository
+def fetch_ad_for_viewer(ad_id: int, viewer_id: int) -> dict | None:
+    """Як fetch_ad_by_id, але додає ad['viewer'] — стан оголошення для конкретного користувача."""
+    conn = db_connect(**DB_PARAMS, cursor_factory=RealDictCursor)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT
+                  a.id,
+                  a.city,
+                  a.price,
+                  a.description AS desc,
+                  a.photo_id,
+                  a.created_at,
+                  a.category,
+                  u.id   AS author_id,
+                  u.username,
+                  u.full_name,
+                  u.bot_username,
+                  u.avg_rating,
+                  EXISTS (
+                    SELECT 1 FROM applications ap
+                     WHERE ap.ad_id = a.id
+                       AND ap.requester_id = %(viewer)s
+                       AND ap.status = 'pending'
+                  ) AS pending,
+                  EXISTS (
+                    SELECT 1 FROM user_subscriptions us
+                     WHERE us.subscriber_id = %(viewer)s
+                       AND us.author_id     = a.user_id
+                  ) AS subscribed_author,
+                  EXISTS (
+                    SELECT 1 FROM category_subscriptions cs
+                     WHERE cs.subscriber_id = %(viewer)s
+                       AND cs.category      = a.category
+                  ) AS subscribed_category,
+                  COALESCE(p.accepted_cnt > p.reviews_cnt, FALSE) AS can_review
+                FROM ads a
+                JOIN users u ON a.user_id = u.id
+                LEFT JOIN pair_interactions p
+                       ON p.user_a = %(viewer)s
+                      AND p.user_b = a.user_id
+                WHERE a.id = %(ad_id)s
+            """, {'ad_id': ad_id, 'viewer': viewer_id})
+            ad = cur.fetchone()
+    finally:
+        conn.close()
+
+    if not ad:
+        return None
+
+    ad['author'] = {
+        'id': ad.pop('author_id'),
+        'username': ad.pop('username'),
+        'full_name': ad.pop('full_name'),
+        'bot_username': ad.pop('bot_username'),
+        'avg_rating': ad.pop('avg_rating')
+    }
+    ad['viewer'] = {
+        'pending': ad.pop('pending'),
+        'subscribed_author': ad.pop('subscribed_author'),
+        'subscribed_category': ad.pop('subscribed_category'),
+        'can_review': ad.pop('can_review')
+    }
+    return ad
+
+@repository
 def fetch_user_by_id(user_id: int) -> dict:
-    conn = psycopg2.connect(
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS,
         cursor_factory=RealDictCursor
@@ -192,8 +1464,9 @@ def fetch_user_by_id(user_id: int) -> dict:
             """, (user_id,))
             return cur.fetchone()
 
+@repository
 def save_user(tg_user: User):
-    conn = psycopg2.connect(
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS
     )
@@ -237,123 +1510,111 @@ def save_user(tg_user: User):
                 )
     conn.close()
 
-def fetch_distinct_cities(prefix: str, limit: int = 10, category: str = None) -> list[str]:
-    conn = psycopg2.connect(
+@repository
+def fetch_distinct_cities(prefix: str, limit: int = 10, category: str = None) -> list[dict]:
+    # збіг з початком будь-якого слова в назві чи її варіанті: «риг» -> «Кривий Ріг»
+    key = city_key(prefix)
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS,
         cursor_factory=RealDictCursor
     )
     with conn:
         with conn.cursor() as cur:
-            if category:
-                cur.execute("""
-                    SELECT
-                      city,
-                      COUNT(*) AS cnt
-                    FROM ads
-                    WHERE city ILIKE %s
-                      AND LOWER(category) = LOWER(%s)
-                    GROUP BY city
-                    ORDER BY cnt DESC, city ASC
-                    LIMIT %s
-                """, (f"%{prefix}%", category, limit))
-            else:
-                cur.execute("""
-                    SELECT
-                      city,
-                      COUNT(*) AS cnt
-                    FROM ads
-                    WHERE city ILIKE %s
-                    GROUP BY city
-                    ORDER BY cnt DESC, city ASC
-                    LIMIT %s
-                """, (f"%{prefix}%", limit))
+            cur.execute("""
+                SELECT
+                  s.city_id,
+                  s.city,
+                  SUM(s.cnt) AS cnt,
+                  (SELECT array_agg(alias) FROM city_aliases WHERE city_id = s.city_id) AS aliases
+                FROM city_stats s
+                WHERE s.city_id IN (
+                        SELECT city_id
+                          FROM city_aliases
+                         WHERE alias LIKE %s OR alias LIKE %s
+                      )
+                  AND (%s IS NULL OR s.category = %s)
+                GROUP BY s.city_id, s.city
+                ORDER BY cnt DESC, s.city ASC
+                LIMIT %s
+            """, (f"{key}%", f"% {key}%", category, category, limit))
             rows = cur.fetchall()
     conn.close()
 
-    return [row['city'] for row in rows]
+    return rows
 
-def fetch_ads_by_city(city: str, category: str = None):
-    conn = psycopg2.connect(
+@repository
+def fetch_ads_by_city(city_id: int, category: str, limit: int = PAGE_SIZE, offset: int = 0):
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS,
         cursor_factory=RealDictCursor
     )
     with conn:
         with conn.cursor() as cur:
-            if category:
-                cur.execute("""
-                    SELECT
-                      a.id,
-                      a.city,
-                      a.price,
-                      a.description AS desc,
-                      a.photo_id,
-                      a.created_at,
-                      u.id   AS author_id,
-                      u.username,
-                      u.full_name,
-                      u.bot_username,
-                      u.avg_rating
-                    FROM ads a
-                    JOIN users u ON a.user_id = u.id
-                    WHERE LOWER(a.city) = LOWER(%s)
-                      AND LOWER(a.category) = LOWER(%s)
-                    ORDER BY a.created_at DESC
-                """, (city, category))
-            else:
-                cur.execute("""
-                    SELECT
-                      a.id,
-                      a.city,
-                      a.price,
-                      a.description AS desc,
-                      a.photo_id,
-                      a.created_at,
-                      u.id   AS author_id,
-                      u.username,
-                      u.full_name,
-                      u.bot_username,
-                      u.avg_rating
-                    FROM ads a
-                    JOIN users u ON a.user_id = u.id
-                    WHERE LOWER(a.city) = LOWER(%s)
-                    ORDER BY a.created_at DESC
-                """, (city,))
+            cur.execute("""
+                SELECT
+                  ad_id AS id,
+                  city,
+                  price,
+                  created_at,
+                  user_id,
+                  bot_username,
+                  avg_rating
+                FROM ads_listing
+                WHERE city_id = %s
+                  AND category = %s
+                ORDER BY created_at DESC, ad_id DESC
+                LIMIT %s OFFSET %s
+            """, (city_id, category, limit, offset))
             ads = cur.fetchall()
     conn.close()
-
-    for ad in ads:
-        ad['author'] = {
-            'id': ad.pop('author_id'),
-            'username': ad.pop('username'),
-            'full_name': ad.pop('full_name'),
-            'bot_username': ad.pop('bot_username'),
-            'avg_rating': ad.pop('avg_rating'),
-        }
     return ads
 
-def fetch_top_cities_list(category: str, top_n: int = None):
-    conn = psycopg2.connect(
+@repository
+def count_ads_by_city(city_id: int, category: str) -> int:
+    conn = db_connect(**DB_PARAMS)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT cnt
+                  FROM city_stats
+                 WHERE category = %s
+                   AND city_id  = %s
+            """, (category, city_id))
+            row = cur.fetchone()
+            return row[0] if row else 0
+    finally:
+        conn.close()
+
+@repository
+def fetch_top_cities_list(category: str | None, top_n: int = None, offset: int = 0):
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS,
         cursor_factory=RealDictCursor
     )
     with conn, conn.cursor() as cur:
-        sql = """
-            SELECT
-                city,
-                COUNT(*) AS cnt
-            FROM ads
-            WHERE category = %s
-            GROUP BY city
-            ORDER BY cnt DESC, city ASC
-        """
-        params = [category]
+        if category:
+            sql = """
+                SELECT city_id, city, cnt
+                  FROM city_stats
+                 WHERE category = %s
+                 ORDER BY cnt DESC, city ASC
+            """
+            params = [category]
+        else:
+            sql = """
+                SELECT city_id, city, SUM(cnt) AS cnt
+                  FROM city_stats
+                 GROUP BY city_id, city
+                 ORDER BY cnt DESC, city ASC
+            """
+            params = []
 
         if top_n:
-            sql += " LIMIT %s"
-            params.append(top_n)
+            sql += " LIMIT %s OFFSET %s"
+            params += [top_n, offset]
 
         cur.execute(sql, params)
         rows = cur.fetchall()
@@ -361,8 +1622,19 @@ def fetch_top_cities_list(category: str, top_n: int = None):
     conn.close()
     return rows
 
-def fetch_top_ads_list(category: str, limit: int = 100):
-    conn = psycopg2.connect(
+@repository
+def count_top_cities(category: str) -> int:
+    conn = db_connect(**DB_PARAMS)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM city_stats WHERE category = %s", (category,))
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+@repository
+def fetch_top_ads_list(category: str, limit: int = PAGE_SIZE, offset: int = 0):
+    conn = db_connect(
         host=DB_HOST,
         dbname=DB_NAME,
         user=DB_USER,
@@ -371,33 +1643,29 @@ def fetch_top_ads_list(category: str, limit: int = 100):
     )
     try:
         with conn.cursor() as cur:
-            cur.execute(f"""
+            cur.execute("""
                 SELECT
-                  a.id,
-                  a.city,
-                  a.price,
-                  a.created_at,
-                  u.username,
-                  u.full_name,
-                  u.bot_username,
-                  u.id AS user_id,
-                  u.avg_rating
-                FROM ads a
-                JOIN users u ON a.user_id = u.id
-                WHERE a.category = %s
-                ORDER BY
-                  u.avg_rating DESC,
-                  a.created_at DESC
-                LIMIT %s
-            """, (category, limit))
+                  ad_id AS id,
+                  city,
+                  price,
+                  created_at,
+                  bot_username,
+                  user_id,
+                  avg_rating
+                FROM ads_listing
+                WHERE category = %s
+                ORDER BY rank_key DESC, ad_id DESC
+                LIMIT %s OFFSET %s
+            """, (category, limit, offset))
             rows = cur.fetchall()
     finally:
         conn.close()
 
     return rows
 
+@repository
 def fetch_ads_by_user(user_id: int) -> list[dict]:
-    conn = psycopg2.connect(
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS,
         cursor_factory=RealDictCursor
@@ -423,31 +1691,76 @@ def fetch_ads_by_user(user_id: int) -> list[dict]:
 
     return ads
 
+@repository
 def update_ad(ad: dict, ad_id: int):
     city = ad['city'][:MAX_CITY_LEN]
     price = ad['price'][:MAX_PRICE_LEN]
     desc  = ad['desc'][:MAX_DESC_LEN]
     photo = ad.get('photo_id')
     category = ad.get('category')
-    conn = psycopg2.connect(
+    price_min, price_max, currency = parse_price(price)
+    city_row = resolve_city(city)
+    city_id = city_row['id'] if city_row else None
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS
     )
     with conn:
         with conn.cursor() as cur:
+            cur.execute("SELECT category, city_id FROM ads WHERE id = %s FOR UPDATE", (ad_id,))
+            old = cur.fetchone()
+            users = ad_participants(cur, ad_id)
             cur.execute("""
                 UPDATE ads
-                   SET city        = %s,
-                       price       = %s,
-                       description = %s,
-                       photo_id    = %s,
-                       category    = %s
+                   SET city           = %s,
+                       city_id        = %s,
+                       price          = %s,
+                       description    = %s,
+                       photo_id       = %s,
+                       category       = %s,
+                       price_min      = %s,
+                       price_max      = %s,
+                       price_currency = %s,
+                       price_parser   = %s
                  WHERE id = %s
-            """, (city, price, desc, photo, category, ad_id))
+            """, (city, city_id, price, desc, photo, category, price_min, price_max, currency,
+                  PRICE_PARSER_VERSION, ad_id))
+            if old and old != (category, city_id):
+                bump_city_stats(cur, old[0], old[1], -1)
+                bump_city_stats(cur, category, city_id, 1)
+            refresh_ads_listing(cur, "a.id = %s", (ad_id,))
     conn.close()
+    INLINE_CACHE.clear()
+    invalidate_read_caches(categories=[category, old[0]] if old else [category], ad_ids=[ad_id], user_ids=users)
+
+@repository
+def delete_ad(ad_id: int):
+    conn = db_connect(**DB_PARAMS)
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                # прийняті заявки видаляються каскадом разом з оголошенням
+                cur.execute("""
+                    SELECT requester_id, executor_id
+                      FROM applications
+                     WHERE ad_id = %s
+                       AND status = 'accepted'
+                """, (ad_id,))
+                for requester_id, executor_id in cur.fetchall():
+                    bump_pair_interactions(cur, requester_id, executor_id, accepted=-1)
+                users = ad_participants(cur, ad_id)
+                cur.execute("DELETE FROM ads WHERE id = %s RETURNING category, city_id", (ad_id,))
+                row = cur.fetchone()
+                if row:
+                    bump_city_stats(cur, row[0], row[1], -1)
+    finally:
+        conn.close()
+    INLINE_CACHE.clear()
+    invalidate_read_caches(categories=[row[0]] if row else [], ad_ids=[ad_id], user_ids=users)
 
+@repository
 def save_review(review: dict):
-    conn = psycopg2.connect(
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS
     )
@@ -466,10 +1779,34 @@ def save_review(review: dict):
                     review.get('comment')
                 )
             )
+            bump_user_rating(cur, review['target_id'], review['rating'], 1)
+            bump_pair_interactions(cur, review['author_id'], review['target_id'], reviews=1)
+            categories = author_categories(cur, review['target_id'])
     conn.close()
+    invalidate_read_caches(categories=categories, user_ids=[review['author_id'], review['target_id']])
 
+@repository
+def delete_review(review_id: int):
+    conn = db_connect(
+        host=DB_HOST, dbname=DB_NAME,
+        user=DB_USER, password=DB_PASS
+    )
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM reviews WHERE id = %s RETURNING author_id, target_id, rating", (review_id,))
+            row = cur.fetchone()
+            if row:
+                author_id, target_id, rating = row
+                bump_user_rating(cur, target_id, rating, -1)
+                bump_pair_interactions(cur, author_id, target_id, reviews=-1)
+                categories = author_categories(cur, target_id)
+    conn.close()
+    if row:
+        invalidate_read_caches(categories=categories, user_ids=[author_id, target_id])
+
+@repository
 def fetch_reviews_by_author(author_id: int) -> list[dict]:
-    conn = psycopg2.connect(
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS,
         cursor_factory=RealDictCursor
@@ -499,8 +1836,9 @@ def fetch_reviews_by_author(author_id: int) -> list[dict]:
 
     return rows
 
+@repository
 def fetch_review_by_id(review_id: int) -> dict | None:
-    conn = psycopg2.connect(
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS,
         cursor_factory=RealDictCursor
@@ -537,8 +1875,26 @@ def fetch_review_by_id(review_id: int) -> dict | None:
     }
     return row
 
-def fetch_reviews_for_user(target_id: int) -> list[dict]:
-    conn = psycopg2.connect(
+@repository
+def fetch_user_rating(user_id: int) -> dict:
+    conn = db_connect(**DB_PARAMS, cursor_factory=RealDictCursor)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT cnt, total, r1, r2, r3, r4, r5
+                  FROM user_ratings
+                 WHERE user_id = %s
+            """, (user_id,))
+            row = cur.fetchone()
+    finally:
+        conn.close()
+    rating = dict(row) if row else {'cnt': 0, 'total': 0, 'r1': 0, 'r2': 0, 'r3': 0, 'r4': 0, 'r5': 0}
+    rating['avg'] = rating['total'] / rating['cnt'] if rating['cnt'] else 0.0
+    return rating
+
+@repository
+def fetch_reviews_for_user(target_id: int, limit: int = PAGE_SIZE, offset: int = 0) -> list[dict]:
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS,
         cursor_factory=RealDictCursor
@@ -560,8 +1916,9 @@ def fetch_reviews_for_user(target_id: int) -> list[dict]:
                     FROM reviews r
                     JOIN users u ON r.author_id = u.id
                     WHERE r.target_id = %s
-                    ORDER BY r.created_at DESC
-                """, (target_id,))
+                    ORDER BY (COALESCE(r.comment, '') <> '') DESC, r.created_at DESC, r.id DESC
+                    LIMIT %s OFFSET %s
+                """, (target_id, limit, offset))
                 rows = cur.fetchall()
     finally:
         conn.close()
@@ -575,8 +1932,9 @@ def fetch_reviews_for_user(target_id: int) -> list[dict]:
         }
     return rows
 
+@repository
 def has_applied(ad_id: int, user_id: int) -> bool:
-    conn = psycopg2.connect(host=DB_HOST, dbname=DB_NAME,
+    conn = db_connect(host=DB_HOST, dbname=DB_NAME,
                             user=DB_USER, password=DB_PASS,
                             cursor_factory=RealDictCursor)
     try:
@@ -591,8 +1949,9 @@ def has_applied(ad_id: int, user_id: int) -> bool:
     finally:
         conn.close()
 
+@repository
 def save_application(ad_id: int, requester_id: int, executor_id: int) -> int:
-    conn = psycopg2.connect(
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS,
         cursor_factory=RealDictCursor
@@ -609,15 +1968,16 @@ def save_application(ad_id: int, requester_id: int, executor_id: int) -> int:
                     """,
                     (ad_id, requester_id, executor_id)
                 )
-                return cur.fetchone()['id']
+                app_id = cur.fetchone()['id']
     finally:
         conn.close()
+    invalidate_read_caches(user_ids=[requester_id, executor_id])
+    return app_id
 
-def update_application_status(app_id: int, new_status: str):
-    conn = psycopg2.connect(
-        host=DB_HOST, dbname=DB_NAME,
-        user=DB_USER, password=DB_PASS
-    )
+@repository
+def transition_application(app_id: int, new_status: str, from_status: str = 'pending') -> dict | None:
+    """Переводить заявку з from_status у new_status; None, якщо заявки немає або її вже оброблено."""
+    conn = db_connect(**DB_PARAMS, cursor_factory=RealDictCursor)
     try:
         with conn:
             with conn.cursor() as cur:
@@ -627,14 +1987,23 @@ def update_application_status(app_id: int, new_status: str):
                        SET status = %s,
                            updated_at = CURRENT_TIMESTAMP
                      WHERE id = %s
+                       AND status = %s
+                    RETURNING requester_id, executor_id, ad_id
                     """,
-                    (new_status, app_id)
+                    (new_status, app_id, from_status)
                 )
+                row = cur.fetchone()
+                if row and new_status == 'accepted':
+                    bump_pair_interactions(cur, row['requester_id'], row['executor_id'], accepted=1)
     finally:
         conn.close()
+    if row:
+        invalidate_read_caches(user_ids=[row['requester_id'], row['executor_id']])
+    return row
 
+@repository
 def fetch_application(app_id: int) -> dict | None:
-    conn = psycopg2.connect(
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS,
         cursor_factory=RealDictCursor
@@ -646,8 +2015,9 @@ def fetch_application(app_id: int) -> dict | None:
     finally:
         conn.close()
 
+@repository
 def has_completed_application(requester_id: int, executor_id: int) -> bool:
-    conn = psycopg2.connect(
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS,
         cursor_factory=RealDictCursor
@@ -669,82 +2039,28 @@ def has_completed_application(requester_id: int, executor_id: int) -> bool:
     finally:
         conn.close()
 
-def has_pending_application(ad_id: int, user_id: int) -> bool:
-    conn = psycopg2.connect(
-        host=DB_HOST,
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASS,
-        cursor_factory=RealDictCursor
-    )
-    try:
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT EXISTS(
-                        SELECT 1
-                          FROM applications
-                         WHERE ad_id = %s
-                           AND requester_id = %s
-                           AND status = 'pending'
-                    )
-                    """,
-                    (ad_id, user_id)
-                )
-                return cur.fetchone()['exists']
-    finally:
-        conn.close()
-
-def count_accepted_applications(author_id: int, target_id: int) -> int:
-    conn = psycopg2.connect(
-        host=DB_HOST, dbname=DB_NAME,
-        user=DB_USER, password=DB_PASS,
-        cursor_factory=RealDictCursor
-    )
+@repository
+def fetch_review_eligibility(ad_id: int, author_id: int, target_id: int) -> dict:
+    conn = db_connect(**DB_PARAMS, cursor_factory=RealDictCursor)
     try:
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT COUNT(*) AS cnt
-                      FROM applications
-                     WHERE status = 'accepted'
-                       AND (
-                             (requester_id = %s AND executor_id  = %s)
-                          OR (requester_id = %s AND executor_id  = %s)
-                           )
-                    """,
-                    (author_id, target_id, target_id, author_id)
-                )
-                return cur.fetchone()['cnt']
-    finally:
-        conn.close()
-
-def count_reviews_by_author_for_executor(author_id: int, target_id: int) -> int:
-    conn = psycopg2.connect(
-        host=DB_HOST, dbname=DB_NAME,
-        user=DB_USER, password=DB_PASS,
-        cursor_factory=RealDictCursor
-    )
-    try:
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT COUNT(*) AS cnt
-                      FROM reviews
-                     WHERE author_id = %s
-                       AND target_id = %s
-                    """,
-                    (author_id, target_id)
-                )
-                return cur.fetchone()['cnt']
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT
+                  EXISTS (SELECT 1 FROM ads WHERE id = %s) AS ad_exists,
+                  COALESCE(p.accepted_cnt, 0)              AS accepted_cnt,
+                  COALESCE(p.reviews_cnt, 0)               AS reviews_cnt
+                FROM (SELECT 1) AS one
+                LEFT JOIN pair_interactions p
+                       ON p.user_a = %s
+                      AND p.user_b = %s
+            """, (ad_id, author_id, target_id))
+            return cur.fetchone()
     finally:
         conn.close()
 
+@repository
 def fetch_applications_for_requester(user_id: int) -> list[dict]:
-    conn = psycopg2.connect(
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS,
         cursor_factory=RealDictCursor
@@ -777,8 +2093,9 @@ def fetch_applications_for_requester(user_id: int) -> list[dict]:
     finally:
         conn.close()
 
+@repository
 def fetch_user_subscriptions(user_id: int) -> list[dict]:
-    conn = psycopg2.connect(**DB_PARAMS, cursor_factory=RealDictCursor)
+    conn = db_connect(**DB_PARAMS, cursor_factory=RealDictCursor)
     try:
         with conn.cursor() as cur:
             cur.execute("""
@@ -792,8 +2109,9 @@ def fetch_user_subscriptions(user_id: int) -> list[dict]:
     finally:
         conn.close()
 
+@repository
 def fetch_category_subscriptions(user_id: int) -> list[str]:
-    conn = psycopg2.connect(**DB_PARAMS, cursor_factory=RealDictCursor)
+    conn = db_connect(**DB_PARAMS, cursor_factory=RealDictCursor)
     try:
         with conn.cursor() as cur:
             cur.execute("""
@@ -806,8 +2124,9 @@ def fetch_category_subscriptions(user_id: int) -> list[str]:
     finally:
         conn.close()
 
+@repository
 def ad_exists(ad_id: int, category: str) -> bool:
-    conn = psycopg2.connect(**DB_PARAMS)
+    conn = db_connect(**DB_PARAMS)
     try:
         with conn.cursor() as cur:
             cur.execute(
@@ -824,6 +2143,107 @@ def ad_exists(ad_id: int, category: str) -> bool:
     finally:
         conn.close()
 
+@repository
+def fetch_ads_by_price(category: str, max_price: Decimal | None = None, currency: str | None = None,
+                       limit: int = PAGE_SIZE, offset: int = 0) -> list[dict]:
+    conn = db_connect(**DB_PARAMS, cursor_factory=RealDictCursor)
+    try:
+        with conn.cursor() as cur:
+            sql = """
+                SELECT
+                  ad_id AS id,
+                  city,
+                  price,
+                  price_min,
+                  price_currency,
+                  created_at,
+                  bot_username,
+                  avg_rating
+                FROM ads_listing
+                WHERE category = %s
+            """
+            params = [category]
+            if max_price is not None:
+                sql += " AND price_min <= %s AND price_currency = %s"
+                params += [max_price, currency]
+            sql += " ORDER BY price_min ASC NULLS LAST, ad_id ASC LIMIT %s OFFSET %s"
+            params += [limit, offset]
+            cur.execute(sql, params)
+            return cur.fetchall()
+    finally:
+        conn.close()
+
+@repository
+def count_ads_by_price(category: str, max_price: Decimal | None = None, currency: str | None = None) -> int:
+    if max_price is None:
+        return count_ads(category)
+    conn = db_connect(**DB_PARAMS)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT COUNT(*)
+                  FROM ads_listing
+                 WHERE category = %s
+                   AND price_min <= %s
+                   AND price_currency = %s
+            """, (category, max_price, currency))
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+def build_search_query(text: str) -> str | None:
+    # кожне слово шукаємо як префікс: «поліграф» знайде «поліграфолог»
+    words = re.findall(r"[^\W_]+", text.lower())[:8]
+    return " & ".join(f"{w}:*" for w in words) or None
+
+@repository
+def search_ads(tsquery: str, limit: int, after: tuple | None = None, offset: int = 0) -> list[dict]:
+    conn = db_connect(**DB_PARAMS, cursor_factory=RealDictCursor)
+    try:
+        with conn.cursor() as cur:
+            sql = """
+                SELECT *
+                  FROM (
+                    SELECT
+                      a.id,
+                      a.city,
+                      a.price,
+                      a.category,
+                      a.created_at,
+                      u.bot_username,
+                      u.avg_rating,
+                      ts_rank(a.search_tsv, q)::float8 AS rank
+                    FROM ads a
+                    JOIN users u ON a.user_id = u.id,
+                         to_tsquery('simple', %s) q
+                    WHERE a.search_tsv @@ q
+                  ) s
+            """
+            params = [tsquery]
+            if after:
+                sql += " WHERE (s.rank, s.id) < (%s, %s)"
+                params += list(after)
+            sql += " ORDER BY s.rank DESC, s.id DESC LIMIT %s OFFSET %s"
+            params += [limit, 0 if after else offset]
+            cur.execute(sql, params)
+            return cur.fetchall()
+    finally:
+        conn.close()
+
+@repository
+def count_search_ads(tsquery: str) -> int:
+    conn = db_connect(**DB_PARAMS)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT COUNT(*)
+                  FROM ads
+                 WHERE search_tsv @@ to_tsquery('simple', %s)
+            """, (tsquery,))
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
 # ====== Створення клавіатури головного меню ======
 def main_menu() -> InlineKeyboardMarkup:
     keyboard = [
@@ -894,7 +2314,12 @@ async def category_chosen(update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> int
     return CITY
 
 async def city_received(update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> int:
-    ctx.user_data['city'] = update.message.text
+    city = resolve_city(update.message.text)
+    if not city:
+        await update.message.reply_text("Не вдалося розпізнати місто. Вкажіть назву міста, наприклад: Київ")
+        return CITY
+    ctx.user_data['city'] = city['name']
+    ctx.user_data['city_id'] = city['id']
     await update.message.reply_text("Яка ціна ваших послуг?\n (Наприклад: 2000 грн., 2000₴, 100$ або діапазон 2000-3000₴)")
     return PRICE
 
@@ -1088,7 +2513,12 @@ async def edit_city_start(update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> int
     return EDIT_CITY
 
 async def edit_city_received(update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> int:
-    ctx.user_data['city'] = update.message.text
+    city = resolve_city(update.message.text)
+    if not city:
+        await update.message.reply_text("Не вдалося розпізнати місто. Вкажіть назву міста, наприклад: Київ")
+        return EDIT_CITY
+    ctx.user_data['city'] = city['name']
+    ctx.user_data['city_id'] = city['id']
     return await send_summary(update, ctx)
 
 async def edit_price_start(update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> int:
@@ -1216,6 +2646,10 @@ async def view_ads_start(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             "📄 Всі оголошення",
             callback_data=f"menu_all_ads_{category}"
         )],
+        [InlineKeyboardButton(
+            "💰 За ціною",
+            callback_data=f"menu_price_ads_{category}"
+        )],
         [InlineKeyboardButton(
             text="🔔 Підписка на категорію",
             callback_data=f"menu_cat_{category}_view_ads"
@@ -1234,7 +2668,6 @@ async def view_ads_start(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def show_ad_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
 
     data = query.data  # "show_ad_42|top_ads|3|general"
     parts = data.split("|")
@@ -1264,37 +2697,33 @@ async def show_ad_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         category=category,
         ctx=ctx,
         chat_id=query.message.chat.id,
-        reply_to_message_id=query.message.message_id
+        reply_to_message_id=query.message.message_id,
+        current_message=query.message
     )
 
 async def all_ads_handler(update, ctx):
     query = update.callback_query
-    await query.answer()
-    data = query.data  # "menu_all_ads_general" або "all_ads_general_3"
-
-    parts = data.split("_")
-    if parts[0] == "menu" and parts[1] == "all" and parts[2] == "ads":
-        page = 1
-        category = parts[3]
-    elif parts[0] == "all" and parts[1] == "ads":
-        category = parts[2]
-        page     = int(parts[3])
-    else:
+    parsed = parse_list_callback(query.data, "all_ads")
+    if not parsed:
         return await query.edit_message_text("❌ Невідомий формат callback_data.")
+    category, page = parsed
 
     ctx.user_data['ads_category'] = category
 
-    ads = fetch_ads(category=category)
-    if not ads:
+    total = cached_listing(count_ads, category)
+    if not total:
         return await safe_update(update, new_text="📭 Поки немає оголошень у цій категорії")
 
-    total_pages = (len(ads) + PAGE_SIZE - 1) // PAGE_SIZE
+    total_pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+    page = max(1, min(page, total_pages))
+    ads = cached_listing(fetch_ads, category, PAGE_SIZE, (page - 1) * PAGE_SIZE)
 
     kb = paginate_keyboard(
         items=ads,
         page=page,
         page_size=PAGE_SIZE,
         nav_size=NAV_SIZE,
+        total=total,
         label_fn=lambda ad: f"{ad.get('bot_username')} — {ad['city']} — {ad['price']} — {ad['avg_rating']} ⭐",
         callback_fn=lambda ad: f"show_ad_{ad['id']}|all_ads|{page}|{category}",
         page_callback_prefix=f"all_ads_{category}",
@@ -1307,26 +2736,25 @@ async def all_ads_handler(update, ctx):
     title = f"📄 Всі оголошення в категорії <b>{CATEGORY_LABELS[category]}</b>, стор. {page}/{total_pages}"
     await safe_update(update, new_text=title, new_markup=kb)
 
+    if page < total_pages:
+        prefetch_listing(fetch_ads, category, PAGE_SIZE, page * PAGE_SIZE)
+    prefetch_ad_cards(ads, query.from_user.id)
+
 async def menu_top_cities_handler(update, ctx):
     query = update.callback_query
-    await query.answer()
 
-    data = query.data # "menu_top_cities_general" або "top_cities_general_3"
-    parts = data.split("_")
-    if parts[0] == "menu" and parts[1] == "top" and parts[2] == "cities":
-        page = 1
-        category = parts[3]
-    elif parts[0] == "top" and parts[1] == "cities":
-        category = parts[2]
-        page     = int(parts[3])
-    else:
+    parsed = parse_list_callback(query.data, "top_cities")
+    if not parsed:
         return await query.edit_message_text("❌ Невідомий формат callback_data.")
+    category, page = parsed
 
     ctx.user_data['ads_category'] = category
-    cities = fetch_top_cities_list(category=category)
-    if not cities:
+    total = count_top_cities(category)
+    if not total:
         return await safe_update(update, new_text="🏙 Даних немає.")
-    total_pages = (len(cities) + PAGE_SIZE - 1) // PAGE_SIZE
+    total_pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+    page = max(1, min(page, total_pages))
+    cities = fetch_top_cities_list(category=category, top_n=PAGE_SIZE, offset=(page - 1) * PAGE_SIZE)
 
     kb = paginate_keyboard(
         items=cities,
@@ -1334,9 +2762,10 @@ async def menu_top_cities_handler(update, ctx):
         page_size=PAGE_SIZE,
         nav_size=NAV_SIZE,
         label_fn=lambda r: f"{r['city']} — {r['cnt']}",
-        callback_fn=lambda r: f"city_{r['city']}_{category}_{page}",
+        callback_fn=lambda r: f"city_{r['city_id']}_{category}_{page}",
         page_callback_prefix=f"top_cities_{category}",
-        back_button=InlineKeyboardButton("🔙 Назад", callback_data=f"view_ads_{category}")
+        back_button=InlineKeyboardButton("🔙 Назад", callback_data=f"view_ads_{category}"),
+        total=total
     )
 
     title = f"🏙 Популярні міста в категорії <b>{CATEGORY_LABELS[category]}</b>, стор. {page}/{total_pages}"
@@ -1345,31 +2774,28 @@ async def menu_top_cities_handler(update, ctx):
 
 async def menu_top_ads_handler(update, ctx):
     query = update.callback_query
-    await query.answer()
 
-    data = query.data  # "menu_top_ads_general" або "top_ads_general_3"
-    parts = data.split("_")
-    if parts[0] == "menu" and parts[1] == "top" and parts[2] == "ads":
-        page = 1
-        category = parts[3]
-    elif parts[0] == "top" and parts[1] == "ads":
-        category = parts[2]
-        page = int(parts[3])
-    else:
+    parsed = parse_list_callback(query.data, "top_ads")
+    if not parsed:
         return await query.edit_message_text("❌ Невідомий формат callback_data.")
+    category, page = parsed
 
     ctx.user_data['ads_category'] = category
 
-    ads = fetch_top_ads_list(category=category)
-    if not ads:
+    total = min(cached_listing(count_ads, category), TOP_ADS_LIMIT)
+    if not total:
         return await safe_update(update, new_text="⭐ Даних немає в цій категорії.")
-    total_pages = (len(ads) + PAGE_SIZE - 1) // PAGE_SIZE
+    total_pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+    page = max(1, min(page, total_pages))
+    offset = (page - 1) * PAGE_SIZE
+    ads = cached_listing(fetch_top_ads_list, category, min(PAGE_SIZE, total - offset), offset)
 
     kb = paginate_keyboard(
         items=ads,
         page=page,
         page_size=PAGE_SIZE,
         nav_size=NAV_SIZE,
+        total=total,
         label_fn=lambda ad: f"{ad.get('bot_username')} — {ad['city']} — {ad['price']} — {ad['avg_rating']} ⭐",
         callback_fn=lambda ad: f"show_ad_{ad['id']}|top_ads|{page}|{category}",
         page_callback_prefix=f"top_ads_{category}",
@@ -1382,9 +2808,71 @@ async def menu_top_ads_handler(update, ctx):
     title = f"⭐ Популярні оголошення в категорії <b>{CATEGORY_LABELS[category]}</b>, стор. {page}/{total_pages}"
     await safe_update(update, new_text=title, new_markup=kb)
 
+    if page < total_pages:
+        next_offset = page * PAGE_SIZE
+        prefetch_listing(fetch_top_ads_list, category, min(PAGE_SIZE, total - next_offset), next_offset)
+    prefetch_ad_cards(ads, query.from_user.id)
+
+async def price_ads_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    if update.message:
+        # "/price 2000" — фільтр «до 2000 грн», "/price 100$" — «до 100 USD», "/price" — скинути фільтр
+        category = ctx.user_data.get('ads_category')
+        if not category:
+            return await update.message.reply_text("Спочатку оберіть категорію в головному меню.")
+        max_price, _, currency = parse_price(" ".join(ctx.args or []))
+        ctx.user_data['price_filter'] = (max_price, currency) if max_price is not None else None
+        NAV_STACK.clear(update.effective_user.id)
+        page = 1
+    else:
+        query = update.callback_query
+        parsed = parse_list_callback(query.data, "price_ads")
+        if not parsed:
+            return await query.edit_message_text("❌ Невідомий формат callback_data.")
+        category, page = parsed
+
+    ctx.user_data['ads_category'] = category
+    max_price, currency = ctx.user_data.get('price_filter') or (None, None)
+
+    total = count_ads_by_price(category, max_price, currency)
+    if max_price is not None:
+        filter_text = f", до {max_price.normalize():f} {currency}"
+    else:
+        filter_text = ""
+
+    if not total:
+        text = f"💰 Немає оголошень у цій категорії{filter_text}."
+        if update.message:
+            return await update.message.reply_text(text)
+        return await safe_update(update, new_text=text)
+
+    total_pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+    page = max(1, min(page, total_pages))
+    ads = fetch_ads_by_price(category, max_price, currency, limit=PAGE_SIZE, offset=(page - 1) * PAGE_SIZE)
+
+    kb = paginate_keyboard(
+        items=ads,
+        page=page,
+        page_size=PAGE_SIZE,
+        nav_size=NAV_SIZE,
+        label_fn=lambda ad: f"{ad['price']} — {ad['city']} — {ad['bot_username']} — {ad['avg_rating']} ⭐",
+        callback_fn=lambda ad: f"show_ad_{ad['id']}|price_ads|{page}|{category}",
+        page_callback_prefix=f"price_ads_{category}",
+        back_button=InlineKeyboardButton("🔙 Назад", callback_data=f"view_ads_{category}"),
+        total=total
+    )
+
+    title = (
+        f"💰 Оголошення за ціною в категорії <b>{CATEGORY_LABELS[category]}</b>{filter_text}, "
+        f"стор. {page}/{total_pages}\n"
+        "Фільтр: /price 2000 — до 2000 грн, /price — без фільтра"
+    )
+    if update.message:
+        await update.message.reply_text(title, reply_markup=kb, parse_mode="HTML")
+    else:
+        await safe_update(update, new_text=title, new_markup=kb)
+
 async def reviews_about_user_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
 
     data = query.data  
     m = re.match(r"^reviews_about_user_(\d+)_([^_]+)_(\d+)$", data)
@@ -1412,8 +2900,9 @@ async def reviews_about_user_handler(update: Update, ctx: ContextTypes.DEFAULT_T
     origpage = ctx.user_data.get('current_page')
     back_cb  = f"show_ad_{ad_id}|{origin}|{origpage}|{category}"
 
-    reviews = fetch_reviews_for_user(target_id)
-    if not reviews:
+    rating = fetch_user_rating(target_id)
+    count  = rating['cnt']
+    if not count:
         return await ctx.bot.send_message(
             chat_id=update.effective_chat.id,
             text="📭 Цей виконавець ще не отримував відгуків.",
@@ -1422,19 +2911,19 @@ async def reviews_about_user_handler(update: Update, ctx: ContextTypes.DEFAULT_T
             )
         )
 
-    count = len(reviews)
-    avg   = sum(r['rating'] for r in reviews) / count
+    avg   = rating['avg']
+    stars = " · ".join(f"{n}⭐️ {rating[f'r{n}']}" for n in range(5, 0, -1))
 
-    with_text    = sorted([r for r in reviews if r['comment']], key=lambda r: r['created_at'], reverse=True)
-    without_text = sorted([r for r in reviews if not r['comment']], key=lambda r: r['created_at'], reverse=True)
-    sorted_reviews = with_text + without_text
     total_pages = (count + PAGE_SIZE - 1) // PAGE_SIZE
+    page = max(1, min(page, total_pages))
+    reviews = fetch_reviews_for_user(target_id, limit=PAGE_SIZE, offset=(page - 1) * PAGE_SIZE)
 
     kb = paginate_keyboard(
-        items=sorted_reviews,
+        items=reviews,
         page=page,
         page_size=PAGE_SIZE,
         nav_size=NAV_SIZE,
+        total=count,
         label_fn=lambda r: (
             f"{r['author']['bot_username']} — {r['rating']}⭐️" +
             (f" — {r['comment']}" if r['comment'] else "")
@@ -1449,7 +2938,8 @@ async def reviews_about_user_handler(update: Update, ctx: ContextTypes.DEFAULT_T
     text = (
         f"<b>Виконавець:</b> {name}\n"
         f"<b>Кількість відгуків:</b> {count}\n"
-        f"<b>Середній рейтинг:</b> {avg:.2f}⭐️\n\n"
+        f"<b>Середній рейтинг:</b> {avg:.2f}⭐️\n"
+        f"{stars}\n\n"
         f"Оберіть відгук для перегляду (стор. {page}/{total_pages}):"
     )
 
@@ -1506,16 +2996,15 @@ async def apply_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def accept_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
     app_id = int(query.data.split("_", 1)[1])
 
-    application = fetch_application(app_id)
+    application = transition_application(app_id, 'accepted')
     if not application:
+        if fetch_application(app_id):
+            return await query.answer("Ця заявка вже оброблена.", show_alert=True)
+        await query.answer()
         return await query.edit_message_text("❌ Заявка не знайдена.")
-    if application['status'] != 'pending':
-        return await query.answer("Ця заявка вже оброблена.", show_alert=True)
-
-    update_application_status(app_id, 'accepted')
+    await query.answer()
 
     requester_id = application['requester_id']
     executor_id  = application['executor_id']
@@ -1597,16 +3086,15 @@ async def accept_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def reject_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
     app_id = int(query.data.split("_",1)[1])
 
-    application = fetch_application(app_id)
+    application = transition_application(app_id, 'rejected')
     if not application:
+        if fetch_application(app_id):
+            return await query.answer("Цю заявку вже обробили.", show_alert=True)
+        await query.answer()
         return await query.edit_message_text("❌ Заявка не знайдена.")
-    if application['status'] != 'pending':
-        return await query.answer("Цю заявку вже обробили.", show_alert=True)
-
-    update_application_status(app_id, 'rejected')
+    await query.answer()
 
     requester_id = application['requester_id']
     await ctx.bot.send_message(
@@ -1622,34 +3110,19 @@ async def display_ad(
     category: str,
     ctx: ContextTypes.DEFAULT_TYPE,
     chat_id: int,
-    reply_to_message_id: int | None = None
+    reply_to_message_id: int | None = None,
+    current_message: Message | None = None
 ):
-    ad = fetch_ad_by_id(ad_id)
+    user = ctx.user_data.get('_caller_id') or chat_id
+    ad = AD_CACHE.get((ad_id, user)) or fetch_ad_for_viewer(ad_id, user)
     if not ad:
         return await ctx.bot.send_message(chat_id=chat_id, text="❌ Оголошення не знайдено.")
 
-    author = ad['author']
-    esc_author   = escape_markdown(author['bot_username'], version=2)
-    esc_cat      = escape_markdown(CATEGORY_LABELS[ad['category']], version=2)
-    esc_rating   = escape_markdown(f"{author['avg_rating']:.2f}", version=2)
-    esc_city     = escape_markdown(ad['city'], version=2)
-    esc_price    = escape_markdown(ad['price'], version=2)
-    esc_desc     = escape_markdown(ad['desc'], version=2)
-
-    caption = (
-        f"Оголошення №{ad_id}:\n"
-        f"👤 Виконавець: {esc_author}\n"
-        f"⭐️ Середній рейтинг виконавця: {esc_rating} ⭐️\n"
-        f"📂 Категорія: {esc_cat}\n"
-        f"📍 Місто: {esc_city}\n"
-        f"💰 Ціна: {esc_price}\n\n"
-        f"📝 Опис:\n{esc_desc}"
-    )
+    author = ad['author']
+    caption = ad_caption(ad_id, ad)
 
-    payload = f"show_ad_{ad_id}|{origin}|{page}|{category}"
-    b64     = base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
     bot_u   = ctx.bot.username
-    bot_link = f"https://t.me/{bot_u}?start={b64}"
+    bot_link = f"https://t.me/{bot_u}?start={encode_deep_link(ad_id, origin, page, category)}"
     short = ad['desc'][:47] + "..." if len(ad['desc']) > 50 else ad['desc']
     share_text = (
         f"📍 {ad['city']}\n"
@@ -1663,29 +3136,33 @@ async def display_ad(
     ctx.user_data['current_origin'] = origin
     ctx.user_data['current_page']   = page
     ctx.user_data['ads_category'] = category
-    me = ctx.bot.id
-    user = ctx.user_data.get('_caller_id') or chat_id
+    viewer = ad['viewer']
     if user == author['id']:
         kb.append([InlineKeyboardButton("✏️ Редагувати", callback_data=f"edit_ad_{ad_id}")])
         kb.append([InlineKeyboardButton("🗑 Видалити",  callback_data=f"delete_ad_{ad_id}")])
     else:
-        if not has_pending_application(ad_id, user):
+        if not viewer['pending']:
             kb.append([InlineKeyboardButton("📥 Відгукнутися", callback_data=f"apply_{ad_id}")])
         else:
             kb.append([InlineKeyboardButton("✅ Ви вже відгукнулися", callback_data="noop")])
         
+        # недоступний відгук лишається кнопкою: review_start пояснить причину
         kb.append([InlineKeyboardButton(
-            "💬 Залишити відгук",
+            "💬 Залишити відгук" if viewer['can_review'] else "🔒 Залишити відгук",
             callback_data=f"review_ad_{ad_id}_{author['id']}"
         ),InlineKeyboardButton(
             "💬 Переглянути відгуки",
             callback_data=f"reviews_about_user_{author['id']}_{category}_{page}"
         )])
         kb.append([InlineKeyboardButton(
-            "🔔 Підписка на автора",
+            "✅ Ви підписані на автора" if viewer['subscribed_author'] else "🔔 Підписка на автора",
             callback_data=f"menu_user_{author['id']}_show_ad"
         ),
             InlineKeyboardButton(
+            "✅ Ви підписані на категорію" if viewer['subscribed_category'] else "🔔 Підписка на категорію",
+            callback_data=f"menu_cat_{ad['category']}_show_ad"
+        )])
+        kb.append([InlineKeyboardButton(
             "🔗 Поділитись",
             url=f"https://t.me/share/url?url={encoded}"
         )])
@@ -1699,42 +3176,16 @@ async def display_ad(
 
     markup = InlineKeyboardMarkup(kb)
 
-    if reply_to_message_id:
-        try:
-            return await ctx.bot.edit_message_media(
-                media=InputMediaPhoto(ad.get('photo_id'), caption=caption, parse_mode="MarkdownV2")
-                if ad.get('photo_id') else None,
-                chat_id=chat_id,
-                message_id=reply_to_message_id,
-                reply_markup=markup
-            )
-        except BadRequest:
-            try:
-                return await ctx.bot.edit_message_text(
-                    text=caption,
-                    chat_id=chat_id,
-                    message_id=reply_to_message_id,
-                    parse_mode="MarkdownV2",
-                    reply_markup=markup
-                )
-            except BadRequest:
-                pass
-
-    if ad.get('photo_id'):
-        return await ctx.bot.send_photo(
-            chat_id=chat_id,
-            photo=ad['photo_id'],
-            caption=caption,
-            parse_mode="MarkdownV2",
-            reply_markup=markup
-        )
-    else:
-        return await ctx.bot.send_message(
-            chat_id=chat_id,
-            text=caption,
-            parse_mode="MarkdownV2",
-            reply_markup=markup
-        )
+    return await render_message(
+        ctx.bot,
+        chat_id=chat_id,
+        text=caption,
+        markup=markup,
+        parse_mode="MarkdownV2",
+        photo_id=ad.get('photo_id'),
+        message_id=reply_to_message_id,
+        current=current_message
+    )
 
 async def category_subscription_menu(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -1748,7 +3199,7 @@ async def category_subscription_menu(update: Update, ctx: ContextTypes.DEFAULT_T
 
     user_id = query.from_user.id
 
-    conn = psycopg2.connect(**DB_PARAMS, cursor_factory=RealDictCursor)
+    conn = db_connect(**DB_PARAMS, cursor_factory=RealDictCursor)
     try:
         with conn:
             with conn.cursor() as cur:
@@ -1775,23 +3226,23 @@ async def category_subscription_menu(update: Update, ctx: ContextTypes.DEFAULT_T
         )
         action_btn = InlineKeyboardButton("🔔 Підписатися", callback_data=f"sub_cat_{category}_{origin}")
 
-    if origin == "my_subs":
-        back_cb = "my_subs"
-        back_btn = InlineKeyboardButton("🔙 Назад до підписок", callback_data=back_cb)
-    else:
-        back_cb = f"view_ads_{category}"
-        back_btn = InlineKeyboardButton("🔙 Назад до оголошень", callback_data=back_cb)
-
     kb = InlineKeyboardMarkup([
         [action_btn],
-        [back_btn]
+        [category_back_button(ctx, category, origin)]
     ])
 
-    await query.edit_message_text(
-        text=text,
-        parse_mode="HTML",
-        reply_markup=kb
-    )
+    # меню відкривається і з картки-фото: safe_update сам обирає правильний виклик редагування
+    await safe_update(update, new_text=text, new_markup=kb)
+
+def category_back_button(ctx: ContextTypes.DEFAULT_TYPE, category: str, origin: str) -> InlineKeyboardButton:
+    if origin == "my_subs":
+        return InlineKeyboardButton("🔙 Назад до підписок", callback_data="my_subs")
+    ad_id = ctx.user_data.get('current_ad_id')
+    if origin == "show_ad" and ad_id:
+        back_cb = (f"show_ad_{ad_id}|{ctx.user_data.get('current_origin')}"
+                   f"|{ctx.user_data.get('current_page')}|{ctx.user_data.get('ads_category')}")
+        return InlineKeyboardButton("🔙 Назад до оголошення", callback_data=back_cb)
+    return InlineKeyboardButton("🔙 Назад до оголошень", callback_data=f"view_ads_{category}")
 
 async def user_subscription_menu(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -1812,7 +3263,7 @@ async def user_subscription_menu(update: Update, ctx: ContextTypes.DEFAULT_TYPE)
     bot_username = author.get("bot_username")
     safe_label   = html.escape(bot_username)
 
-    conn = psycopg2.connect(**DB_PARAMS, cursor_factory=RealDictCursor)
+    conn = db_connect(**DB_PARAMS, cursor_factory=RealDictCursor)
     try:
         with conn:
             with conn.cursor() as cur:
@@ -1869,7 +3320,7 @@ async def subscribe_category_handler(update: Update, ctx: ContextTypes.DEFAULT_T
 
     user_id = query.from_user.id
 
-    conn = psycopg2.connect(**DB_PARAMS)
+    conn = db_connect(**DB_PARAMS)
     try:
         with conn:
             with conn.cursor() as cur:
@@ -1880,19 +3331,13 @@ async def subscribe_category_handler(update: Update, ctx: ContextTypes.DEFAULT_T
                 """, (user_id, category))
     finally:
         conn.close()
+    invalidate_read_caches(user_ids=[user_id])
 
     await query.edit_message_reply_markup(
         reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("✅ Підписані", callback_data="noop")]])
     )
 
-    if origin == "my_subs":
-        back_cb = "my_subs"
-        back_btn = InlineKeyboardButton("🔙 Назад до підписок", callback_data=back_cb)
-    else:
-        back_cb = f"view_ads_{category}"
-        back_btn = InlineKeyboardButton("🔙 Назад до оголошень", callback_data=back_cb)
-
-    kb = InlineKeyboardMarkup([[back_btn]])
+    kb = InlineKeyboardMarkup([[category_back_button(ctx, category, origin)]])
 
     await ctx.bot.send_message(
         chat_id=user_id,
@@ -1912,7 +3357,7 @@ async def subscribe_user_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE)
         return await query.answer("❌ Невірний формат даних.", show_alert=True)
 
     subscriber_id = query.from_user.id
-    conn = psycopg2.connect(**DB_PARAMS)
+    conn = db_connect(**DB_PARAMS)
     try:
         with conn:
             with conn.cursor() as cur:
@@ -1923,6 +3368,7 @@ async def subscribe_user_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE)
                 """, (subscriber_id, author_id))
     finally:
         conn.close()
+    invalidate_read_caches(user_ids=[subscriber_id])
 
     await query.edit_message_reply_markup(
         reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("✅ Підписані", callback_data="noop")]])
@@ -1962,7 +3408,7 @@ async def unsubscribe_category_handler(update: Update, ctx: ContextTypes.DEFAULT
         return await query.answer("❌ Невірний формат даних.", show_alert=True)
 
     user_id = query.from_user.id
-    conn = psycopg2.connect(**DB_PARAMS)
+    conn = db_connect(**DB_PARAMS)
 
     try:
         with conn:
@@ -1974,19 +3420,13 @@ async def unsubscribe_category_handler(update: Update, ctx: ContextTypes.DEFAULT
                 """, (user_id, category))
     finally:
         conn.close()
+    invalidate_read_caches(user_ids=[user_id])
 
     await query.edit_message_reply_markup(
         reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔕 Відписано", callback_data="noop")]])
     )
 
-    if origin == "my_subs":
-        back_cb = "my_subs"
-        back_btn = InlineKeyboardButton("🔙 Назад до підписок", callback_data=back_cb)
-    else:
-        back_cb = f"view_ads_{category}"
-        back_btn = InlineKeyboardButton("🔙 Назад до оголошень", callback_data=back_cb)
-
-    kb = InlineKeyboardMarkup([[back_btn]])
+    kb = InlineKeyboardMarkup([[category_back_button(ctx, category, origin)]])
 
     await ctx.bot.send_message(
         chat_id=user_id,
@@ -2007,7 +3447,7 @@ async def unsubscribe_user_handler(update: Update, ctx: ContextTypes.DEFAULT_TYP
 
     subscriber_id = query.from_user.id
 
-    conn = psycopg2.connect(**DB_PARAMS)
+    conn = db_connect(**DB_PARAMS)
     try:
         with conn:
             with conn.cursor() as cur:
@@ -2018,6 +3458,7 @@ async def unsubscribe_user_handler(update: Update, ctx: ContextTypes.DEFAULT_TYP
                 """, (subscriber_id, author_id))
     finally:
         conn.close()
+    invalidate_read_caches(user_ids=[subscriber_id])
 
     await query.edit_message_reply_markup(
         reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔕 Відписано", callback_data="noop")]])
@@ -2069,16 +3510,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if context.args:
         b64 = context.args[0]
-        pad = len(b64) % 4
-        if pad:
-            b64 += "=" * (4 - pad)
         try:
-            raw = base64.urlsafe_b64decode(b64.encode()).decode()
-            parts = raw.split("|")
-            ad_id    = int(parts[0].split("_", 2)[2])
-            origin   = parts[1]
-            page     = int(parts[2])
-            category = parts[3]
+            ad_id, origin, page, category = decode_deep_link(b64)
             return await display_ad(
                 ad_id=ad_id,
                 origin=origin,
@@ -2086,7 +3519,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 category=category,
                 ctx=context,
                 chat_id=chat_id,
-                reply_to_message_id=message_id
+                reply_to_message_id=message_id,
+                current_message=update.callback_query.message if update.callback_query else None
             )
         except Exception as e:
             logger.warning(f"[start] Не вдалося розпакувати deep‑link payload: {b64!r}, помилка: {e}")
@@ -2112,9 +3546,9 @@ async def account_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     my_reviews = fetch_reviews_by_author(user_id)
     my_reviews_count = len(my_reviews)
     
-    reviews_about = fetch_reviews_for_user(user_id)
-    about_count = len(reviews_about)
-    avg = (sum(r['rating'] for r in reviews_about) / about_count) if about_count else 0.0
+    rating = fetch_user_rating(user_id)
+    about_count = rating['cnt']
+    avg = rating['avg']
 
     stats_text = (
         f"📊 <b>Ваша статистика, {name}</b>\n\n"
@@ -2140,7 +3574,6 @@ async def account_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def my_ads_handler(update, ctx):
     query = update.callback_query
-    await query.answer()
     user_id = query.from_user.id
     data = query.data  
     page = int(data.split("_")[2]) if data.startswith("my_ads_") else 1
@@ -2185,11 +3618,7 @@ async def delete_ad_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if not ad or ad['author']['id'] != query.from_user.id:
         return await query.edit_message_text("❌ Ви не маєте прав видалити це оголошення.")
 
-    conn = psycopg2.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS)
-    with conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM ads WHERE id = %s", (ad_id,))
-    conn.close()
+    delete_ad(ad_id)
 
     await update.callback_query.message.chat.send_message(
         text="✅ Оголошення успішно видалено."
@@ -2271,7 +3700,7 @@ async def change_nick_received(update: Update, ctx: ContextTypes.DEFAULT_TYPE) -
             [InlineKeyboardButton("Особистий кабінет", callback_data="account")]
         ])
     now = datetime.now(timezone.utc)
-    conn = psycopg2.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS)
+    conn = db_connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS)
     with conn:
         with conn.cursor() as cur:
             cur.execute("""
@@ -2280,7 +3709,10 @@ async def change_nick_received(update: Update, ctx: ContextTypes.DEFAULT_TYPE) -
                        bot_username_changed_at = %s
                  WHERE id = %s
             """, (new_nick, now, user_id))
+            refresh_ads_listing(cur, "a.user_id = %s", (user_id,))
+            categories = author_categories(cur, user_id)
     conn.close()
+    invalidate_read_caches(categories=categories, user_ids=[user_id])
 
     await update.message.reply_text(f"✅ Ваш новий внутрішній нікнейм: {new_nick}", reply_markup=kb1)
     return ConversationHandler.END
@@ -2298,7 +3730,6 @@ async def change_nick_cancel(update: Update, ctx: ContextTypes.DEFAULT_TYPE) ->
 
 async def my_apps_handler(update, ctx: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
     user_id = query.from_user.id
 
     data = query.data
@@ -2383,7 +3814,6 @@ async def show_app_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def my_subs_handler(update, ctx: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
     user_id = query.from_user.id
 
     data = query.data
@@ -2449,94 +3879,278 @@ async def support_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data="back")]])
     )
 
+# ====== Статистика БД (адмін) ======
+async def dbstats_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+
+    with _query_stats_lock:
+        rows = sorted(QUERY_STATS.items(), key=lambda kv: kv[1][1], reverse=True)[:10]
+    lines = ["<b>🐢 Найдорожчі функції (з моменту запуску)</b>", "<pre>"]
+    lines.append(f"{'функція':<32}{'викл':>7}{'Σ мс':>9}{'сер':>7}{'макс':>7}{'рядки':>8}{'КБ':>8}")
+    for owner, (calls, total, worst, nrows, nbytes, _) in rows:
+        lines.append(
+            f"{owner[:31]:<32}{calls:>7}{total * 1000:>9.0f}{total * 1000 / calls:>7.1f}"
+            f"{worst * 1000:>7.0f}{nrows:>8}{nbytes // 1024:>8}"
+        )
+    lines.append("</pre>")
+
+    try:
+        conn = db_connect(**DB_PARAMS)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT calls, total_exec_time, mean_exec_time, rows, query
+                      FROM pg_stat_statements
+                     WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+                     ORDER BY total_exec_time DESC
+                     LIMIT 5
+                """)
+                top = cur.fetchall()
+        finally:
+            conn.close()
+    except psycopg2.Error:
+        top = None   # розширення pg_stat_statements не встановлене або немає прав
+
+    if top:
+        lines.append("<b>📊 pg_stat_statements</b>")
+        for calls, total, mean, nrows, text in top:
+            lines.append(
+                f"• {calls} викл, Σ {total:.0f} мс, сер {mean:.1f} мс, {nrows} рядків\n"
+                f"<code>{html.escape(' '.join(text.split())[:300])}</code>"
+            )
+    await update.message.reply_text("\n".join(lines), parse_mode="HTML")
+
+# ====== Профілювання (адмін) ======
+async def profile_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+
+    try:
+        seconds = float(ctx.args[0]) if ctx.args else PROFILE_SECONDS
+    except ValueError:
+        seconds = float("nan")
+    # порівняння з NaN хибне, тож NaN і нескінченність теж не проходять
+    if not 1 <= seconds <= PROFILE_MAX_SECONDS:
+        await update.message.reply_text(f"❌ Формат: /profile <секунди від 1 до {PROFILE_MAX_SECONDS:g}>")
+        return
+
+    started = start_profiler(seconds)
+    if started is None:
+        await update.message.reply_text("⏳ Профілювання вже триває.")
+        return
+    thread, path = started
+    await update.message.reply_text(f"🔬 Профілюю {seconds:g} с…")
+    await asyncio.to_thread(thread.join)
+    with open(path, "rb") as f:
+        await update.message.reply_document(f, filename=os.path.basename(path))
+
 # ========== Пошук ==========
 
+def inline_result_id(*parts) -> str:
+    # стабільний id, щоб Telegram міг кешувати результати між запитами
+    return hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()
+
+def fetch_inline_cities(category: str | None, query: str) -> list[tuple[str, str, tuple]]:
+    key = (category, query)
+    cached = INLINE_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    # Якщо є повна (необрізана) відповідь для коротшого запиту — фільтруємо її без БД
+    needle = city_key(query)
+    for i in range(len(query) - 1, MIN_QUERY_LEN - 1, -1):
+        parent = INLINE_CACHE.get((category, query[:i]))
+        if parent is not None and len(parent) < INLINE_MAX_RESULTS:
+            rows = [
+                r for r in parent
+                if any(alias.startswith(needle) or f" {needle}" in alias for alias in r[2])
+            ]
+            INLINE_CACHE.set(key, rows)
+            return rows
+
+    if len(query) < MIN_QUERY_LEN:
+        top_cities = fetch_top_cities_list(category=category, top_n=INLINE_MAX_RESULTS)
+        rows = [(item['city'], f"{item['city']} ({item['cnt']})", ()) for item in top_cities]
+    else:
+        cities = fetch_distinct_cities(prefix=query, limit=INLINE_MAX_RESULTS, category=category)
+        rows = [(item['city'], item['city'], tuple(item['aliases'] or ())) for item in cities]
+
+    INLINE_CACHE.set(key, rows)
+    return rows
+
 async def inline_city_suggest(update, ctx):
-    query = update.inline_query.query.strip()
+    query = " ".join(update.inline_query.query.lower().split())
+    cat = ctx.user_data.get('ads_category')
+    try:
+        offset = int(update.inline_query.offset or 0)
+    except ValueError:
+        offset = 0
+
+    rows = fetch_inline_cities(cat, query)
+
     results = []
-    cat = ctx.user_data['ads_category']
-    if len(query) < MIN_QUERY_LEN:
-        top_cities = fetch_top_cities_list(category=cat)[:10]
-        for item in top_cities:
-            city = item['city']
-            results.append(
-                InlineQueryResultArticle(
-                    id=str(uuid.uuid4()),
-                    title=f"{city} ({item['cnt']})",
-                    input_message_content=InputTextMessageContent(f"/city {city}")
+    if len(query) >= MIN_QUERY_LEN and offset == 0:
+        results.append(
+            InlineQueryResultArticle(
+                id=inline_result_id("search", query),
+                title=f"🔎 Шукати «{query}» в оголошеннях",
+                description="Пошук за описом і містом",
+                input_message_content=InputTextMessageContent(f"/search {query}")
+            )
+        )
+    if not rows:
+        cat_label = CATEGORY_LABELS.get(cat, "усіх категоріях")
+        results.append(
+            InlineQueryResultArticle(
+                id=inline_result_id(cat, "empty", query),
+                title="Нічого не знайдено 😕",
+                input_message_content=InputTextMessageContent(
+                    f"За запитом «{query}» нічого не знайдено в категорії {cat_label}."
                 )
             )
+        )
     else:
-        cities = fetch_distinct_cities(prefix=query, limit=10, category=cat)
-        if not cities:
+        for city, title, _ in rows[offset:offset + INLINE_PAGE_SIZE]:
             results.append(
                 InlineQueryResultArticle(
-                    id=str(uuid.uuid4()),
-                    title="Нічого не знайдено 😕",
-                    input_message_content=InputTextMessageContent(
-                        f"За запитом «{query}» нічого не знайдено в категорії {CATEGORY_LABELS[cat]}."
-                    )
+                    id=inline_result_id(cat, city),
+                    title=title,
+                    input_message_content=InputTextMessageContent(f"/city {city}")
                 )
             )
-        else:
-            for city in cities:
-                results.append(
-                    InlineQueryResultArticle(
-                        id=str(uuid.uuid4()),
-                        title=city,
-                        input_message_content=InputTextMessageContent(f"/city {city}")
-                    )
-                )
-    
-    await update.inline_query.answer(results, cache_time=0)
+
+    next_offset = str(offset + INLINE_PAGE_SIZE) if offset + INLINE_PAGE_SIZE < len(rows) else ""
+
+    await update.inline_query.answer(
+        results,
+        cache_time=INLINE_CACHE_TIME,
+        is_personal=True,
+        next_offset=next_offset
+    )
 
 async def city_command(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if update.message:
         if not ctx.args:
             return await update.message.reply_text("Будь ласка, вкажіть місто: /city Київ")
-        city = " ".join(ctx.args).strip()
+        category = ctx.user_data.get('ads_category')
+        if not category:
+            return await update.message.reply_text("Спочатку оберіть категорію в головному меню.")
+        city_text = " ".join(ctx.args).strip()
+        city = resolve_city(city_text, create=False)
         page = 1
-        category = ctx.user_data['ads_category']
     else:
         query = update.callback_query
-        await query.answer()
-        data = query.data 
+        data = query.data  # "city_12_general_3"; старі кнопки містять назву міста замість id
         try:
-            prefix, city_raw, category, page_str = data.split("_", 3)
-            city = city_raw
+            city_raw, category, page_str = data.split("_", 1)[1].rsplit("_", 2)
             page = int(page_str)
         except ValueError:
             return await safe_update(update, new_text="❌ Неправильні дані пагінації.")
+        if city_raw.isdigit():
+            city = fetch_city(int(city_raw))
+        else:
+            city = resolve_city(city_raw.replace("_", " "), create=False)
+        city_text = city_raw
 
-    ads = fetch_ads_by_city(city, category=category)
-    if not ads:
-        text = f"На жаль, в місті «{city}» поки що немає оголошень."
+    if city:
+        city_text = city['name']
+        total = cached_listing(count_ads_by_city, city['id'], category)
+    else:
+        total = 0
+    if not total:
+        text = f"На жаль, в місті «{city_text}» поки що немає оголошень."
         if update.message:
             return await update.message.reply_text(text)
         else:
             return await safe_update(update, new_text=text)
 
-    total_pages = (len(ads) + PAGE_SIZE - 1) // PAGE_SIZE
+    total_pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+    page = max(1, min(page, total_pages))
+    ads = cached_listing(fetch_ads_by_city, city['id'], category, PAGE_SIZE, (page - 1) * PAGE_SIZE)
 
-    prefix = f"city_{city.replace(' ', '_')}_{category}"
+    prefix = f"city_{city['id']}_{category}"
     kb = paginate_keyboard(
         items=ads,
         page=page,
         page_size=PAGE_SIZE,
         nav_size=NAV_SIZE,
-        label_fn=lambda ad: f"{ad['price']} — {ad['author']['bot_username']} — {ad['author']['avg_rating']} ⭐",
-        callback_fn=lambda ad: f"show_ad_{ad['id']}|city_{city}|{page}|{category}",
+        total=total,
+        label_fn=lambda ad: f"{ad['price']} — {ad['bot_username']} — {ad['avg_rating']} ⭐",
+        callback_fn=lambda ad: f"show_ad_{ad['id']}|city_{city['id']}|{page}|{category}",
         page_callback_prefix=f"{prefix}",
         back_button=InlineKeyboardButton("🔙 Назад", callback_data=f"top_cities_{category}_{page}")
     )
 
-    title = f"🔍 Оголошення в місті «{city}» в категорії {CATEGORY_LABELS[category]} (стор. {page}/{total_pages})"
+    title = f"🔍 Оголошення в місті «{city_text}» в категорії {CATEGORY_LABELS[category]} (стор. {page}/{total_pages})"
 
     if update.message:
         await update.message.reply_text(title, reply_markup=kb)
     else:
         await safe_update(update, new_text=title, new_markup=kb)
 
+    if page < total_pages:
+        prefetch_listing(fetch_ads_by_city, city['id'], category, PAGE_SIZE, page * PAGE_SIZE)
+    prefetch_ad_cards(ads, update.effective_user.id)
+
+async def search_command(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    if update.message:
+        text = " ".join(ctx.args or []).strip()
+        tsquery = build_search_query(text)
+        if not tsquery:
+            return await update.message.reply_text("Будь ласка, вкажіть, що шукати: /search поліграф Київ")
+        total = count_search_ads(tsquery)
+        # курсор (rank, id) останнього оголошення попередньої сторінки
+        ctx.user_data['search'] = {'text': text, 'tsquery': tsquery, 'total': total, 'cursors': {1: None}}
+        NAV_STACK.clear(update.effective_user.id)
+        page = 1
+    else:
+        query = update.callback_query
+        data = query.data  # "search_all_2" або "search_general_2" (повернення з оголошення)
+        try:
+            page = int(data.rsplit("_", 1)[1])
+        except ValueError:
+            return await safe_update(update, new_text="❌ Неправильні дані пагінації.")
+        if not ctx.user_data.get('search'):
+            return await safe_update(update, new_text="🔎 Пошук застарів, повторіть /search.")
+
+    search = ctx.user_data['search']
+    text, tsquery, total = search['text'], search['tsquery'], search['total']
+    if not total:
+        msg = f"🔎 За запитом «{html.escape(text)}» нічого не знайдено."
+        if update.message:
+            return await update.message.reply_text(msg, parse_mode="HTML")
+        return await safe_update(update, new_text=msg)
+
+    total_pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+    page = max(1, min(page, total_pages))
+    cursors = search['cursors']
+    if page in cursors:
+        ads = search_ads(tsquery, limit=PAGE_SIZE, after=cursors[page])
+    else:
+        ads = search_ads(tsquery, limit=PAGE_SIZE, offset=(page - 1) * PAGE_SIZE)
+    if ads:
+        cursors[page + 1] = (ads[-1]['rank'], ads[-1]['id'])
+
+    kb = paginate_keyboard(
+        items=ads,
+        page=page,
+        page_size=PAGE_SIZE,
+        nav_size=NAV_SIZE,
+        label_fn=lambda ad: f"{ad['bot_username']} — {ad['city']} — {ad['price']} — {ad['avg_rating']} ⭐",
+        callback_fn=lambda ad: f"show_ad_{ad['id']}|search|{page}|{ad['category']}",
+        page_callback_prefix="search_all",
+        back_button=InlineKeyboardButton("🏠 Головне меню", callback_data="back"),
+        total=total
+    )
+
+    title = f"🔎 Результати пошуку «{html.escape(text)}» (стор. {page}/{total_pages})"
+
+    if update.message:
+        await update.message.reply_text(title, reply_markup=kb, parse_mode="HTML")
+    else:
+        await safe_update(update, new_text=title, new_markup=kb)
+
 #=========== Допоміжні функції ==========
 
 def paginate_keyboard(
@@ -2547,15 +4161,19 @@ def paginate_keyboard(
     label_fn: Callable[[Any], str],
     callback_fn: Callable[[Any], str],
     page_callback_prefix: str,
-    back_button: InlineKeyboardButton | None = None
+    back_button: InlineKeyboardButton | None = None,
+    total: int | None = None
 ) -> InlineKeyboardMarkup:
-    total = len(items)
+    # total передається, коли items — це вже вибрана з БД сторінка
+    paged = total is not None
+    if not paged:
+        total = len(items)
     total_pages = (total + page_size - 1) // page_size
     page = max(1, min(page, total_pages))
 
     start = (page - 1) * page_size
     end   = start + page_size
-    slice_items = items[start:end]
+    slice_items = items if paged else items[start:end]
 
     keyboard: list[list[InlineKeyboardButton]] = [
         [InlineKeyboardButton(label_fn(item), callback_data=callback_fn(item))]
@@ -2581,27 +4199,228 @@ def paginate_keyboard(
 
     return InlineKeyboardMarkup(keyboard)
 
-async def safe_update(update, new_text=None, new_markup=None):
-    msg = update.callback_query.message
+def parse_list_callback(data: str, prefix: str) -> tuple[str, int] | None:
+    """"menu_{prefix}_{категорія}" — перша сторінка, "{prefix}_{категорія}_{сторінка}" — решта."""
+    if data.startswith(f"menu_{prefix}_"):
+        return data.split("_")[prefix.count("_") + 2], 1
+    if data.startswith(f"{prefix}_"):
+        category, _, page = data[len(prefix) + 1:].partition("_")
+        if category and page.isdigit():
+            return category, int(page)
+    return None
+
+def encode_deep_link(ad_id: int, origin: str, page: int, category: str) -> str:
+    payload = f"show_ad_{ad_id}|{origin}|{page}|{category}"
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_deep_link(b64: str) -> tuple[int, str, int, str]:
+    """Зворотне до encode_deep_link; ValueError на зіпсованому payload."""
+    raw = base64.urlsafe_b64decode(b64 + "=" * (-len(b64) % 4)).decode()
+    parts = raw.split("|")
+    if len(parts) != 4 or not parts[0].startswith("show_ad_"):
+        raise ValueError(f"неочікуваний payload {raw!r}")
+    return int(parts[0].removeprefix("show_ad_")), parts[1], int(parts[2]), parts[3]
+
+def ad_caption(ad_id: int, ad: dict) -> str:
+    # MarkdownV2: усе, що ввів користувач, екранується
+    author = ad['author']
+    esc_author   = escape_markdown(author['bot_username'], version=2)
+    esc_cat      = escape_markdown(CATEGORY_LABELS[ad['category']], version=2)
+    esc_rating   = escape_markdown(f"{author['avg_rating']:.2f}", version=2)
+    esc_city     = escape_markdown(ad['city'], version=2)
+    esc_price    = escape_markdown(ad['price'], version=2)
+    esc_desc     = escape_markdown(ad['desc'], version=2)
+    return (
+        f"Оголошення №{ad_id}:\n"
+        f"👤 Виконавець: {esc_author}\n"
+        f"⭐️ Середній рейтинг виконавця: {esc_rating} ⭐️\n"
+        f"📂 Категорія: {esc_cat}\n"
+        f"📍 Місто: {esc_city}\n"
+        f"💰 Ціна: {esc_price}\n\n"
+        f"📝 Опис:\n{esc_desc}"
+    )
 
-    if new_text is not None and msg.text is not None:
-        try:
-            await update.callback_query.edit_message_text(
-                text=new_text,
-                reply_markup=new_markup or msg.reply_markup,
-                parse_mode="HTML"
+def message_hash(text: str, markup, parse_mode: str, photo_id: str | None) -> str:
+    markup_repr = repr(markup.to_dict()) if markup else ""
+    return hashlib.sha1(f"{photo_id}\x00{parse_mode}\x00{text}\x00{markup_repr}".encode()).hexdigest()
+
+def remember_message(msg: Message, content_hash: str, photo_id: str | None):
+    MESSAGE_STATE.set(msg.chat_id, {
+        'message_id': msg.message_id,
+        'kind':       'photo' if photo_id else 'text',
+        'photo_id':   photo_id,
+        'hash':       content_hash,
+        'edit_date':  msg.edit_date,
+    })
+
+async def render_message(
+    bot,
+    chat_id: int,
+    text: str,
+    markup=None,
+    parse_mode: str = "HTML",
+    photo_id: str | None = None,
+    message_id: int | None = None,
+    current: Message | None = None
+):
+    """Показує text (або фото з підписом) у message_id одним правильним викликом API.
+
+    Тип і вміст повідомлення беруться з MESSAGE_STATE, якщо запис стосується того ж повідомлення
+    і його ніхто не редагував в обхід (edit_date збігається з current); інакше — з current.
+    Однаковий вміст не редагується; фото <-> текст замінюється новим повідомленням.
+    """
+    content_hash = message_hash(text, markup, parse_mode, photo_id)
+    kind  = 'photo' if photo_id else 'text'
+    captured = _nav_capture.get()
+    if captured is not None:
+        captured.append({'text': text, 'markup': markup, 'parse_mode': parse_mode, 'photo_id': photo_id})
+    state = MESSAGE_STATE.get(chat_id)
+    if not (state and message_id and state['message_id'] == message_id
+            and (current is None or current.edit_date == state['edit_date'])):
+        state = None
+
+    if message_id:
+        if state:
+            current_kind, current_photo = state['kind'], state['photo_id']
+            if state['hash'] == content_hash:
+                return None
+        elif current is not None:
+            current_kind  = 'photo' if current.photo else 'text'
+            current_photo = current.photo[-1].file_id if current.photo else None
+        else:
+            current_kind, current_photo = 'text', None
+
+        if current_kind == kind:
+            try:
+                if kind == 'text':
+                    msg = await bot.edit_message_text(
+                        chat_id=chat_id, message_id=message_id,
+                        text=text, parse_mode=parse_mode, reply_markup=markup
+                    )
+                elif current_photo == photo_id:
+                    msg = await bot.edit_message_caption(
+                        chat_id=chat_id, message_id=message_id,
+                        caption=text, parse_mode=parse_mode, reply_markup=markup
+                    )
+                else:
+                    msg = await bot.edit_message_media(
+                        chat_id=chat_id, message_id=message_id,
+                        media=InputMediaPhoto(photo_id, caption=text, parse_mode=parse_mode),
+                        reply_markup=markup
+                    )
+                remember_message(msg, content_hash, photo_id)
+                return msg
+            except BadRequest as e:
+                if "Message is not modified" in str(e):
+                    return None
+                # повідомлення видалене або застаре для редагування — надсилаємо нове
+        else:
+            try:
+                await bot.delete_message(chat_id=chat_id, message_id=message_id)
+            except BadRequest:
+                pass
+
+    if photo_id:
+        msg = await bot.send_photo(
+            chat_id=chat_id, photo=photo_id,
+            caption=text, parse_mode=parse_mode, reply_markup=markup
+        )
+    else:
+        msg = await bot.send_message(
+            chat_id=chat_id,
+            text=text, parse_mode=parse_mode, reply_markup=markup
+        )
+    remember_message(msg, content_hash, photo_id)
+    return msg
+
+# (chat_id, message_id) -> (обробник, найсвіжіший callback), який ще не відмальовано;
+# обробник зберігається разом з update, бо на одному повідомленні є кнопки різних маршрутів
+_pending_renders: dict[tuple[int, int], tuple] = {}
+_active_renders: set[tuple[int, int]] = set()
+
+# екрани, відмальовані render_message під час роботи обробника, обгорнутого nav_cached
+_nav_capture: ContextVar[list | None] = ContextVar("nav_capture", default=None)
+# ключі user_data, які обробники списків і карток встановлюють для кнопок «Назад»
+NAV_STATE_KEYS = ('ads_category', '_caller_id', 'current_ad_id', 'current_origin', 'current_page')
+
+def nav_route(data: str) -> str:
+    # «menu_all_ads_general» відкриває той самий екран, що й кнопка «all_ads_general_1»
+    m = re.match(r"^menu_((?:all_ads|top_ads|top_cities|price_ads)_[^_]+)$", data)
+    return f"{m.group(1)}_1" if m else data
+
+def nav_cached(handler):
+    """Віддає раніше відмальований екран з NAV_STACK одним редагуванням, інакше викликає handler.
+
+    Обробник має залежати лише від callback_data (і NAV_STATE_KEYS, які він сам встановлює —
+    вони відновлюються разом з екраном); callback має бути вже відповіданий (debounced).
+    """
+    @functools.wraps(handler)
+    async def wrapper(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        user_id = query.from_user.id
+        route = nav_route(query.data)
+
+        cached = NAV_STACK.get(user_id, route)
+        if cached:
+            screen, state = cached
+            ctx.user_data.update(state)
+            return await render_message(
+                update.get_bot(),
+                chat_id=query.message.chat_id,
+                message_id=query.message.message_id,
+                current=query.message,
+                **screen
             )
-            return
-        except BadRequest as e:
-            if "Message is not modified" not in str(e):
-                raise
 
-    await msg.delete()
+        captured = []
+        token = _nav_capture.set(captured)
+        try:
+            result = await handler(update, ctx)
+        finally:
+            _nav_capture.reset(token)
+        if len(captured) == 1:
+            state = {k: ctx.user_data[k] for k in NAV_STATE_KEYS if k in ctx.user_data}
+            NAV_STACK.push(user_id, route, captured[0], state)
+        return result
+    return wrapper
+
+def debounced(handler):
+    """Згортає серію натискань на одному повідомленні в одне відмальовування останнього з них.
+
+    Кожен callback отримує відповідь одразу; поки триває рендер, новіші натискання лише
+    замінюють очікуваний update, і після завершення відмальовується найсвіжіший — обробником
+    його власного маршруту.
+    Реєструвати з block=False, інакше оновлення не надходитимуть паралельно.
+    """
+    @functools.wraps(handler)
+    async def wrapper(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        await query.answer()
+        key = (query.message.chat_id, query.message.message_id)
+        _pending_renders[key] = (handler, update)
+        if key in _active_renders:
+            return
+        _active_renders.add(key)
+        try:
+            while key in _pending_renders:
+                pending_handler, pending_update = _pending_renders.pop(key)
+                await pending_handler(pending_update, ctx)
+        finally:
+            _active_renders.discard(key)
+    return wrapper
 
-    await update.callback_query.message.chat.send_message(
-        text=new_text or msg.text or "",
-        reply_markup=new_markup,
-        parse_mode="HTML"
+async def safe_update(update, new_text=None, new_markup=None):
+    msg = update.callback_query.message
+    # текстове повідомлення без нової клавіатури зберігає стару; фото замінюється новим повідомленням
+    markup = new_markup if (new_markup or msg.photo) else msg.reply_markup
+
+    await render_message(
+        update.get_bot(),
+        chat_id=msg.chat_id,
+        text=new_text if new_text is not None else (msg.text or msg.caption or ""),
+        markup=markup,
+        message_id=msg.message_id,
+        current=msg
     )
 
 #================== REVIEW ==============
@@ -2618,12 +4437,12 @@ async def review_start(update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> int:
     executor_id = int(m.group(2))
     requester_id = query.from_user.id
 
-    ad = fetch_ad_by_id(ad_id)
-    if not ad:
+    eligibility = fetch_review_eligibility(ad_id, requester_id, executor_id)
+    if not eligibility['ad_exists']:
         await query.edit_message_text("❌ Це оголошення більше не існує.")
         return ConversationHandler.END
 
-    accepted_count = count_accepted_applications(requester_id, executor_id)
+    accepted_count = eligibility['accepted_cnt']
     if accepted_count == 0:
         await ctx.bot.send_message(
             chat_id=query.message.chat_id,
@@ -2631,7 +4450,7 @@ async def review_start(update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> int:
         )
         return ConversationHandler.END
 
-    review_count = count_reviews_by_author_for_executor(requester_id, executor_id)
+    review_count = eligibility['reviews_cnt']
     if review_count >= accepted_count:
         await ctx.bot.send_message(
             chat_id=query.message.chat_id,
@@ -2744,7 +4563,6 @@ async def review_cancel(update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> int:
 
 async def my_reviews_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
 
     user_id = query.from_user.id
 
@@ -2789,7 +4607,6 @@ async def my_reviews_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def reviews_about_me_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
 
     user_id = query.from_user.id
 
@@ -2802,8 +4619,8 @@ async def reviews_about_me_handler(update: Update, ctx: ContextTypes.DEFAULT_TYP
     else:
         page = 1
 
-    reviews = fetch_reviews_for_user(user_id)
-    if not reviews:
+    total = fetch_user_rating(user_id)['cnt']
+    if not total:
         reply_markup = InlineKeyboardMarkup([
             [InlineKeyboardButton("Особистий кабінет", callback_data="account")]
         ])
@@ -2813,13 +4630,16 @@ async def reviews_about_me_handler(update: Update, ctx: ContextTypes.DEFAULT_TYP
             reply_markup=reply_markup
         )
 
-    total_pages = (len(reviews) + PAGE_SIZE - 1) // PAGE_SIZE
+    total_pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+    page = max(1, min(page, total_pages))
+    reviews = fetch_reviews_for_user(user_id, limit=PAGE_SIZE, offset=(page - 1) * PAGE_SIZE)
 
     kb = paginate_keyboard(
         items=reviews,
         page=page,
         page_size=PAGE_SIZE,
         nav_size=NAV_SIZE,
+        total=total,
         label_fn=lambda rev: (
             f"{rev['author']['bot_username']} — {rev['rating']}⭐" +
             (f" — {rev['comment']}" if rev['comment'] else "")
@@ -2919,14 +4739,7 @@ async def delete_review_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if review['author_id'] != query.from_user.id:
         return await query.edit_message_text("❌ Ви не можете видалити цей відгук.")
 
-    conn = psycopg2.connect(
-        host=DB_HOST, dbname=DB_NAME,
-        user=DB_USER, password=DB_PASS
-    )
-    with conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM reviews WHERE id = %s", (review_id,))
-    conn.close()
+    delete_review(review_id)
 
     await ctx.bot.send_message(
         chat_id=query.message.chat_id,
@@ -2938,7 +4751,7 @@ async def delete_review_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 # ============= Нагадування ================
 
 async def send_due_reminders(context):
-    conn = psycopg2.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS, cursor_factory=RealDictCursor)
+    conn = db_connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS, cursor_factory=RealDictCursor)
     with conn:
         with conn.cursor() as cur:
             cur.execute("""
@@ -2988,7 +4801,7 @@ async def cancel_reminder_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE
     query = update.callback_query
     app_id = int(query.data.rsplit("_", 1)[1])
 
-    conn = psycopg2.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS)
+    conn = db_connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS)
     with conn:
         with conn.cursor() as cur:
             cur.execute("""
@@ -3009,7 +4822,7 @@ async def snooze_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
 
     app_id = int(query.data.rsplit("_", 1)[1])
-    conn = psycopg2.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS)
+    conn = db_connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS)
     with conn:
         with conn.cursor() as cur:
             cur.execute("""
@@ -3027,8 +4840,217 @@ async def snooze_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     await query.answer("Нагадую ще раз через добу ⏰", show_alert=True)
 
+async def backfill_ad_prices(context):
+    conn = db_connect(**DB_PARAMS, cursor_factory=RealDictCursor)
+    last_id = 0
+    updated = 0
+    try:
+        while True:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT id, price, price_min, price_max, price_currency
+                          FROM ads
+                         WHERE id > %s
+                           AND price_parser IS DISTINCT FROM %s
+                         ORDER BY id
+                         LIMIT 500
+                    """, (last_id, PRICE_PARSER_VERSION))
+                    rows = cur.fetchall()
+                    if not rows:
+                        break
+                    # нерозпізнані ціни теж позначаються версією, щоб не перечитувати їх на кожному старті
+                    parsed = [(*parse_price(r['price']), PRICE_PARSER_VERSION, r['id']) for r in rows]
+                    cur.executemany("""
+                        UPDATE ads
+                           SET price_min = %s,
+                               price_max = %s,
+                               price_currency = %s,
+                               price_parser = %s
+                         WHERE id = %s
+                    """, parsed)
+                    changed = [p[4] for p, r in zip(parsed, rows)
+                               if p[:3] != (r['price_min'], r['price_max'], r['price_currency'])]
+                    if changed:
+                        refresh_ads_listing(cur, "a.id = ANY(%s)", (changed,))
+                    updated += len(changed)
+                    last_id = rows[-1]['id']
+    finally:
+        conn.close()
+    if updated:
+        logger.info(f"[backfill_ad_prices] Оновлено ціни для {updated} оголошень")
+
+async def backfill_ad_cities(context):
+    conn = db_connect(**DB_PARAMS, cursor_factory=RealDictCursor)
+    last_id = 0
+    updated = 0
+    try:
+        while True:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT id, city
+                          FROM ads
+                         WHERE id > %s
+                           AND city_id IS NULL
+                           AND city IS NOT NULL
+                         ORDER BY id
+                         LIMIT 500
+                    """, (last_id,))
+                    rows = cur.fetchall()
+                    if not rows:
+                        break
+                    cities = lookup_cities(cur, {r['city'] for r in rows})
+                    resolved = [(cities[city_key(r['city'])]['id'], r['id'])
+                                for r in rows if city_key(r['city']) in cities]
+                    cur.executemany("UPDATE ads SET city_id = %s WHERE id = %s", resolved)
+                    updated += len(resolved)
+                    last_id = rows[-1]['id']
+    finally:
+        conn.close()
+    if updated:
+        logger.info(f"[backfill_ad_cities] Прив'язано до довідника міст {updated} оголошень")
+        await reconcile_city_stats(context)
+        await reconcile_ads_listing(context)
+
+async def reconcile_city_stats(context):
+    conn = db_connect(**DB_PARAMS)
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                # блокуємо інкрементальні оновлення, поки перераховуємо лічильники
+                cur.execute("LOCK TABLE city_stats IN EXCLUSIVE MODE")
+                cur.execute("""
+                    WITH actual AS (
+                        SELECT a.category, a.city_id, c.name AS city, COUNT(*) AS cnt
+                          FROM ads a
+                          JOIN cities c ON c.id = a.city_id
+                         WHERE a.category IS NOT NULL
+                         GROUP BY a.category, a.city_id, c.name
+                    ),
+                    fixed AS (
+                        INSERT INTO city_stats (category, city_id, city, cnt)
+                        SELECT category, city_id, city, cnt FROM actual
+                        ON CONFLICT (category, city_id) DO UPDATE
+                           SET cnt = EXCLUDED.cnt
+                         WHERE city_stats.cnt <> EXCLUDED.cnt
+                        RETURNING 1
+                    ),
+                    removed AS (
+                        DELETE FROM city_stats s
+                         WHERE NOT EXISTS (
+                                 SELECT 1 FROM actual
+                                  WHERE actual.category = s.category
+                                    AND actual.city_id  = s.city_id
+                               )
+                        RETURNING 1
+                    )
+                    SELECT (SELECT COUNT(*) FROM fixed) + (SELECT COUNT(*) FROM removed)
+                """)
+                drift = cur.fetchone()[0]
+    finally:
+        conn.close()
+    if drift:
+        INLINE_CACHE.clear()
+        logger.warning(f"[reconcile_city_stats] Виправлено {drift} записів city_stats")
+
+async def reconcile_user_ratings(context):
+    conn = db_connect(**DB_PARAMS)
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                # блокуємо інкрементальні оновлення, поки звіряємо агрегати з reviews
+                cur.execute("LOCK TABLE user_ratings IN EXCLUSIVE MODE")
+                cur.execute(f"""
+                    WITH actual AS ({USER_RATINGS_SQL}),
+                    fixed AS (
+                        INSERT INTO user_ratings (user_id, cnt, total, r1, r2, r3, r4, r5)
+                        SELECT user_id, cnt, total, r1, r2, r3, r4, r5 FROM actual
+                        ON CONFLICT (user_id) DO UPDATE
+                           SET cnt   = EXCLUDED.cnt,
+                               total = EXCLUDED.total,
+                               r1 = EXCLUDED.r1, r2 = EXCLUDED.r2, r3 = EXCLUDED.r3,
+                               r4 = EXCLUDED.r4, r5 = EXCLUDED.r5
+                         WHERE (user_ratings.*) IS DISTINCT FROM (EXCLUDED.*)
+                        RETURNING user_id
+                    ),
+                    removed AS (
+                        DELETE FROM user_ratings r
+                         WHERE NOT EXISTS (SELECT 1 FROM actual WHERE actual.user_id = r.user_id)
+                        RETURNING user_id
+                    ),
+                    averages AS (
+                        UPDATE users u
+                           SET avg_rating = COALESCE(ROUND(actual.total::NUMERIC / actual.cnt, 2), 0)
+                          FROM users u2
+                          LEFT JOIN actual ON actual.user_id = u2.id
+                         WHERE u.id = u2.id
+                           AND u.avg_rating IS DISTINCT FROM COALESCE(ROUND(actual.total::NUMERIC / actual.cnt, 2), 0)
+                        RETURNING u.id
+                    )
+                    SELECT (SELECT COUNT(*) FROM fixed) + (SELECT COUNT(*) FROM removed),
+                           ARRAY(SELECT id FROM averages)
+                """)
+                drift, users = cur.fetchone()
+                if users:
+                    refresh_ads_listing(cur, "a.user_id = ANY(%s)", (users,))
+    finally:
+        conn.close()
+    if drift or users:
+        invalidate_read_caches()
+        logger.warning(f"[reconcile_user_ratings] Виправлено {drift} агрегатів, {len(users)} середніх рейтингів")
+
+async def rebuild_pair_interactions(context):
+    conn = db_connect(**DB_PARAMS)
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("LOCK TABLE pair_interactions IN EXCLUSIVE MODE")
+                cur.execute(f"""
+                    WITH actual AS ({PAIR_INTERACTIONS_SQL}),
+                    fixed AS (
+                        INSERT INTO pair_interactions (user_a, user_b, accepted_cnt, reviews_cnt)
+                        SELECT user_a, user_b, accepted_cnt, reviews_cnt FROM actual
+                        ON CONFLICT (user_a, user_b) DO UPDATE
+                           SET accepted_cnt = EXCLUDED.accepted_cnt,
+                               reviews_cnt  = EXCLUDED.reviews_cnt
+                         WHERE (pair_interactions.accepted_cnt, pair_interactions.reviews_cnt)
+                               IS DISTINCT FROM (EXCLUDED.accepted_cnt, EXCLUDED.reviews_cnt)
+                        RETURNING 1
+                    ),
+                    removed AS (
+                        DELETE FROM pair_interactions p
+                         WHERE NOT EXISTS (
+                                 SELECT 1 FROM actual
+                                  WHERE actual.user_a = p.user_a
+                                    AND actual.user_b = p.user_b
+                               )
+                        RETURNING 1
+                    )
+                    SELECT (SELECT COUNT(*) FROM fixed) + (SELECT COUNT(*) FROM removed)
+                """)
+                drift = cur.fetchone()[0]
+    finally:
+        conn.close()
+    if drift:
+        invalidate_read_caches()
+        logger.warning(f"[rebuild_pair_interactions] Виправлено {drift} записів pair_interactions")
+
+async def reconcile_ads_listing(context):
+    # підтягує зміни, що оминули репозиторні функції (бекфіли, ручні правки, тригер рейтингу)
+    conn = db_connect(**DB_PARAMS)
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                drift = refresh_ads_listing(cur, "TRUE")
+    finally:
+        conn.close()
+    if drift:
+        invalidate_read_caches()
+        logger.warning(f"[reconcile_ads_listing] Оновлено {drift} записів ads_listing")
+
 async def send_new_ads_notifications(context):
-    conn = psycopg2.connect(
+    conn = db_connect(
         host=DB_HOST, dbname=DB_NAME,
         user=DB_USER, password=DB_PASS,
         cursor_factory=RealDictCursor
@@ -3099,10 +5121,8 @@ async def send_new_ads_notifications(context):
                         f"📝 {short_desc}"
                     )
 
-                    raw = f"show_ad_{ad_id}|all_ads|1|{category}"
-                    b64 = base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
                     bot_username = context.bot.username
-                    link = f"https://t.me/{bot_username}?start={b64}"
+                    link = f"https://t.me/{bot_username}?start={encode_deep_link(ad_id, 'all_ads', 1, category)}"
                     text += f"\n\n👀 <a href=\"{link}\">Переглянути оголошення</a>"
 
                     for uid in targets:
@@ -3212,9 +5232,106 @@ change_nick_conv = ConversationHandler(
     per_chat=True
 )
 
-if __name__ == "__main__":
-    print(f"{Fore.GREEN}База даних готова — стартую бота!")
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+# ====== Запис вебхук-трафіку ======
+# персональні поля Telegram-об'єктів, які не потрапляють у запис (first_name обов'язкове для User — замінюється)
+RECORD_DROP_FIELDS = {"last_name", "username", "phone_number", "language_code"}
+RECORD_ID_FIELDS = {"id", "user_id", "chat_id"}
+# Псевдоніми отримують: id користувачів — у RECORD_ID_FIELDS, на позиціях RECORD_CALLBACK_USER_IDS
+# у callback_data і ті самі числа в text/caption; id оголошень — лише з UPDATE_RECORD_REMAP_ADS,
+# на позиціях RECORD_CALLBACK_AD_IDS і в payload /start. Id заявок і відгуків не змінюються.
+# Група 2 кожного шаблону — id, що замінюється.
+RECORD_CALLBACK_USER_IDS = (
+    re.compile(r"^(review_ad_\d+_)(\d+)$"),
+    re.compile(r"^((?:menu|sub|unsub)_user_)(\d+)"),
+    re.compile(r"(reviews_about_user_)(\d+)"),
+)
+RECORD_CALLBACK_AD_IDS = (
+    re.compile(r"^((?:apply|edit_ad|delete_ad)_)(\d+)$"),
+    re.compile(r"^(show_ad_)(\d+)"),
+)
+RE_NUMBER = re.compile(r"\d+")
+
+def anonymize_id(value: int) -> int:
+    # HMAC стабільний між записами, тож той самий користувач лишається тим самим і після анонімізації
+    digest = hmac.new(UPDATE_RECORD_KEY, str(value).encode(), hashlib.sha256).digest()
+    return 7_000_000_000 + int.from_bytes(digest[:8], "big") % 1_000_000_000
+
+def anonymize_ad_id(value: int) -> int:
+    # ads.id — INTEGER, тож псевдонім лишається в його межах
+    digest = hmac.new(UPDATE_RECORD_KEY, f"ad:{value}".encode(), hashlib.sha256).digest()
+    return 1_000_000_000 + int.from_bytes(digest[:8], "big") % 1_000_000_000
+
+def collect_user_ids(obj, key: str | None = None, found: set | None = None) -> set[int]:
+    found = set() if found is None else found
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            collect_user_ids(v, k, found)
+    elif isinstance(obj, list):
+        for v in obj:
+            collect_user_ids(v, None, found)
+    elif key in RECORD_ID_FIELDS and isinstance(obj, int):
+        found.add(obj)
+    return found
+
+def remap_callback(data: str) -> str:
+    for patterns, remap in ((RECORD_CALLBACK_USER_IDS, anonymize_id),
+                            (RECORD_CALLBACK_AD_IDS if UPDATE_RECORD_REMAP_ADS else (), anonymize_ad_id)):
+        for pattern in patterns:
+            data = pattern.sub(lambda m: f"{m.group(1)}{remap(int(m.group(2)))}", data)
+    return data
+
+def remap_text(text: str, user_ids: set[int]) -> str:
+    command, _, payload = text.partition(" ")
+    if command == "/start" and payload:
+        # payload — base64 (decode_deep_link); цифри в ньому не є числами тексту
+        if not UPDATE_RECORD_REMAP_ADS:
+            return text
+        try:
+            ad_id, origin, page, category = decode_deep_link(payload)
+        except ValueError:
+            return text
+        return f"/start {encode_deep_link(anonymize_ad_id(ad_id), origin, page, category)}"
+    # у вільному тексті замінюються лише числа, що збігаються з id користувачів цього ж update
+    return RE_NUMBER.sub(lambda m: str(anonymize_id(int(m.group()))) if int(m.group()) in user_ids else m.group(), text)
+
+def anonymize_update(update: dict) -> dict:
+    return _anonymize(update, None, collect_user_ids(update))
+
+def _anonymize(obj, key: str | None, user_ids: set[int]):
+    if isinstance(obj, dict):
+        return {k: _anonymize(v, k, user_ids) for k, v in obj.items() if k not in RECORD_DROP_FIELDS}
+    if isinstance(obj, list):
+        return [_anonymize(v, None, user_ids) for v in obj]
+    if key in RECORD_ID_FIELDS and isinstance(obj, int):
+        return anonymize_id(obj)
+    if key == "first_name":
+        return "Anon"
+    if key == "data" and isinstance(obj, str):
+        return remap_callback(obj)
+    if key in ("text", "caption") and isinstance(obj, str):
+        return remap_text(obj, user_ids)
+    return obj
+
+def build_update_recorder() -> logging.Logger | None:
+    if not UPDATE_RECORD_FILE:
+        return None
+    recorder = logging.getLogger("updates.record")
+    recorder.propagate = False
+    handler = RotatingFileHandler(
+        UPDATE_RECORD_FILE, maxBytes=UPDATE_RECORD_MAX_MB * 1024 * 1024, backupCount=5, encoding="utf-8"
+    )
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    recorder.addHandler(handler)
+    return recorder
+
+def build_application(request: BaseRequest | None = None):
+    # request підміняють бенчмарки (bench/) заглушкою Bot API
+    builder = ApplicationBuilder().token(BOT_TOKEN).request(request or MetricsRequest(connection_pool_size=256))
+    if BOT_API_BASE_URL:
+        builder = builder.base_url(f"{BOT_API_BASE_URL}/bot").base_file_url(f"{BOT_API_BASE_URL}/file/bot")
+    if BOT_RATE_LIMITER:
+        builder = builder.rate_limiter(AIORateLimiter(max_retries=3))
+    app = builder.build()
 
     app.add_handler(review_conv)
     app.add_handler(conv_handler)
@@ -3223,29 +5340,36 @@ if __name__ == "__main__":
     app.add_handler(CommandHandler("help", support_handler))
     app.add_handler(CommandHandler("community", community_handler))
     app.add_handler(CommandHandler("account", account_handler))
+    app.add_handler(CommandHandler("dbstats", dbstats_handler))
+    app.add_handler(CommandHandler("profile", profile_handler, block=False))
     app.add_handler(CallbackQueryHandler(view_ads_start, pattern=r"^view_ads_[^_]+$"))
     app.add_handler(CallbackQueryHandler(account_handler, pattern="^account$"))
     app.add_handler(CallbackQueryHandler(community_handler, pattern="^community$"))
     app.add_handler(CallbackQueryHandler(support_handler, pattern="^support$"))
-    app.add_handler(CallbackQueryHandler(all_ads_handler, pattern=r"^menu_all_ads_[^_]+$")) 
-    app.add_handler(CallbackQueryHandler(all_ads_handler, pattern=r"^all_ads_[^_]+_\d+$" ))
-    app.add_handler(CallbackQueryHandler(menu_top_ads_handler,   pattern=r"^menu_top_ads_[^_]+$"))
-    app.add_handler(CallbackQueryHandler(menu_top_ads_handler,   pattern=r"^top_ads_[^_]+_\d+$"))
-    app.add_handler(CallbackQueryHandler(menu_top_cities_handler,pattern=r"^menu_top_cities_[^_]+$"))
-    app.add_handler(CallbackQueryHandler(menu_top_cities_handler,pattern=r"^top_cities_[^_]+_\d+$"))
-    app.add_handler(CallbackQueryHandler(show_ad_handler, pattern="^show_ad_"))
-    app.add_handler(CallbackQueryHandler(reviews_about_user_handler, pattern=r"^reviews_about_user_\d+_[^_]+_\d+$"))
+    app.add_handler(CallbackQueryHandler(debounced(nav_cached(all_ads_handler)), pattern=r"^menu_all_ads_[^_]+$", block=False))
+    app.add_handler(CallbackQueryHandler(debounced(nav_cached(all_ads_handler)), pattern=r"^all_ads_[^_]+_\d+$", block=False))
+    app.add_handler(CallbackQueryHandler(debounced(nav_cached(menu_top_ads_handler)), pattern=r"^menu_top_ads_[^_]+$", block=False))
+    app.add_handler(CallbackQueryHandler(debounced(nav_cached(menu_top_ads_handler)), pattern=r"^top_ads_[^_]+_\d+$", block=False))
+    app.add_handler(CallbackQueryHandler(debounced(nav_cached(price_ads_handler)), pattern=r"^menu_price_ads_[^_]+$", block=False))
+    app.add_handler(CallbackQueryHandler(debounced(nav_cached(price_ads_handler)), pattern=r"^price_ads_[^_]+_\d+$", block=False))
+    app.add_handler(CommandHandler("price", price_ads_handler))
+    app.add_handler(CallbackQueryHandler(debounced(nav_cached(menu_top_cities_handler)), pattern=r"^menu_top_cities_[^_]+$", block=False))
+    app.add_handler(CallbackQueryHandler(debounced(nav_cached(menu_top_cities_handler)), pattern=r"^top_cities_[^_]+_\d+$", block=False))
+    app.add_handler(CallbackQueryHandler(debounced(nav_cached(show_ad_handler)), pattern="^show_ad_", block=False))
+    app.add_handler(CallbackQueryHandler(debounced(reviews_about_user_handler), pattern=r"^reviews_about_user_\d+_[^_]+_\d+$", block=False))
     app.add_handler(CallbackQueryHandler(back_to_main_handler, pattern="^back$"))
     app.add_handler(InlineQueryHandler(inline_city_suggest))
     app.add_handler(CommandHandler("city", city_command))
-    app.add_handler(CallbackQueryHandler(city_command, pattern=r"^city_.+_.+_\d+$"))
-    app.add_handler(CallbackQueryHandler(my_ads_handler, pattern="^my_ads(_\\d+)?$"))
-    app.add_handler(CallbackQueryHandler(my_apps_handler, pattern=r"^my_apps(?:_\d+)?$"))
-    app.add_handler(CallbackQueryHandler(my_subs_handler, pattern=r"^my_subs(?:_\d+)?$"))
+    app.add_handler(CommandHandler("search", search_command))
+    app.add_handler(CallbackQueryHandler(debounced(nav_cached(search_command)), pattern=r"^search_[^_]+_\d+$", block=False))
+    app.add_handler(CallbackQueryHandler(debounced(nav_cached(city_command)), pattern=r"^city_.+_.+_\d+$", block=False))
+    app.add_handler(CallbackQueryHandler(debounced(nav_cached(my_ads_handler)), pattern="^my_ads(_\\d+)?$", block=False))
+    app.add_handler(CallbackQueryHandler(debounced(nav_cached(my_apps_handler)), pattern=r"^my_apps(?:_\d+)?$", block=False))
+    app.add_handler(CallbackQueryHandler(debounced(nav_cached(my_subs_handler)), pattern=r"^my_subs(?:_\d+)?$", block=False))
     app.add_handler(CallbackQueryHandler(show_app_handler, pattern=r"^show_app_\d+\|my_apps\|\d+$"))
     app.add_handler(CallbackQueryHandler(delete_ad_handler, pattern=r"^delete_ad_\d+$"))
-    app.add_handler(CallbackQueryHandler(my_reviews_handler, pattern=r"^my_reviews(_\d+)?$"))
-    app.add_handler(CallbackQueryHandler(reviews_about_me_handler, pattern=r"^reviews_about(_\d+)?$"))
+    app.add_handler(CallbackQueryHandler(debounced(nav_cached(my_reviews_handler)), pattern=r"^my_reviews(_\d+)?$", block=False))
+    app.add_handler(CallbackQueryHandler(debounced(nav_cached(reviews_about_me_handler)), pattern=r"^reviews_about(_\d+)?$", block=False))
     app.add_handler(CallbackQueryHandler(show_review_handler, pattern=r"^show_review_"))
     app.add_handler(CallbackQueryHandler(delete_review_handler, pattern=r"^delete_review_\d+$"))
     app.add_handler(CallbackQueryHandler(apply_handler,  pattern=r"^apply_\d+$"))
@@ -3261,18 +5385,69 @@ if __name__ == "__main__":
     app.add_handler(CallbackQueryHandler(unsubscribe_category_handler, pattern=r"^unsub_cat"))
     app.add_handler(CallbackQueryHandler(unsubscribe_user_handler, pattern=r"^unsub_user"))
 
-    app.job_queue.run_repeating(callback=send_due_reminders, interval= 10 * 60, first=60)
+    app.job_queue.run_repeating(callback=timed_job(send_due_reminders), interval= 10 * 60, first=60)
 
-    app.job_queue.run_repeating(send_new_ads_notifications, interval= 10 * 60, first=30)
+    app.job_queue.run_repeating(timed_job(send_new_ads_notifications), interval= 10 * 60, first=30)
 
-    logging.basicConfig(level=logging.INFO)
+    app.job_queue.run_once(timed_job(backfill_ad_prices), when=5)
+    app.job_queue.run_once(timed_job(backfill_ad_cities), when=10)
+    app.job_queue.run_repeating(timed_job(reconcile_city_stats), interval=60 * 60, first=15)
+    app.job_queue.run_repeating(timed_job(reconcile_user_ratings), interval=60 * 60, first=20)
+    app.job_queue.run_repeating(timed_job(rebuild_pair_interactions), interval=60 * 60, first=22)
+    app.job_queue.run_repeating(timed_job(reconcile_ads_listing), interval=60 * 60, first=25)
 
-    app.run_webhook(
-        listen="0.0.0.0",
-        port=8001,
-        url_path=WEBHOOK_PATH,
-        webhook_url=WEBHOOK_URL,
-        drop_pending_updates=True
-    )
+    for handlers in app.handlers.values():
+        instrument_handlers(handlers)
+    app.add_error_handler(error_handler)
+    return app
 
-    print(f"{Fore.GREEN}Бот запущено — очікую повідомлень!")
+def build_web_app(app) -> web.Application:
+    recorder = build_update_recorder()
+
+    async def webhook(request: web.Request) -> web.Response:
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if recorder:
+            recorder.info(json.dumps({"ts": time.time(), "update": anonymize_update(data)}, ensure_ascii=False))
+        await app.update_queue.put(Update.de_json(data, app.bot))
+        return web.Response()
+
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+    web_app = web.Application()
+    web_app.router.add_post(f"/{WEBHOOK_PATH}", webhook)
+    web_app.router.add_get(METRICS_PATH, metrics)
+    return web_app
+
+async def run_bot(app):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    loop.add_signal_handler(signal.SIGUSR2, start_profiler, PROFILE_SECONDS)
+
+    async with app:
+        await app.start()
+        lag_task, watchdog_stop = start_loop_watchdog()
+        await app.bot.set_webhook(url=WEBHOOK_URL, drop_pending_updates=True)
+        runner = web.AppRunner(build_web_app(app))
+        await runner.setup()
+        await web.TCPSite(runner, "0.0.0.0", WEBHOOK_PORT).start()
+        print(f"{Fore.GREEN}Бот запущено — очікую повідомлень!")
+        try:
+            await stop.wait()
+        finally:
+            lag_task.cancel()
+            watchdog_stop.set()
+            await runner.cleanup()
+            await app.stop()
+
+if __name__ == "__main__":
+    init_db()
+    print(f"{Fore.GREEN}База даних готова — стартую бота!")
+    logging.basicConfig(level=logging.INFO)
+    app = build_application()
+    asyncio.run(run_bot(app))
@@ -0,0 +1,66 @@
+import pytest
+
+import bot
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    bot.invalidate_read_caches()
+    yield
+    bot.invalidate_read_caches()
+
+
+def push(user_id, route):
+    bot.NAV_STACK.push(user_id, route, {'text': route, 'markup': None}, {})
+
+
+@pytest.mark.parametrize("route, scope", [
+    ("all_ads_general_2", ("general", None)),
+    ("top_cities_other_1", ("other", None)),
+    ("search_search_3", ("search", None)),
+    ("city_12_general_1", ("general", None)),
+    ("show_ad_5|all_ads|2|other", ("other", 5)),
+    ("my_ads_2", (None, None)),
+    ("my_subs", (None, None)),
+])
+def test_nav_route_scope(route, scope):
+    assert bot.nav_route_scope(route) == scope
+
+
+def test_write_in_one_category_keeps_other_users_stack():
+    push(1, "all_ads_general_1")
+    push(1, "my_ads")
+    push(2, "all_ads_other_1")
+    push(2, "show_ad_7|all_ads|1|other")
+    push(2, "all_ads_general_1")
+    push(2, "my_ads")
+    bot.LISTING_CACHE.set(("fetch_ads", "general", 10, 0), [])
+    bot.LISTING_CACHE.set(("fetch_ads_by_city", 12, "other", 10, 0), [])
+
+    # користувач 1 додає оголошення в general
+    bot.invalidate_read_caches(categories=["general"], user_ids=[1])
+
+    assert bot.NAV_STACK.get(1, "my_ads") is None
+    assert bot.NAV_STACK.get(2, "all_ads_general_1") is None
+    assert bot.NAV_STACK.get(2, "all_ads_other_1")
+    assert bot.NAV_STACK.get(2, "show_ad_7|all_ads|1|other")
+    assert bot.NAV_STACK.get(2, "my_ads")
+    assert bot.LISTING_CACHE.get(("fetch_ads", "general", 10, 0)) is None
+    assert bot.LISTING_CACHE.get(("fetch_ads_by_city", 12, "other", 10, 0)) == []
+
+
+def test_ad_write_drops_only_its_cards():
+    card = {'id': 7, 'category': "other"}
+    bot.AD_CACHE.set((7, 2), card)
+    bot.AD_CACHE.set((8, 2), dict(card, id=8))
+    bot.AD_CACHE.set((8, 3), dict(card, id=8))
+    push(2, "show_ad_7|all_ads|1|other")
+    push(2, "show_ad_8|all_ads|1|other")
+
+    bot.invalidate_read_caches(ad_ids=[7], user_ids=[3])
+
+    assert bot.AD_CACHE.get((7, 2)) is None
+    assert bot.AD_CACHE.get((8, 3)) is None
+    assert bot.AD_CACHE.get((8, 2))
+    assert bot.NAV_STACK.get(2, "show_ad_7|all_ads|1|other") is None
+    assert bot.NAV_STACK.get(2, "show_ad_8|all_ads|1|other")
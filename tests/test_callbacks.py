@@ -0,0 +1,103 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+
+
+@pytest.mark.parametrize("data, prefix, expected", [
+    ("menu_all_ads_general", "all_ads", ("general", 1)),
+    ("all_ads_general_3", "all_ads", ("general", 3)),
+    ("menu_top_cities_search", "top_cities", ("search", 1)),
+    ("top_cities_other_12", "top_cities", ("other", 12)),
+    ("price_ads_general_2", "price_ads", ("general", 2)),
+])
+def test_parse_list_callback(data, prefix, expected):
+    assert bot.parse_list_callback(data, prefix) == expected
+
+
+@pytest.mark.parametrize("data, prefix", [
+    ("all_ads_general_", "all_ads"),
+    ("all_ads_general_x", "all_ads"),
+    ("all_ads__3", "all_ads"),
+    ("top_ads_general_3", "all_ads"),
+])
+def test_parse_list_callback_rejects(data, prefix):
+    assert bot.parse_list_callback(data, prefix) is None
+
+
+@pytest.mark.parametrize("args", [
+    (5, "all_ads", 2, "general"),
+    (123456, "top_ads", 1, "search"),
+    (7, "city_5", 3, "other"),
+])
+def test_deep_link_round_trip(args):
+    link = bot.encode_deep_link(*args)
+    assert "=" not in link and len(link) <= 64   # обмеження Telegram для параметра start
+    assert bot.decode_deep_link(link) == args
+
+
+@pytest.mark.parametrize("payload", ["zz", "", "c2hvd19hZF94", "bm9wZQ"])
+def test_decode_deep_link_rejects(payload):
+    with pytest.raises(ValueError):
+        bot.decode_deep_link(payload)
+
+
+def test_ad_caption_escapes_user_input():
+    ad = {"category": "general", "city": "Київ (центр)", "price": "1.500-2.000 грн",
+          "desc": "*терміново* [офіс]_", "author": {"bot_username": "Користувач_x1", "avg_rating": 4.5}}
+    caption = bot.ad_caption(9, ad)
+    assert "Київ \\(центр\\)" in caption
+    assert "1\\.500\\-2\\.000 грн" in caption
+    assert "\\*терміново\\* \\[офіс\\]\\_" in caption
+    assert "Користувач\\_x1" in caption
+    assert "4\\.50" in caption
+
+
+def test_paginate_keyboard_window():
+    items = [{"id": i} for i in range(1, 101)]
+    kb = bot.paginate_keyboard(items, 7, 8, 5, lambda a: str(a["id"]), lambda a: f"show_ad_{a['id']}", "all_ads_general")
+    rows = kb.inline_keyboard
+    assert [b.callback_data for (b,) in rows[:-1]] == [f"show_ad_{i}" for i in range(49, 57)]
+    assert [b.text for b in rows[-1]] == ["5", "6", "[7]", "8", "9"]
+
+
+def test_paginate_keyboard_clamps_page_and_uses_total():
+    kb = bot.paginate_keyboard([{"id": 1}], 99, 8, 5, str, lambda a: "x", "p", total=20)
+    assert [b.text for b in kb.inline_keyboard[-1]] == ["1", "2", "[3]"]
+
+
+def fake_callback(data, chat_id=1, message_id=500):
+    async def answer():
+        pass
+    message = SimpleNamespace(chat_id=chat_id, message_id=message_id)
+    return SimpleNamespace(callback_query=SimpleNamespace(data=data, message=message, answer=answer))
+
+
+def test_debounced_keeps_route_of_pending_tap():
+    # натискання іншого маршруту на тому ж повідомленні під час рендеру
+    # має потрапити до свого обробника, а не до того, що зараз рендерить
+    calls = []
+    release = asyncio.Event()
+
+    async def list_handler(update, ctx):
+        calls.append(("list", update.callback_query.data))
+        if len(calls) == 1:
+            await release.wait()
+
+    async def card_handler(update, ctx):
+        calls.append(("card", update.callback_query.data))
+
+    list_route, card_route = bot.debounced(list_handler), bot.debounced(card_handler)
+
+    async def scenario():
+        first = asyncio.create_task(list_route(fake_callback("all_ads_general_2"), None))
+        await asyncio.sleep(0)
+        await card_route(fake_callback("show_ad_5|all_ads|2|general"), None)
+        release.set()
+        await first
+
+    asyncio.run(scenario())
+    assert calls == [("list", "all_ads_general_2"), ("card", "show_ad_5|all_ads|2|general")]
+    assert not bot._pending_renders and not bot._active_renders
@@ -0,0 +1,28 @@
+import pytest
+
+import bot
+
+
+@pytest.mark.parametrize("text, same_as", [
+    ("м. Київ", "Київ"),
+    ("  київ ", "Київ"),
+    ("КИЇВ", "Київ"),
+    ("Кривий-Ріг", "кривий ріг"),
+    ("місто  Львів", "Львів"),
+])
+def test_city_key_normalizes(text, same_as):
+    assert bot.city_key(text) == bot.city_key(same_as)
+
+
+def test_city_key_transliterates():
+    assert bot.city_key("Київ") == "kyiv"
+
+
+@pytest.mark.parametrize("text", ["", "   ", "м.", "!!!"])
+def test_city_key_empty(text):
+    assert bot.city_key(text) == ""
+
+
+def test_clean_city_name():
+    assert bot.clean_city_name("м. кривий  ріг") == "Кривий Ріг"
+    assert bot.clean_city_name("івано-франківськ") == "Івано-Франківськ"
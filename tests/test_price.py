@@ -0,0 +1,37 @@
+from decimal import Decimal
+
+import pytest
+
+import bot
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("2000 грн.", (2000, 2000, "UAH")),
+    ("2000грн", (2000, 2000, "UAH")),
+    ("2000-3000₴", (2000, 3000, "UAH")),
+    ("2000-3000грн", (2000, 3000, "UAH")),
+    ("від 1 500 до 2 000 грн", (1500, 2000, "UAH")),
+    ("100$", (100, 100, "USD")),
+    ("150 usd", (150, 150, "USD")),
+    ("99,50 €", (Decimal("99.50"), Decimal("99.50"), "EUR")),
+    ("2к", (2000, 2000, "UAH")),
+    ("3 тис. грн", (3000, 3000, "UAH")),
+    ("5k-7k", (5000, 7000, "UAH")),
+    ("1200 (торг)", (1200, 1200, "UAH")),
+])
+def test_parse_price(text, expected):
+    assert bot.parse_price(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", None, "договірна", "ціна за домовленістю"])
+def test_parse_price_without_number(text):
+    assert bot.parse_price(text) == (None, None, None)
+
+
+def test_parse_price_multiplier_needs_word_boundary():
+    # «к» на початку слова — не «тисяча»
+    assert bot.parse_price("500 купюрами") == (500, 500, "UAH")
+
+
+def test_parse_price_skips_out_of_range():
+    assert bot.parse_price("10000000000 грн") == (None, None, None)
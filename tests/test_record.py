@@ -0,0 +1,70 @@
+import pytest
+
+import bot
+
+USER, OTHER = 123456789, 42
+
+
+def callback(data: str) -> dict:
+    return {"update_id": 1, "callback_query": {
+        "id": "77", "chat_instance": "c", "data": data,
+        "from": {"id": USER, "is_bot": False, "first_name": "Іван", "last_name": "П", "username": "ivan"},
+        "message": {"message_id": 5, "date": 0, "chat": {"id": USER, "type": "private"}, "text": "x"},
+    }}
+
+
+def message(text: str) -> dict:
+    return {"update_id": 2, "message": {
+        "message_id": 6, "date": 0, "text": text,
+        "chat": {"id": USER, "type": "private"},
+        "from": {"id": USER, "is_bot": False, "first_name": "Іван", "phone_number": "+380"},
+    }}
+
+
+def test_ids_are_stable_and_personal_fields_removed():
+    first, second = bot.anonymize_update(callback("noop")), bot.anonymize_update(message("hi"))
+    user = first["callback_query"]["from"]
+    assert user == {"id": bot.anonymize_id(USER), "is_bot": False, "first_name": "Anon"}
+    assert second["message"]["from"]["id"] == user["id"] == second["message"]["chat"]["id"]
+    assert first["callback_query"]["id"] == "77"
+    assert first["callback_query"]["message"]["message_id"] == 5
+
+
+@pytest.mark.parametrize("data, expected", [
+    (f"review_ad_7_{OTHER}", f"review_ad_7_{bot.anonymize_id(OTHER)}"),
+    (f"menu_user_{OTHER}_show_ad", f"menu_user_{bot.anonymize_id(OTHER)}_show_ad"),
+    (f"unsub_user_{OTHER}_my_subs", f"unsub_user_{bot.anonymize_id(OTHER)}_my_subs"),
+    (f"reviews_about_user_{OTHER}_general_2", f"reviews_about_user_{bot.anonymize_id(OTHER)}_general_2"),
+    (f"show_review_9|reviews_about_user_{OTHER}|general|1",
+     f"show_review_9|reviews_about_user_{bot.anonymize_id(OTHER)}|general|1"),
+    # id оголошень будь-якої довжини без UPDATE_RECORD_REMAP_ADS не змінюються
+    ("apply_1234567", "apply_1234567"),
+    ("show_ad_1234567|all_ads|1|general", "show_ad_1234567|all_ads|1|general"),
+    ("all_ads_general_3", "all_ads_general_3"),
+])
+def test_callback_user_ids(data, expected):
+    assert bot.anonymize_update(callback(data))["callback_query"]["data"] == expected
+
+
+def test_callback_ad_ids_when_enabled(monkeypatch):
+    monkeypatch.setattr(bot, "UPDATE_RECORD_REMAP_ADS", True)
+    pseudo = bot.anonymize_ad_id(17)
+    assert bot.anonymize_update(callback("apply_17"))["callback_query"]["data"] == f"apply_{pseudo}"
+    assert (bot.anonymize_update(callback(f"review_ad_17_{OTHER}"))["callback_query"]["data"]
+            == f"review_ad_17_{bot.anonymize_id(OTHER)}")
+    assert pseudo < 2 ** 31
+
+
+def test_text_replaces_only_user_ids():
+    text = bot.anonymize_update(message(f"мій id {USER}, ціна 2000"))["message"]["text"]
+    assert text == f"мій id {bot.anonymize_id(USER)}, ціна 2000"
+
+
+def test_start_payload(monkeypatch):
+    link = bot.encode_deep_link(17, "all_ads", 2, "general")
+    assert bot.anonymize_update(message(f"/start {link}"))["message"]["text"] == f"/start {link}"
+
+    monkeypatch.setattr(bot, "UPDATE_RECORD_REMAP_ADS", True)
+    text = bot.anonymize_update(message(f"/start {link}"))["message"]["text"]
+    assert bot.decode_deep_link(text.split()[1]) == (bot.anonymize_ad_id(17), "all_ads", 2, "general")
+    assert bot.anonymize_update(message("/start garbage"))["message"]["text"] == "/start garbage"
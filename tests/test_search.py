@@ -0,0 +1,23 @@
+import pytest
+
+import bot
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("поліграф", "поліграф:*"),
+    ("Поліграф  КИЇВ", "поліграф:* & київ:*"),
+    ("перевірка, (терміново)!", "перевірка:* & терміново:*"),
+    ("snake_case", "snake:* & case:*"),
+    ("кривий-ріг", "кривий:* & ріг:*"),
+])
+def test_build_search_query(text, expected):
+    assert bot.build_search_query(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "   ", "!!! & |", "___"])
+def test_build_search_query_empty(text):
+    assert bot.build_search_query(text) is None
+
+
+def test_build_search_query_limits_words():
+    assert bot.build_search_query(" ".join(f"w{i}" for i in range(20))).count("&") == 7
@@ -0,0 +1,30 @@
+import pytest
+
+import bot
+
+PLAN = """\
+Limit  (cost=12.63..12.63 rows=1 width=12) (actual time=0.039..0.040 rows=0 loops=1)
+  ->  Index Scan using ads_pkey on ads a  (cost=0.29..8.31 rows=1 width=20) (actual time=0.014..0.015 rows=0 loops=1)
+        Index Cond: (id = 123456789)
+        Filter: ((description ~~* '%te''xt%'::text) AND (price_min <= 1500.50))
+        Rows Removed by Filter: 3
+        Buffers: shared hit=2
+Execution Time: 0.078 ms"""
+
+
+def test_scrub_plan_drops_literals():
+    scrubbed = bot.scrub_plan(PLAN)
+    for literal in ("123456789", "te''xt", "1500.50"):
+        assert literal not in scrubbed
+    assert "Index Cond: (id = ?)" in scrubbed
+    assert "Filter: ((description ~~* ?::text) AND (price_min <= ?))" in scrubbed
+
+
+@pytest.mark.parametrize("line", [
+    "Limit  (cost=12.63..12.63 rows=1 width=12) (actual time=0.039..0.040 rows=0 loops=1)",
+    "        Rows Removed by Filter: 3",
+    "        Buffers: shared hit=2",
+    "Execution Time: 0.078 ms",
+])
+def test_scrub_plan_keeps_statistics(line):
+    assert line in bot.scrub_plan(PLAN).splitlines()